@@ -21,21 +21,28 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'cloudinary_storage', # Cloudinary avant staticfiles
     'django.contrib.staticfiles',
-    'cloudinary',
+    # Ni 'cloudinary' ni 'cloudinary_storage' : leurs balises de template chargeraient le SDK (~130 ms)
+    # dans chaque worker au démarrage. Le stockage média (STORAGES['default']) n'en a pas besoin et
+    # charge le SDK à sa première utilisation. Pour `deleteorphanedmedia`, ajouter
+    # temporairement 'cloudinary_storage' ici.
     
     'shop',
     'user',
 ]
 
 MIDDLEWARE = [
+    'shop.edge.EdgeCacheMiddleware', # En premier : public / privé décidé une fois tous les cookies posés
+    'shop.metrics.MetricsMiddleware', # Mesures par vue (au plus tôt pour tout chronométrer)
+    'shop.query_budget.QueryBudgetMiddleware', # N+1 et budgets SQL par vue (dev / tests)
+    'shop.db_router.ReplicaRoutingMiddleware', # Lectures sur réplicas, read-your-writes
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Pour gérer le CSS sur Render
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.profiling.ProfilingMiddleware', # Profilage à la demande (staff) ou échantillonné
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,6 +78,54 @@ DATABASES = {
 if os.environ.get('DATABASE_URL'):
     DATABASES['default'] = dj_database_url.config(conn_max_age=600, ssl_require=False)
 
+# --- RÉPLICAS EN LECTURE (voir shop/db_router.py) ---
+# REPLICA_DATABASE_URLS="postgres://...,postgres://..." : catalogue et statistiques lus sur les réplicas
+SHOP_DB_REPLICAS = []
+for index, url in enumerate(u for u in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if u):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=600, ssl_require=False)
+    # En test, le réplica est la base de test primaire elle-même
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    SHOP_DB_REPLICAS.append(alias)
+
+# Développement / tests : deux fichiers SQLite jouent la primaire et le réplica
+# (TestCase.databases = '__all__' ; copier db.sqlite3 vers db_replica.sqlite3 simule la réplication)
+if os.environ.get('SQLITE_REPLICA') == 'True' and not SHOP_DB_REPLICAS:
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+    DATABASES['replica1'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db_replica.sqlite3'},
+    }
+    SHOP_DB_REPLICAS.append('replica1')
+
+DATABASE_ROUTERS = ['shop.db_router.PrimaryReplicaRouter']
+# Durée pendant laquelle un client qui vient d'écrire lit sur la primaire
+SHOP_DB_STICKY_SECONDS = int(os.environ.get('DB_STICKY_SECONDS', '10'))
+
+# --- CACHE PARTAGÉ ENTRE PROCESSUS ---
+# Versions et journaux des index en mémoire (promotions, livraison, suggestions, catalogue API),
+# historique des commandes, factures : chaque worker gunicorn doit voir les écritures des autres.
+# REDIS_URL : Redis (recommandé en production) ; sinon table `shop_cache` de la base principale
+# (créée par la migration 0018 ; ses requêtes ne comptent ni dans les budgets SQL ni pour le routage).
+SHOP_CACHE_TABLE = 'shop_cache'
+if os.environ.get('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL']}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': SHOP_CACHE_TABLE}}
+
+# --- TABLEAU DE BORD TEMPS RÉEL (shop/live.py) ---
+# Plusieurs workers (WEB_CONCURRENCY, 2 par défaut comme gunicorn.conf.py) : événements via le cache partagé.
+# InProcessBroker ne convient qu'à un worker unique ; LIVE_BROKER force un broker.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '2'))
+SHOP_LIVE_BROKER = os.environ.get('LIVE_BROKER') or (
+    'shop.live.SharedCacheBroker' if WEB_CONCURRENCY > 1 else 'shop.live.InProcessBroker'
+)
+
+# Recherche trigramme (pg_trgm) pour la recherche de commandes : PostgreSQL uniquement
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -90,13 +145,16 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
-# Indispensable pour Render : Whitenoise s'occupe du CSS/JS
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
-
 # --- FICHIERS MEDIA (IMAGES PRODUITS) ---
 MEDIA_URL = '/media/'
-# DEFAULT_FILE_STORAGE connecte Django à Cloudinary
-DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+
+# STORAGES (DEFAULT_FILE_STORAGE / STATICFILES_STORAGE sont ignorés depuis Django 5.1)
+STORAGES = {
+    # Médias sur Cloudinary
+    'default': {'BACKEND': 'cloudinary_storage.storage.MediaCloudinaryStorage'},
+    # Indispensable pour Render : Whitenoise s'occupe du CSS/JS
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
 
 CLOUDINARY_STORAGE = {
     'CLOUD_NAME': 'dkdn7amuo',
@@ -120,3 +178,62 @@ DEFAULT_FROM_EMAIL = 'NexusShop <ton-email@gmail.com>'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# --- MÉTRIQUES (endpoint Prometheus /dashboard/metrics/) ---
+SHOP_METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+# Fraction des requêtes instrumentées finement (SQL, templates, cache)
+SHOP_METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1' if DEBUG else '0.1'))
+# Jeton pour le scraper Prometheus (en-tête "Authorization: Bearer <jeton>")
+SHOP_METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Répertoire où chaque worker dépose ses compteurs (lus par celui qui sert l'endpoint) ; défaut : /tmp/shop-metrics
+SHOP_METRICS_DIR = os.environ.get('METRICS_DIR')
+
+
+# --- DÉTECTION N+1 / BUDGETS SQL PAR VUE ---
+# 'warn' (journal), 'raise' (exception) ou vide (désactivé)
+SHOP_QUERY_CHECKS = os.environ.get('QUERY_CHECKS', 'warn' if DEBUG else '')
+# Nombre de répétitions d'une même requête à partir duquel on signale un N+1
+SHOP_QUERY_CHECKS_THRESHOLD = int(os.environ.get('QUERY_CHECKS_THRESHOLD', '3'))
+
+# --- VUES CATALOGUE ASYNC (accueil, liste, fiche produit) ---
+# False : vues synchrones (comparaison avec `manage.py bench_shop --asgi`)
+SHOP_ASYNC_CATALOG = os.environ.get('ASYNC_CATALOG', 'True') == 'True'
+
+# --- CACHE PARTAGÉ (CDN) DES PAGES VITRINE (voir shop/edge.py) ---
+# Durée de mise en cache partagé de l'accueil, de la liste et des fiches (s-maxage) ; 0 : pages personnalisées
+SHOP_EDGE_CACHE_SECONDS = int(os.environ.get('EDGE_CACHE_SECONDS', '60'))
+
+# --- DÉMARRAGE DES WORKERS (voir gunicorn.conf.py et `manage.py importprofile`) ---
+# Modules chargés au premier usage seulement : importprofile échoue s'ils sont importés au démarrage
+SHOP_LAZY_MODULES = ['weasyprint', 'cloudinary', 'PIL']
+# En mode preload, modules lourds à charger une fois dans le maître (partagés par fork), ex. ['weasyprint']
+SHOP_PRELOAD_MODULES = [m for m in os.environ.get('PRELOAD_MODULES', '').split(',') if m]
+# Objectif de démarrage à froid (django.setup + ASGI + URLconf + préchauffage), en millisecondes
+SHOP_COLD_START_TARGET_MS = int(os.environ.get('COLD_START_TARGET_MS', '500'))
+
+# --- PROMOTIONS (shop/pricing.py) ---
+# Délai max (secondes) avant qu'une règle modifiée soit vue par les autres processus (via le cache partagé)
+SHOP_PRICING_LOCAL_TTL = int(os.environ.get('PRICING_LOCAL_TTL', '5'))
+
+# --- LIVRAISON (shop/shipping.py) ---
+# Délai max (secondes) avant qu'un produit ou une zone modifiés soient vus par les autres processus
+SHOP_SHIPPING_LOCAL_TTL = int(os.environ.get('SHIPPING_LOCAL_TTL', '5'))
+
+# --- SUGGESTIONS DE RECHERCHE (shop/autocomplete.py) ---
+# Délai max (secondes) avant qu'un produit ou une catégorie modifiés soient suggérés par les autres processus
+SHOP_AUTOCOMPLETE_LOCAL_TTL = int(os.environ.get('AUTOCOMPLETE_LOCAL_TTL', '5'))
+
+# --- ARCHIVAGE DES COMMANDES (shop/order_archive.py, `manage.py archive_orders`) ---
+# Âge (jours) à partir duquel une commande livrée ou annulée quitte les tables actives
+SHOP_ORDER_ARCHIVE_DAYS = int(os.environ.get('ORDER_ARCHIVE_DAYS', '365'))
+
+# --- PANIERS (`manage.py purge_carts`) ---
+# Jours sans activité après lesquels un panier (vide ou abandonné) est supprimé
+SHOP_CART_RETENTION_DAYS = int(os.environ.get('CART_RETENTION_DAYS', '60'))
+
+# --- PROFILAGE DES REQUÊTES (shop/profiling.py, admin : /dashboard/profiles/) ---
+# Profile une requête sur N au hasard (0 : seulement à la demande du staff, ?_profile=1 ou X-Profile)
+SHOP_PROFILING_SAMPLE_EVERY = int(os.environ.get('PROFILING_SAMPLE_EVERY', '0'))
+# Traces conservées (les plus anciennes sont écrasées)
+SHOP_PROFILING_MAX_TRACES = int(os.environ.get('PROFILING_MAX_TRACES', '200'))
+# Répertoire des traces, local à la machine (défaut : répertoire temporaire du système)
+SHOP_PROFILING_DIR = os.environ.get('PROFILING_DIR')
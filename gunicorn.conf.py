@@ -0,0 +1,51 @@
+"""
+Configuration gunicorn (lue automatiquement depuis la racine du projet).
+
+GUNICORN_PRELOAD=True (défaut) : l'application est chargée et préchauffée
+une fois dans le maître (shop/warmup.py) puis les workers sont forkés et
+partagent cet état copy-on-write. Un worker redémarré (max_requests) est
+prêt en quelques millisecondes au lieu de refaire imports et compilation
+des templates. GUNICORN_PRELOAD=False : chaque worker charge et préchauffe
+sa propre copie (utile pour un rechargement de code sans redémarrer le
+maître).
+
+Mesure du démarrage à froid : `python manage.py importprofile`.
+"""
+import os
+import random
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+# Recyclage des workers (fuites mémoire) : bon marché grâce au preload
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    # Maître : l'application est déjà importée si preload_app
+    if preload_app:
+        from shop.warmup import warm
+        server.log.info("Préchauffage du maître : %.0f ms", warm(freeze=True))
+
+
+def pre_fork(server, worker):
+    # Aucune connexion ne doit être héritée du maître
+    if preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def post_fork(server, worker):
+    # Sinon tous les workers tirent la même séquence (choix du réplica, échantillonnage des métriques)
+    random.seed()
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        from shop.warmup import warm
+        worker.log.info("Préchauffage du worker : %.0f ms", warm())
+    # Index des suggestions de recherche : requêtes SQL, donc dans le worker et jamais dans le maître
+    from shop.warmup import warm_data
+    worker.log.info("Données en mémoire du worker : %.0f ms", warm_data())
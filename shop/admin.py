@@ -4,13 +4,20 @@ from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from .models import (
     Category, SubCategory, DeliveryZone, Color, 
-    Size, Capacity, Product, ProductImage, Review, Cart, CartItem, Order, OrderItem
+    Size, Capacity, Product, ProductImage, ProductVariant, PromotionRule, Review, Cart, CartItem, Order, OrderItem,
+    ArchivedOrder, ArchivedOrderItem,
 )
 from django.db.models import Sum, Count
 from django.db.models.functions import TruncDate
 import json
 from django.utils import timezone
 from django.db.models import F
+from django import forms
+from django.contrib import messages
+from .order_workflow import can_transition, sources_for, transition_orders
+from .order_lookup import lookup_orders
+from . import bestsellers, inventory
+from .db_router import replica_reads
 
 # --- INLINES ---
 
@@ -27,16 +34,21 @@ class ProductImageInline(admin.TabularInline):
                 return "Erreur URL"
         return "Pas d'image"
 
+class ProductVariantInline(admin.TabularInline):
+    model = ProductVariant
+    extra = 1
+    fields = ['color', 'size', 'capacity', 'stock', 'price_delta', 'sku']
+    readonly_fields = ['sku']
+
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
-    fields = ['product', 'color', 'size', 'capacity', 'quantity', 'get_unit_price', 'total_item_price_display']
+    fields = ['product', 'variant', 'quantity', 'get_unit_price', 'total_item_price_display']
     readonly_fields = ['get_unit_price', 'total_item_price_display']
 
     def get_unit_price(self, obj):
         if obj.product:
-            price = obj.product.prix_promotionnel if obj.product.est_en_promo else obj.product.prix
-            return f"{price} FCFA"
+            return f"{obj.unit_price} FCFA"
         return "-"
     get_unit_price.short_description = "P.U."
 
@@ -63,14 +75,14 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('categorie', 'etat', 'date_ajout', 'livraison_gratuite')
     search_fields = ('nom', 'marque', 'description_courte')
     prepopulated_fields = {'slug': ('nom',)}
-    inlines = [ProductImageInline]
+    inlines = [ProductImageInline, ProductVariantInline]
+    readonly_fields = ('quantite_stocks',)
     
     fieldsets = (
         ('Informations Générales', {'fields': ('nom', 'slug', 'categorie', 'subcategorie', 'etat', 'marque')}),
         ('Contenu & Médias', {'fields': ('description_courte', 'description_longue', 'caracteristiques', 'video_demo')}),
         ('Prix & Promotion', {'fields': (('prix', 'prix_promotionnel'), ('date_debut_promo', 'date_fin_promo'))}),
         ('Stock & Livraison', {'fields': (('quantite_stocks', 'seuil_stocks_bas'), 'zones_livraison', ('frais_livraison_fixe', 'livraison_gratuite'), ('delai_min', 'delai_max'))}),
-        ('Variantes', {'fields': ('colors', 'sizes', 'capacities'), 'classes': ('collapse',)}),
         ('Politique', {'fields': ('politique_retour', 'instructions_retour', 'garantie_produit')}),
     )
 
@@ -79,6 +91,12 @@ class ProductAdmin(admin.ModelAdmin):
     est_en_promo_icon.boolean = True
     est_en_promo_icon.short_description = "En Promo ?"
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Stock total = somme des SKU saisis dans l'inline
+        inventory.ensure_default_variant(form.instance)
+        inventory.sync_product_stock([form.instance.pk])
+
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ('user', 'items_count', 'total_price_display', 'updated_at')
@@ -92,22 +110,56 @@ class CartAdmin(admin.ModelAdmin):
         return f"{obj.total_price} FCFA"
     total_price_display.short_description = "Total"
 
+def _make_transition_action(status, label):
+    """Fabrique une action admin qui fait passer la sélection au statut donné"""
+    def action(modeladmin, request, queryset):
+        done, skipped = transition_orders(queryset, status)
+        modeladmin.message_user(request, f"{done} commande(s) passée(s) en « {label} ».", messages.SUCCESS)
+        if skipped:
+            modeladmin.message_user(
+                request, f"{skipped} commande(s) ignorée(s) : transition non autorisée.", messages.WARNING
+            )
+    action.__name__ = f"mark_{status.lower()}"
+    return admin.action(description=f"Passer en : {label}")(action)
+
+
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        current = self.instance.status if self.instance.pk else None
+        if current and status != current and not can_transition(current, status):
+            raise forms.ValidationError(
+                f"Transition impossible : {self.instance.get_status_display()} → {dict(Order.STATUS_CHOICES)[status]}."
+            )
+        return status
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ('reference', 'full_name', 'status_colored', 'total_amount_display', 'is_paid', 'print_invoice')
-    list_filter = ('status', 'is_paid', 'created_at', 'city')
+    list_filter = ('status', 'is_paid', 'created_at', 'zone', 'city')
     search_fields = ('reference', 'full_name', 'email', 'phone')
     readonly_fields = ('reference', 'user', 'total_amount', 'shipping_cost', 'created_at', 'updated_at', 'order_key')
     inlines = [OrderItemInline]
-    actions = ['make_paid']
+    # Pas d'action pour un statut qu'aucune transition n'atteint (En attente)
+    actions = [_make_transition_action(status, label) for status, label in Order.STATUS_CHOICES if sources_for(status)]
 
     fieldsets = (
         ('Informations Générales', {'fields': ('reference', 'user', 'status', 'is_paid')}),
-        ('Détails Client & Livraison', {'fields': ('full_name', 'email', 'phone', 'address', 'city')}),
+        ('Détails Client & Livraison', {'fields': ('full_name', 'email', 'phone', 'address', 'city', 'zone', ('delai_min', 'delai_max'))}),
         ('Calcul Financier', {'fields': ('total_amount', 'shipping_cost', 'order_key')}),
         ('Dates', {'fields': ('created_at', 'updated_at'), 'classes': ('collapse',)}),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Recherche indexée (référence / e-mail / téléphone / nom) au lieu de 4 icontains
+        return lookup_orders(search_term, queryset), False
+
     def total_amount_display(self, obj):
         return f"{obj.total_amount} FCFA"
     total_amount_display.short_description = "Montant Total"
@@ -117,9 +169,15 @@ class OrderAdmin(admin.ModelAdmin):
         return mark_safe(f'<b style="color:{colors.get(obj.status, "black")};">{obj.get_status_display()}</b>')
     status_colored.short_description = "Statut"
 
-    @admin.action(description="Marquer comme Payées")
-    def make_paid(self, request, queryset):
-        queryset.update(is_paid=True, status='PAID')
+    def save_model(self, request, obj, form, change):
+        # Un changement de statut passe par la machine à états (effets de bord inclus)
+        if change and 'status' in form.changed_data:
+            target, obj.status = obj.status, form.initial['status']
+            super().save_model(request, obj, form, change)
+            transition_orders(Order.objects.filter(pk=obj.pk), target)
+            obj.refresh_from_db()
+        else:
+            super().save_model(request, obj, form, change)
 
     def print_invoice(self, obj):
         if obj.id:
@@ -139,6 +197,43 @@ class OrderAdmin(admin.ModelAdmin):
         return ""
     print_invoice.short_description = "Action"
 
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    fields = ('product', 'price', 'quantity', 'color', 'size', 'capacity')
+    readonly_fields = fields
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Commandes archivées (shop/order_archive.py) : consultation seule"""
+    list_display = ('reference', 'full_name', 'status', 'total_amount', 'is_paid', 'created_at', 'archived_at', 'print_invoice')
+    list_filter = ('status', 'is_paid', 'created_at')
+    search_fields = ('=reference', '=email', '=phone_normalized', 'full_name')
+    date_hierarchy = 'created_at'
+    show_full_result_count = False
+    inlines = [ArchivedOrderItemInline]
+
+    fieldsets = OrderAdmin.fieldsets + (
+        ('Archivage', {'fields': ('archived_at',)}),
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def print_invoice(self, obj):
+        return format_html('<a href="{}" target="_blank">🖨️ Facture</a>', reverse('order_invoice_admin', args=[obj.id]))
+    print_invoice.short_description = "Action"
+
 # --- AUTRES ENREGISTREMENTS ---
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -154,8 +249,32 @@ class ReviewAdmin(admin.ModelAdmin):
     list_display = ('product', 'user', 'rating', 'created_at')
     readonly_fields = ('created_at',)
 
+@admin.register(PromotionRule)
+class PromotionRuleAdmin(admin.ModelAdmin):
+    list_display = ('nom', 'type_remise', 'valeur', 'perimetre', 'date_debut', 'date_fin', 'priorite', 'actif')
+    list_filter = ('actif', 'type_remise', 'categorie')
+    list_editable = ('priorite', 'actif')
+    search_fields = ('nom', 'marque')
+    raw_id_fields = ('product',)
+    fieldsets = (
+        ('Remise', {'fields': ('nom', ('type_remise', 'valeur'), 'priorite', 'actif')}),
+        ('Périmètre (vide : tout le catalogue)', {'fields': ('categorie', 'subcategorie', 'marque', 'product')}),
+        ('Période', {'fields': (('date_debut', 'date_fin'),)}),
+    )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('categorie', 'subcategorie', 'product')
+
+    def perimetre(self, obj):
+        parts = [str(part) for part in (obj.categorie, obj.subcategorie, obj.marque, obj.product) if part]
+        return ' · '.join(parts) or "Tout le catalogue"
+    perimetre.short_description = "Périmètre"
+
 admin.site.register(SubCategory)
-admin.site.register(DeliveryZone)
+@admin.register(DeliveryZone)
+class DeliveryZoneAdmin(admin.ModelAdmin):
+    list_display = ('name', 'frais_base', 'delai_supplementaire')
+    search_fields = ('name', 'villes')
 admin.site.register(Color)
 admin.site.register(Size)
 admin.site.register(Capacity)
@@ -170,6 +289,12 @@ original_admin_index = admin.site.index
 # 2. DÉFINITION DE LA VUE PERSONNALISÉE
 # ==========================================
 def custom_admin_index(request, extra_context=None):
+    # Statistiques en lecture seule : sur un réplica. La TemplateResponse est rendue dans le
+    # bloc, les querysets paresseux du contexte étant évalués au rendu.
+    with replica_reads():
+        return _admin_index(request, extra_context).render()
+
+def _admin_index(request, extra_context=None):
     extra_context = extra_context or {}
     now = timezone.now()
 
@@ -197,9 +322,8 @@ def custom_admin_index(request, extra_context=None):
     sales_data = Order.objects.filter(is_paid=True).annotate(date=TruncDate('created_at')) \
         .values('date').annotate(total=Sum('total_amount')).order_by('date')[:7]
 
-    # Top 5 des produits les plus vendus
-    top_products = OrderItem.objects.values('product__nom') \
-        .annotate(total_qty=Sum('quantity')).order_by('-total_qty')[:5]
+    # Top 5 des produits les plus vendus (compteurs maintenus au checkout)
+    top_products = bestsellers.top_products(5, 'total')
 
     # --- C. INJECTION DANS LE CONTEXTE ---
     # Données Widgets
@@ -210,8 +334,8 @@ def custom_admin_index(request, extra_context=None):
     # Données Graphiques (formatées en JSON pour JavaScript)
     extra_context['sales_labels'] = json.dumps([str(x['date']) for x in sales_data])
     extra_context['sales_values'] = json.dumps([float(x['total']) for x in sales_data])
-    extra_context['top_prod_labels'] = json.dumps([x['product__nom'] for x in top_products])
-    extra_context['top_prod_values'] = json.dumps([int(x['total_qty']) for x in top_products])
+    extra_context['top_prod_labels'] = json.dumps([p.nom for p in top_products])
+    extra_context['top_prod_values'] = json.dumps([p.ventes_total for p in top_products])
     
     stock_alert_products = Product.objects.filter(
         quantite_stocks__lte=F('seuil_stocks_bas')
@@ -222,6 +346,7 @@ def custom_admin_index(request, extra_context=None):
     # Injection dans le contexte
     extra_context['nb_stock_alerts'] = nb_stock_alerts
     extra_context['stock_alert_products'] = stock_alert_products
+    extra_context['stock_alert_ids'] = [p.id for p in stock_alert_products]
     
     return original_admin_index(request, extra_context)
 
@@ -0,0 +1,300 @@
+"""
+API JSON du catalogue, en lecture seule (application mobile, comparateurs).
+
+- /api/categories/ : catégories et nombre de produits ;
+- /api/products/ : mêmes filtres et tris que la liste HTML (search, category,
+  min_price, max_price, sort), paginée par ?page= et ?page_size= ;
+- /api/products/<slug>/ : fiche complète avec variantes et images.
+
+?fields=nom,prix_final,... limite les champs renvoyés. Les lignes viennent
+de values_list() et sont sérialisées telles quelles (aucun objet modèle).
+
+Requêtes conditionnelles : ETag fort et Last-Modified calculés avant toute
+lecture lourde, à partir de Product.date_modification (stock et avis
+compris, voir shop/inventory.py et shop/reviews.py), de la version du
+catalogue (catégories, images, variantes, produits ajoutés ou supprimés :
+voir shop/signals.py) et de l'index des promotions. La version et l'index
+des promotions viennent du cache partagé et le jeton des promotions est tiré
+de leur contenu : tous les workers calculent le même ETag pour une même
+ressource. Une ressource inchangée répond 304 en une requête, sans sérialisation.
+"""
+import hashlib
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Sum
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+
+from . import pricing
+from .models import Category, Product, ProductImage, ProductVariant
+from .query_budget import query_budget
+
+VERSION_CACHE_KEY = 'shop:catalog:version'
+PAGE_SIZE = 12
+MAX_PAGE_SIZE = 48
+
+# Champ exposé -> chemin values()
+LIST_FIELDS = {
+    'id': 'id',
+    'slug': 'slug',
+    'nom': 'nom',
+    'marque': 'marque',
+    'categorie': 'categorie__slug',
+    'etat': 'etat',
+    'description_courte': 'description_courte',
+    'prix': 'prix',
+    'stock': 'quantite_stocks',
+    'note': 'note_moyenne',
+    'avis': 'avis_total',
+    'date_modification': 'date_modification',
+}
+DETAIL_FIELDS = {
+    **LIST_FIELDS,
+    'description_longue': 'description_longue',
+    'caracteristiques': 'caracteristiques',
+    'fiche_technique': 'fiche_technique',
+    'livraison_gratuite': 'livraison_gratuite',
+    'frais_livraison': 'frais_livraison_fixe',
+    'delai_min': 'delai_min',
+    'delai_max': 'delai_max',
+    'politique_retour': 'politique_retour',
+    'garantie': 'garantie_produit',
+}
+# Champs calculés : prix (moteur de promotions), liens, images, variantes
+PRICE_FIELDS = {'prix_final', 'en_promo', 'fin_promo', 'variantes'}
+LIST_COMPUTED = {'prix_final', 'en_promo', 'fin_promo', 'url', 'image'}
+DETAIL_COMPUTED = LIST_COMPUTED | {'images', 'variantes'}
+
+# Compteur de tri qui évolue sans toucher date_modification (ventes) : entre dans l'ETag
+SORT_COUNTERS = {'popular': 'ventes_30j'}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def catalog_version():
+    """Horodatage de la dernière modification hors produit (catégories, images, variantes...), commun aux workers"""
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, time.time(), None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def invalidate():
+    cache.set(VERSION_CACHE_KEY, time.time(), None)
+
+
+def _validators(request, *parts, modified=None):
+    """(ETag, Last-Modified) : version du catalogue, index des promotions, URL demandée et parties propres"""
+    version = catalog_version()
+    rules = pricing.current_rules()
+    raw = '|'.join(str(part) for part in (version, rules.token, request.get_full_path(), *parts))
+    last_modified = max(
+        filter(None, [modified, rules.compiled_at, datetime.fromtimestamp(version, dt_timezone.utc)])
+    )
+    return hashlib.sha1(raw.encode()).hexdigest(), last_modified
+
+
+def _selected(request, available, computed):
+    """Champs demandés par ?fields= (tous par défaut) ; BadRequest si un nom est inconnu"""
+    fields = [name for name in request.GET.get('fields', '').split(',') if name]
+    unknown = set(fields) - set(available) - computed
+    if unknown:
+        raise BadRequest(f"Champs inconnus : {', '.join(sorted(unknown))}")
+    return fields or [*available, *sorted(computed)]
+
+
+def _image_url(name, derivatives):
+    """Plus grand JPEG dérivé, sinon l'original (comme ResponsiveImage.src)"""
+    jpeg = (derivatives or {}).get('jpeg')
+    return jpeg[-1]['url'] if jpeg else default_storage.url(name)
+
+
+def _images(product_ids):
+    images = defaultdict(list)
+    for product_id, name, derivatives in ProductImage.objects.filter(
+        product_id__in=product_ids
+    ).order_by('id').values_list('product_id', 'image', 'derivatives'):
+        images[product_id].append(_image_url(name, derivatives))
+    return images
+
+
+def _serialize(rows, fields, available):
+    """Lignes lues (dicts colonne -> valeur) -> dicts des champs demandés, prix résolus en une passe"""
+    if PRICE_FIELDS.intersection(fields):
+        pricing.apply_rows(rows)
+    images = _images([row['id'] for row in rows]) if {'image', 'images'}.intersection(fields) else {}
+    results = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            if name in available:
+                item[name] = row[available[name]]
+            elif name == 'prix_final':
+                item[name] = row['tarif'].price
+            elif name == 'en_promo':
+                item[name] = row['tarif'].price < row['prix']
+            elif name == 'fin_promo':
+                item[name] = row['tarif'].ends_at
+            elif name == 'url':
+                item[name] = reverse('api_product_detail', args=[row['slug']])
+            elif name == 'image':
+                item[name] = next(iter(images.get(row['id'], [])), None)
+            elif name == 'images':
+                item[name] = images.get(row['id'], [])
+            elif name == 'variantes':
+                item[name] = _variants(row['id'], row['tarif'].price)
+        results.append(item)
+    return results
+
+
+def _variants(product_id, price):
+    return [
+        {'id': pk, 'sku': sku, 'couleur': color, 'taille': size, 'capacite': capacity,
+         'stock': stock, 'prix': price + delta}
+        for pk, sku, color, size, capacity, stock, delta in ProductVariant.objects.filter(
+            product_id=product_id
+        ).order_by('id').values_list('id', 'sku', 'color__name', 'size__name', 'capacity__name', 'stock', 'price_delta')
+    ]
+
+
+def _read(queryset, fields, available):
+    """values_list() des seules colonnes utiles, en dicts"""
+    columns = _columns(fields, available)
+    return [dict(zip(columns, row)) for row in queryset.values_list(*columns)]
+
+
+def _columns(fields, available):
+    """Colonnes à lire : champs demandés + ce qu'il faut pour les champs calculés"""
+    columns = ['id', 'slug', *(available[name] for name in fields if name in available)]
+    if PRICE_FIELDS.intersection(fields):
+        columns += pricing.PRICED_FIELDS
+    return list(dict.fromkeys(columns))
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(state):
+    """
+    Vue API conditionnelle : state(request, **kwargs) calcule une fois par
+    requête les validateurs (et ce qu'il faut pour répondre) ; 304 avant la vue.
+    """
+    def memo(request, **kwargs):
+        if not hasattr(request, '_api_state'):
+            request._api_state = state(request, **kwargs)
+        return request._api_state
+
+    def decorator(view):
+        conditional = condition(
+            etag_func=lambda request, **kwargs: memo(request, **kwargs)['etag'],
+            last_modified_func=lambda request, **kwargs: memo(request, **kwargs)['last_modified'],
+        )(view)
+
+        @wraps(view)
+        def wrapped(request, **kwargs):
+            try:
+                response = conditional(request, **kwargs)
+            except BadRequest as error:
+                response = _json({'error': str(error)}, status=400)
+            except Http404 as error:
+                response = _json({'error': str(error)}, status=404)
+            # Stockable par les caches partagés, revalidé à chaque fois (304 si inchangé)
+            patch_cache_control(response, public=True, no_cache=True)
+            return response
+        return require_safe(wrapped)
+    return decorator
+
+
+# --- Catégories ---
+
+def _categories_state(request):
+    etag, last_modified = _validators(request)
+    return {'etag': etag, 'last_modified': last_modified}
+
+
+@query_budget(2)
+@api_view(_categories_state)
+def categories(request):
+    """Catégories avec leur nombre de produits"""
+    rows = Category.objects.annotate(nb_produits=Count('products')).order_by('name').values_list(
+        'id', 'slug', 'name', 'nb_produits'
+    )
+    return _json({'results': [
+        {'id': pk, 'slug': slug, 'nom': name, 'nb_produits': count} for pk, slug, name, count in rows
+    ]})
+
+
+# --- Liste ---
+
+def _list_state(request):
+    from .views import filter_products
+
+    fields = _selected(request, LIST_FIELDS, LIST_COMPUTED)
+    queryset = filter_products(request.GET).select_related(None).prefetch_related(None)
+    summary = {'count': Count('id'), 'modified': Max('date_modification')}
+    counter = SORT_COUNTERS.get(request.GET.get('sort'))
+    if counter:
+        summary['counter'] = Sum(counter)
+    # Une seule requête : nombre de produits (pagination) et validateurs
+    totals = queryset.order_by().aggregate(**summary)
+    etag, last_modified = _validators(
+        request, totals['count'], totals['modified'], totals.get('counter'), modified=totals['modified']
+    )
+    return {'etag': etag, 'last_modified': last_modified, 'fields': fields, 'queryset': queryset, **totals}
+
+
+@query_budget(4)
+@api_view(_list_state)
+def products(request):
+    """Page de produits filtrée et triée comme la liste HTML"""
+    state = request._api_state
+    try:
+        page_size = min(max(int(request.GET.get('page_size', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        raise BadRequest("page et page_size doivent être des entiers")
+    pages = max(math.ceil(state['count'] / page_size), 1)
+    start = (page - 1) * page_size
+
+    rows = _read(state['queryset'][start:start + page_size], state['fields'], LIST_FIELDS) if page <= pages else []
+    return _json({
+        'count': state['count'],
+        'page': page,
+        'pages': pages,
+        'next': page + 1 if page < pages else None,
+        'previous': page - 1 if page > 1 else None,
+        'results': _serialize(rows, state['fields'], LIST_FIELDS),
+    })
+
+
+# --- Fiche produit ---
+
+def _detail_state(request, slug):
+    fields = _selected(request, DETAIL_FIELDS, DETAIL_COMPUTED)
+    found = Product.objects.filter(slug=slug).values_list('id', 'date_modification').first()
+    if found is None:
+        raise Http404("Produit introuvable.")
+    etag, last_modified = _validators(request, *found, modified=found[1])
+    return {'etag': etag, 'last_modified': last_modified, 'fields': fields, 'id': found[0]}
+
+
+@query_budget(5)
+@api_view(_detail_state)
+def product_detail(request, slug):
+    """Fiche produit complète : champs, prix résolu, images et variantes (SKU)"""
+    state = request._api_state
+    rows = _read(Product.objects.filter(id=state['id']), state['fields'], DETAIL_FIELDS)
+    return _json(_serialize(rows, state['fields'], DETAIL_FIELDS)[0])
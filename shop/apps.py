@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _install_sqlite_fts(sender, using, **kwargs):
+    from .order_lookup import ensure_sqlite_fts
+    ensure_sqlite_fts(using)
 
 
 class ShopConfig(AppConfig):
     name = 'shop'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import db_router, metrics, profiling, query_budget
+        metrics.install()
+        query_budget.install()
+        profiling.install()
+        db_router.install()
+        post_migrate.connect(_install_sqlite_fts, sender=self)
@@ -0,0 +1,125 @@
+"""
+Versions async des vues catalogue (accueil, liste, fiche produit).
+
+Servies par config/asgi.py (worker uvicorn, voir Procfile) : un client
+lent ne bloque plus un worker entier. Le gain s'arrête là : l'ORM async
+exécute chaque requête dans l'unique thread de sync_to_async
+(thread_sensitive), un asyncio.gather de querysets resterait séquentiel.
+Les lectures d'une page sont donc faites en un seul bloc sync_to_async,
+un aller-retour vers ce thread au lieu d'un par requête ; le rendu du
+template (context processors, session, request.user) passe de même par
+sync_to_async.
+
+SHOP_ASYNC_CATALOG = False revient aux vues synchrones de shop/views.py
+(comparaison avec `manage.py bench_shop --asgi`).
+"""
+from asgiref.sync import sync_to_async
+from django.core.paginator import Page, Paginator
+from django.db.models import Count
+from django.http import Http404
+from django.shortcuts import render
+from django.views import View
+
+from . import bestsellers, pricing, views
+from .forms import ReviewForm
+from .models import Category, Product
+from .query_budget import query_budget
+
+arender = sync_to_async(render)
+
+
+# Lectures groupées par page, prix promotionnels compris (compilation des règles : requête)
+@sync_to_async
+def _home_data():
+    products = list(views.catalog_products().order_by('-date_ajout')[:8])
+    categories = list(Category.objects.all())
+    best_sellers = list(bestsellers.top_products(4, '30j', queryset=views.catalog_products()))
+    pricing.apply(products + best_sellers)
+    return products, categories, best_sellers
+
+
+@sync_to_async
+def _page_data(queryset, offset, limit):
+    total = queryset.count()
+    products = list(queryset[offset:offset + limit])
+    categories = list(Category.objects.annotate(nb_products=Count('products')))
+    pricing.apply(products)
+    return total, products, categories
+
+
+@sync_to_async
+def _detail_data(slug):
+    product = views.PRODUCT_DETAIL.get(slug=slug)
+    similar = list(views.similar_products(product))
+    pricing.apply([product, *similar])
+    return product, similar
+
+
+@query_budget(11)
+async def home(request):
+    products, categories, best_sellers = await _home_data()
+    return await arender(request, 'core/Home.html', {
+        'products': products,
+        'categories': categories,
+        'best_sellers': best_sellers,
+    })
+
+
+class ProductListView(View):
+    template_name = 'core/Product_Listing.html'
+    paginate_by = 12
+    query_budget = 12
+
+    async def get(self, request, *args, **kwargs):
+        queryset = views.filter_products(request.GET)
+        paginator = Paginator(queryset, self.paginate_by)
+
+        page_param = request.GET.get('page') or 1
+        try:
+            if page_param == 'last':
+                paginator.count = await queryset.acount()
+                number = paginator.num_pages
+            else:
+                number = int(page_param)
+            if number < 1:
+                raise ValueError
+        except ValueError:
+            raise Http404("Page invalide.")
+
+        total, products, categories = await _page_data(queryset, (number - 1) * self.paginate_by, self.paginate_by)
+        paginator.count = total
+        if number > 1 and not products:
+            raise Http404("Page invalide.")
+        page = Page(products, number, paginator)
+
+        return await arender(request, self.template_name, {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': paginator.num_pages > 1,
+            'object_list': products,
+            'products': products,
+            'categories': categories,
+        })
+
+
+class ProductDetailView(View):
+    template_name = 'core/Single_Product.html'
+    query_budget = 13
+
+    async def get(self, request, slug, *args, **kwargs):
+        try:
+            product, similar = await _detail_data(slug)
+        except Product.DoesNotExist:
+            raise Http404("Produit introuvable.")
+        return await arender(request, self.template_name, {
+            'product': product,
+            'object': product,
+            'images': product.images.all(),
+            'similar_products': similar,
+            'review_form': ReviewForm(),
+            **views.variant_context(product),
+        })
+
+    async def post(self, request, *args, **kwargs):
+        # Dépôt d'avis (rare) : messages et session sont synchrones, on réutilise la vue classique
+        return await sync_to_async(views.ProductDetailView.as_view())(request, *args, **kwargs)
@@ -0,0 +1,256 @@
+"""
+Suggestions de la barre de recherche (type-ahead), sans requête SQL.
+
+Chaque processus garde en mémoire un index de préfixes sur les noms de
+produits, les marques et les catégories : une liste triée de clés
+« mot normalisé ... \\0 référence », parcourue par bisect. Une clé par mot
+du libellé, si bien que « gal » trouve « Samsung Galaxy S24 » ; les autres
+mots de la saisie doivent commencer un mot du libellé (« sam s2 »).
+Normalisation française : minuscules, sans accents, « œ » -> « oe ».
+
+L'index est construit au démarrage du worker (gunicorn.conf.py) ou à la
+première suggestion (2 requêtes), puis tenu à jour par morceaux : les
+signaux Product / Category inscrivent chaque modification dans un journal
+numéroté du cache partagé entre les workers (settings.CACHES), que chaque
+processus rejoue au plus toutes les
+SHOP_AUTOCOMPLETE_LOCAL_TTL secondes (une requête par type modifié). Un
+processus trop en retard sur le journal, ou un invalidate() (imports en
+masse), reconstruit tout.
+"""
+import bisect
+import heapq
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .models import Category, Product
+
+SEQUENCE_CACHE_KEY = 'shop:autocomplete:seq'
+CHANGE_CACHE_KEY = 'shop:autocomplete:change:{}'
+CHANGE_CACHE_TIMEOUT = 60 * 60 * 24
+# Au-delà, rejouer le journal coûterait plus qu'une reconstruction
+MAX_REPLAY = 500
+
+MIN_LENGTH = 2
+LIMIT = 8
+# Préfixe couvrant plus de clés que cela (« sa ») : candidats classés mémorisés jusqu'à la prochaine modification
+MEMO_THRESHOLD = 200
+MEMO_SIZE = 2000
+
+# Ordre d'affichage : catégories (alphabétique), marques (nombre de produits), puis produits les plus vendus
+KIND_ORDER = {'c': 0, 'm': 1, 'p': 2}
+KIND_LABELS = {'c': 'categorie', 'm': 'marque', 'p': 'produit'}
+
+_LIGATURES = str.maketrans({'œ': 'oe', 'Œ': 'OE', 'æ': 'ae', 'Æ': 'AE'})
+
+
+def normalize(value):
+    """« Télévisions Œuvre » -> « televisions oeuvre »"""
+    value = unicodedata.normalize('NFKD', (value or '').translate(_LIGATURES)).encode('ascii', 'ignore').decode()
+    return ' '.join(re.split(r'[\W_]+', value.lower())).strip()
+
+
+class PrefixIndex:
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.keys = []
+        # référence -> (rang, libellé, slug) ; références : 'p12', 'c3', 'mSamsung'
+        self.entries = {}
+        self.product_brands = {}
+        self.brand_counts = Counter()
+        self._memo = {}
+
+        products = Product.objects.values_list('id', 'nom', 'slug', 'marque', 'ventes_total').order_by()
+        for pk, name, slug, brand, sold in products:
+            self._add(f'p{pk}', name, slug, sold)
+            brand = (brand or '').strip()
+            if brand:
+                self.product_brands[pk] = brand
+                self.brand_counts[brand] += 1
+        for brand, total in self.brand_counts.items():
+            self._add(f'm{brand}', brand, None, total)
+        for pk, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+            self._add(f'c{pk}', name, slug, 0)
+        self.keys.sort()
+
+    # --- Écriture ---
+
+    @staticmethod
+    def _keys(ref, label):
+        words = normalize(label).split()
+        # Une clé par mot, suivie de la fin du libellé : « galaxy s24\0p12 », « s24\0p12 »
+        return {' '.join(words[i:]) + '\0' + ref for i in range(len(words))}
+
+    def _add(self, ref, label, slug, score, insort=False):
+        self.entries[ref] = ((KIND_ORDER[ref[0]], -(score or 0), label), label, slug)
+        for key in self._keys(ref, label):
+            if insort:
+                bisect.insort(self.keys, key)
+            else:
+                self.keys.append(key)
+
+    def _remove(self, ref):
+        entry = self.entries.pop(ref, None)
+        if entry is None:
+            return
+        for key in self._keys(ref, entry[1]):
+            position = bisect.bisect_left(self.keys, key)
+            if position < len(self.keys) and self.keys[position] == key:
+                del self.keys[position]
+
+    def _count_brand(self, product_id, brand):
+        brand = (brand or '').strip()
+        previous = self.product_brands.pop(product_id, None)
+        if previous:
+            self.brand_counts[previous] -= 1
+        if brand:
+            self.product_brands[product_id] = brand
+            self.brand_counts[brand] += 1
+        # Entrée de marque réécrite avec son nombre de produits (score), retirée à zéro
+        for name in {previous, brand} - {None, ''}:
+            self._remove(f'm{name}')
+            if self.brand_counts[name] > 0:
+                self._add(f'm{name}', name, None, self.brand_counts[name], insort=True)
+            else:
+                del self.brand_counts[name]
+
+    def refresh(self, product_ids=(), category_ids=()):
+        """Relit ces produits / catégories (supprimés compris) et met l'index à jour sur place"""
+        self._memo.clear()
+        if product_ids:
+            found = {
+                pk: row for pk, *row in Product.objects.filter(id__in=product_ids).values_list(
+                    'id', 'nom', 'slug', 'marque', 'ventes_total'
+                )
+            }
+            for pk in product_ids:
+                self._remove(f'p{pk}')
+                name, slug, brand, sold = found.get(pk, (None, None, None, None))
+                if name is not None:
+                    self._add(f'p{pk}', name, slug, sold, insort=True)
+                self._count_brand(pk, brand)
+        if category_ids:
+            found = {
+                pk: row for pk, *row in Category.objects.filter(id__in=category_ids).values_list('id', 'name', 'slug')
+            }
+            for pk in category_ids:
+                self._remove(f'c{pk}')
+                if pk in found:
+                    self._add(f'c{pk}', *found[pk], 0, insort=True)
+
+    # --- Lecture ---
+
+    def _range(self, word):
+        """Positions des clés commençant par `word` (clés en ASCII : toutes avant `word` + DEL)"""
+        low = bisect.bisect_left(self.keys, word)
+        return low, bisect.bisect_left(self.keys, word + '\x7f', low)
+
+    def _candidates(self, word, low, high):
+        """(références classées, ensemble) dont un mot commence par `word`"""
+        found = self._memo.get(word)
+        if found is None:
+            refs = {key.rpartition('\0')[2] for key in self.keys[low:high]}
+            found = sorted(refs, key=lambda ref: self.entries[ref][0]), refs
+            if high - low > MEMO_THRESHOLD:
+                if len(self._memo) >= MEMO_SIZE:
+                    self._memo.clear()
+                self._memo[word] = found
+        return found
+
+    def search(self, query, limit=LIMIT):
+        words = normalize(query).split()
+        if not words or len(' '.join(words)) < MIN_LENGTH:
+            return []
+        # Mot le plus sélectif d'abord : ses candidats classés sont filtrés par ceux des autres mots
+        spans = sorted(((*self._range(word), word) for word in set(words)), key=lambda span: span[1] - span[0])
+        (low, high, word), *rest = spans
+        if low == high:
+            return []
+        ranked, refs = self._candidates(word, low, high)
+        if rest:
+            # Intersection en C, puis seulement les mieux classées des références restantes
+            refs = refs.intersection(*(self._candidates(other, start, end)[1] for start, end, other in rest))
+            ranked = heapq.nsmallest(limit, refs, key=lambda ref: self.entries[ref][0])
+        return [(ref[0], *self.entries[ref][1:]) for ref in ranked[:limit]]
+
+
+def _url(kind, label, slug):
+    if kind == 'p':
+        return reverse('product_detail', args=[slug])
+    params = {'category': slug} if kind == 'c' else {'search': label}
+    return f"{reverse('product_list')}?{urlencode(params)}"
+
+
+# --- Synchronisation entre processus ---
+
+class _Local:
+    index = None
+    checked = 0.0
+
+
+_local = _Local()
+
+
+def _sequence():
+    cache.add(SEQUENCE_CACHE_KEY, 0, None)
+    return cache.get(SEQUENCE_CACHE_KEY) or 0
+
+
+def current_index():
+    """Index à jour pour ce processus (aucune requête tant que rien n'a changé)"""
+    index = _local.index
+    local_ttl = getattr(settings, 'SHOP_AUTOCOMPLETE_LOCAL_TTL', 5)
+    if index is not None and time.monotonic() < _local.checked + local_ttl:
+        return index
+    sequence = _sequence()
+    if index is None or sequence - index.sequence > MAX_REPLAY or sequence < index.sequence:
+        index = PrefixIndex(sequence)
+    elif sequence > index.sequence:
+        changes = cache.get_many([CHANGE_CACHE_KEY.format(n) for n in range(index.sequence + 1, sequence + 1)])
+        if len(changes) < sequence - index.sequence:
+            # Journal incomplet (entrées expirées ou évincées)
+            index = PrefixIndex(sequence)
+        else:
+            ids = defaultdict(set)
+            for kind, pk in changes.values():
+                ids[kind].add(pk)
+            index.refresh(sorted(ids['p']), sorted(ids['c']))
+            index.sequence = sequence
+    _local.index, _local.checked = index, time.monotonic()
+    return index
+
+
+def suggest(query, limit=LIMIT):
+    """[{'type', 'label', 'url'}] pour la saisie"""
+    return [
+        {'type': KIND_LABELS[kind], 'label': label, 'url': _url(kind, label, slug)}
+        for kind, label, slug in current_index().search(query, limit)
+    ]
+
+
+def record(kind, pk):
+    """Inscrit la modification d'un produit ('p') ou d'une catégorie ('c') au journal (après le commit)"""
+    _sequence()
+    # incr() n'est atomique qu'avec Redis : sur le cache en base, deux processus peuvent tirer le
+    # même numéro. add() départage (clé primaire) et le perdant prend le numéro suivant.
+    for _ in range(MAX_REPLAY):
+        sequence = cache.incr(SEQUENCE_CACHE_KEY)
+        if cache.add(CHANGE_CACHE_KEY.format(sequence), (kind, pk), CHANGE_CACHE_TIMEOUT):
+            break
+    else:
+        invalidate()
+    # Ce processus voit sa propre modification à la prochaine suggestion
+    _local.checked = 0.0
+
+
+def invalidate():
+    """Après un import en masse (sans signaux) : reconstruction complète dans chaque processus"""
+    _sequence()
+    cache.incr(SEQUENCE_CACHE_KEY, MAX_REPLAY + 1)
+    _local.index = None
@@ -0,0 +1,162 @@
+"""
+Classement des meilleures ventes.
+
+Les compteurs Product.ventes_total / ventes_7j / ventes_30j sont mis à jour
+au checkout et à l'annulation (quelques requêtes groupées par commande),
+si bien qu'un Top N n'est qu'une lecture sur un index, sans GROUP BY sur
+tout l'historique des OrderItem.
+
+Les fenêtres glissantes 7j / 30j sont recalculées une fois par jour à
+partir des ventes journalières (ProductSalesDay) par la tâche planifiée
+« manage.py refresh_bestsellers » : l'affichage ne fait jamais d'écriture.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import ArchivedOrderItem, OrderItem, Product, ProductSalesDay
+
+WINDOWS = {
+    'total': 'ventes_total',
+    '7j': 'ventes_7j',
+    '30j': 'ventes_30j',
+}
+
+
+def _counter_update(deltas):
+    """Expression CASE qui ajoute deltas[product_id] au compteur (jamais en dessous de 0)"""
+    def expr(field):
+        whens = [When(id=pk, then=Greatest(F(field) + Value(delta[field]), Value(0)))
+                 for pk, delta in deltas.items() if delta[field]]
+        return Case(*whens, default=F(field), output_field=IntegerField()) if whens else None
+    return {field: e for field in WINDOWS.values() if (e := expr(field)) is not None}
+
+
+def record_sales(rows, sign=1):
+    """
+    Enregistre des ventes (sign=1) ou les annule (sign=-1).
+    rows : itérable de (product_id, jour, quantité). 3 requêtes quel que soit le volume.
+    """
+    today = timezone.localdate()
+    deltas = defaultdict(lambda: dict.fromkeys(WINDOWS.values(), 0))
+    days = defaultdict(int)
+    for product_id, day, qty in rows:
+        if not product_id or not qty:
+            continue
+        qty *= sign
+        age = (today - day).days
+        deltas[product_id]['ventes_total'] += qty
+        if age < 7:
+            deltas[product_id]['ventes_7j'] += qty
+        if age < 30:
+            deltas[product_id]['ventes_30j'] += qty
+            days[(product_id, day)] += qty
+
+    if not deltas:
+        return
+
+    Product.objects.filter(id__in=list(deltas)).update(**_counter_update(deltas))
+
+    if days:
+        ProductSalesDay.objects.bulk_create(
+            [ProductSalesDay(product_id=pk, jour=day) for pk, day in days],
+            ignore_conflicts=True,
+        )
+        condition = Q()
+        for pk, day in days:
+            condition |= Q(product_id=pk, jour=day)
+        ProductSalesDay.objects.filter(condition).update(quantite=Case(
+            *[When(product_id=pk, jour=day, then=F('quantite') + qty) for (pk, day), qty in days.items()],
+            default=F('quantite'),
+        ))
+
+
+def record_checkout(items):
+    """items : liste de (product_id, quantité) d'une commande qui vient d'être validée"""
+    today = timezone.localdate()
+    record_sales((product_id, today, qty) for product_id, qty in items)
+
+
+def revert_orders(order_ids):
+    """Retire du classement les ventes des commandes annulées ou supprimées"""
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False)
+        .values('product_id', day=TruncDate('order__created_at'))
+        .annotate(qty=Sum('quantity'))
+        .values_list('product_id', 'day', 'qty')
+    )
+    record_sales(rows, sign=-1)
+
+
+def refresh_windows():
+    """Recalcule ventes_7j / ventes_30j à partir des ventes journalières (3 requêtes)"""
+    today = timezone.localdate()
+    since_7 = today - datetime.timedelta(days=6)
+    since_30 = today - datetime.timedelta(days=29)
+
+    ProductSalesDay.objects.filter(jour__lt=since_30).delete()
+    sums = (
+        ProductSalesDay.objects.filter(jour__gte=since_30)
+        .values('product_id')
+        .annotate(q7=Sum('quantite', filter=Q(jour__gte=since_7), default=0), q30=Sum('quantite'))
+    )
+    ids, whens_7, whens_30 = [], [], []
+    for row in sums:
+        ids.append(row['product_id'])
+        whens_7.append(When(id=row['product_id'], then=Value(max(row['q7'], 0))))
+        whens_30.append(When(id=row['product_id'], then=Value(max(row['q30'], 0))))
+
+    # Les produits absents des ventes récentes retombent à 0
+    Product.objects.filter(
+        Q(ventes_7j__gt=0) | Q(ventes_30j__gt=0) | Q(id__in=ids)
+    ).update(
+        ventes_7j=Case(*whens_7, default=Value(0), output_field=IntegerField()),
+        ventes_30j=Case(*whens_30, default=Value(0), output_field=IntegerField()),
+    )
+
+
+def rebuild(batch_size=500):
+    """Recalcule tous les compteurs depuis l'historique des commandes (hors annulées)"""
+    since = timezone.localdate() - datetime.timedelta(days=29)
+    # Commandes actives et archivées (shop/order_archive.py)
+    sources = [
+        model.objects.filter(product__isnull=False).exclude(order__status='CANCELLED')
+        for model in (OrderItem, ArchivedOrderItem)
+    ]
+    quantities = defaultdict(int)
+    for sold in sources:
+        for pk, qty in sold.values('product_id').annotate(qty=Sum('quantity')).values_list('product_id', 'qty'):
+            quantities[pk] += qty
+    totals = list(quantities.items())
+
+    Product.objects.filter(ventes_total__gt=0).update(ventes_total=0)
+    for start in range(0, len(totals), batch_size):
+        chunk = totals[start:start + batch_size]
+        Product.objects.filter(id__in=[pk for pk, _ in chunk]).update(ventes_total=Case(
+            *[When(id=pk, then=Value(qty)) for pk, qty in chunk], output_field=IntegerField(),
+        ))
+
+    ProductSalesDay.objects.all().delete()
+    days = defaultdict(int)
+    for sold in sources:
+        for pk, day, qty in (
+            sold.annotate(day=TruncDate('order__created_at')).filter(day__gte=since)
+            .values('product_id', 'day').annotate(qty=Sum('quantity'))
+            .values_list('product_id', 'day', 'qty')
+        ):
+            days[pk, day] += qty
+    ProductSalesDay.objects.bulk_create(
+        [ProductSalesDay(product_id=pk, jour=day, quantite=qty) for (pk, day), qty in days.items()],
+        batch_size=batch_size,
+    )
+    refresh_windows()
+
+
+def top_products(limit=5, window='30j', queryset=None):
+    """Top N des ventes : une seule lecture sur l'index du compteur"""
+    field = WINDOWS[window]
+    queryset = Product.objects.all() if queryset is None else queryset
+    return queryset.filter(**{f'{field}__gt': 0}).order_by(f'-{field}')[:limit]
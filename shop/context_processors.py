@@ -1,18 +1,18 @@
-from .models import Category, Cart
+from .models import Category, CartItem
 
 def extras(request):
     # Récupère toutes les catégories pour les menus de navigation
     categories = Category.objects.all()
     
     cart_count = 0
+    # Page en cache partagé (shop/edge.py) : rien de propre au visiteur, le badge arrive par /session/
+    edge_cache = getattr(request, 'edge_cache', False)
     
-    if request.user.is_authenticated:
-        # On utilise filter().first() ou get_or_create pour éviter l'exception DoesNotExist
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        
-        # Option A : Compter le nombre de PRODUITS différents (ex: 1 iPhone + 1 Mac = 2)
-        cart_count = cart.items.count()
+    if not edge_cache and request.user.is_authenticated:
+        # Lecture seule : pas de panier créé pour afficher le badge (il naît au premier ajout)
+        cart_count = CartItem.objects.filter(cart__user=request.user).count()
     return {
         'categories': categories,
-        'cart_count': cart_count
-    }
\ No newline at end of file
+        'cart_count': cart_count,
+        'edge_cache': edge_cache,
+    }
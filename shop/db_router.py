@@ -0,0 +1,164 @@
+"""
+Routage lecture / écriture entre la base primaire et ses réplicas.
+
+- Écritures : toujours sur 'default' (checkout, panier, admin...).
+- Lectures du catalogue (produits, catégories, avis...) : sur un réplica
+  tiré au hasard parmi SHOP_DB_REPLICAS.
+- Statistiques : `with replica_reads():` envoie toutes les lectures du
+  bloc sur un réplica (tableau de bord admin).
+- Read-your-writes : dès qu'une requête écrit, les lectures suivantes de
+  ce client restent sur la primaire pendant SHOP_DB_STICKY_SECONDS
+  (cookie posé par ReplicaRoutingMiddleware), pour ne jamais lui montrer
+  un panier ou une commande périmés.
+
+Hors requête HTTP (commandes, tâches en arrière-plan) et dans une
+transaction, tout se lit sur la primaire.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+STICKY_COOKIE = 'shop_primary_until'
+
+# Modèles lus sur les réplicas (catalogue public)
+CATALOG_MODELS = {
+    'shop.category', 'shop.subcategory', 'shop.deliveryzone', 'shop.color', 'shop.size', 'shop.capacity',
+    'shop.product', 'shop.productimage', 'shop.review', 'shop.productsalesday',
+}
+
+# Jamais lus sur un réplica, même dans replica_reads() (panier, session, compte, cache partagé)
+PRIMARY_ONLY_MODELS = {'shop.cart', 'shop.cartitem', 'sessions.session', 'auth.user', 'django_cache.cacheentry'}
+
+_WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_state = ContextVar('shop_db_routing', default=None)
+_force_replica = ContextVar('shop_db_force_replica', default=False)
+
+
+class RoutingState:
+    """Routage de la requête HTTP en cours (porté par une ContextVar)"""
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def _replicas():
+    return getattr(settings, 'SHOP_DB_REPLICAS', [])
+
+
+def is_cache_sql(sql):
+    """Requête du cache partagé en base (DatabaseCache) : ni une écriture métier, ni une requête de la vue"""
+    table = getattr(settings, 'SHOP_CACHE_TABLE', None)
+    return bool(table) and table in sql
+
+
+def _read_from_primary():
+    state = _state.get()
+    return (
+        state is None
+        or state.pinned
+        or state.wrote
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    )
+
+
+@contextmanager
+def replica_reads():
+    """Toutes les lectures du bloc vont sur un réplica (sauf client épinglé sur la primaire)"""
+    token = _force_replica.set(True)
+    try:
+        yield
+    finally:
+        _force_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = _replicas()
+        # label_lower reconstitué : le modèle du cache en base n'a qu'un _meta minimal
+        label = f'{model._meta.app_label}.{model._meta.model_name}'
+        if not replicas or _read_from_primary() or label in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if _force_replica.get() or label in CATALOG_MODELS:
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaire et réplicas portent les mêmes données
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Pas d'avis : en production les réplicas reçoivent le schéma par réplication,
+        # les fichiers SQLite de test sont migrés comme la primaire
+        return None
+
+
+# --- Détection des écritures (connexion primaire) ---
+
+def _write_tracker(execute, sql, params, many, context):
+    state = _state.get()
+    if (state is not None and not state.wrote and sql.lstrip().upper().startswith(_WRITE_PREFIXES)
+            and not is_cache_sql(sql)):
+        state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    if connection.alias == DEFAULT_DB_ALIAS and _write_tracker not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_write_tracker)
+
+
+def install():
+    if _replicas():
+        connection_created.connect(_on_connection_created, dispatch_uid='shop_db_router_writes')
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        try:
+            pinned = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state = RoutingState(pinned)
+        return state, _state.set(state)
+
+    def _finish(self, response, state, token):
+        _state.reset(token)
+        if state.wrote:
+            seconds = getattr(settings, 'SHOP_DB_STICKY_SECONDS', 10)
+            response.set_cookie(STICKY_COOKIE, str(int(time.time() + seconds)), max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _replicas():
+            return self.get_response(request)
+        state, token = self._start(request)
+        return self._finish(self.get_response(request), state, token)
+
+    async def __acall__(self, request):
+        if not _replicas():
+            return await self.get_response(request)
+        state, token = self._start(request)
+        return self._finish(await self.get_response(request), state, token)
@@ -0,0 +1,93 @@
+"""
+Pages vitrine en cache partagé (CDN, proxy) : accueil, liste, fiche produit.
+
+Sous @cacheable, ces pages sont rendues sans rien de propre au visiteur
+(context processor `extras` : edge_cache=True) :
+
+- en-tête en version « visiteur » : menu du compte, badge panier et
+  messages arrivent après le chargement via /session/ (views.session_fragments) ;
+- formulaires sans jeton CSRF ({% csrf_field %}, shop/templatetags/shop_edge.py) :
+  le script de base.html les remplit depuis le cookie csrftoken ou /session/.
+
+Le même HTML sert donc tout le monde : réponse `Cache-Control: public,
+s-maxage=SHOP_EDGE_CACHE_SECONDS`, sans Vary: Cookie. Par sécurité, une
+réponse qui a tout de même lu la session, posé un cookie ou demandé un
+jeton CSRF reste privée. SHOP_EDGE_CACHE_SECONDS = 0 désactive le mode.
+
+La décision public / privé est prise par EdgeCacheMiddleware, premier de
+MIDDLEWARE : il voit la réponse finale, avec tous les cookies posés par les
+autres middlewares (session, CSRF, messages, shop_primary_until de
+ReplicaRoutingMiddleware après une écriture).
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+
+
+def _seconds():
+    return getattr(settings, 'SHOP_EDGE_CACHE_SECONDS', 0)
+
+
+def _personalized(request, response):
+    session = getattr(request, 'session', None)
+    return bool(
+        response.cookies
+        or (session is not None and session.accessed)
+        or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def _finalize(request, response):
+    if response.status_code != 200 or response.has_header('Cache-Control'):
+        return response
+    if _personalized(request, response):
+        patch_cache_control(response, private=True)
+    else:
+        # Navigateur : revalide à chaque fois ; cache partagé : s-maxage
+        patch_cache_control(response, public=True, max_age=0, s_maxage=_seconds())
+    return response
+
+
+def _prepare(request):
+    request.edge_cache = request.method in ('GET', 'HEAD') and _seconds() > 0
+
+
+def cacheable(view):
+    """Rend une vue GET partageable par un cache (vue fonction ou as_view(), sync ou async)"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            _prepare(request)
+            return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            _prepare(request)
+            return view(request, *args, **kwargs)
+    return wrapped
+
+
+class EdgeCacheMiddleware:
+    """Pose Cache-Control sur les vues @cacheable, une fois la réponse complète"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, request, response):
+        if getattr(request, 'edge_cache', False):
+            return _finalize(request, response)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._finish(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._finish(request, await self.get_response(request))
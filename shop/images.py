@@ -0,0 +1,163 @@
+"""
+Dérivés responsive des images produits et catégories.
+
+À l'envoi d'une image (ProductImage.image, Category.img), une tâche en
+arrière-plan génère avec Pillow des versions WebP et JPEG à largeurs fixes,
+plus une miniature floutée servant de placeholder. Les URL, dimensions et
+placeholder sont enregistrés sur le modèle : les templates construisent
+srcset sans jamais appeler le stockage (Cloudinary) au rendu.
+
+Fonctionne avec n'importe quel stockage Django (FileSystemStorage en test).
+Pillow n'est importé qu'à la première génération (comme weasyprint pour les
+factures) : ce module est chargé au démarrage par les signaux et la balise
+{% responsive_image %}.
+"""
+import base64
+import io
+import logging
+import posixpath
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+
+from .tasks import enqueue
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 1024)
+# (clé dans derivatives, format Pillow)
+FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+QUALITY = 80
+PLACEHOLDER_WIDTH = 16
+
+
+def _derivative_name(name, width, extension):
+    directory, filename = posixpath.split(name)
+    root = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'derivatives', f"{root}-{width}w.{extension}")
+
+
+def _to_rgb(image):
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Le JPEG n'a pas de transparence : fond blanc
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _placeholder(image):
+    from PIL import Image, ImageFilter
+
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def build_derivatives(field):
+    """
+    Génère les dérivés du fichier `field` et retourne les valeurs à
+    enregistrer : {'width', 'height', 'placeholder', 'derivatives'}
+    """
+    from PIL import Image
+
+    storage = field.storage
+    with field.open('rb') as source:
+        image = _to_rgb(Image.open(source))
+    width, height = image.size
+
+    derivatives = {'source': field.name}
+    # Jamais d'agrandissement : l'original sert de plus grande taille si besoin
+    widths = sorted({min(target, width) for target in WIDTHS})
+    for target in widths:
+        resized = image if target == width else image.resize(
+            (target, max(1, round(height * target / width))), Image.LANCZOS,
+        )
+        for key, pillow_format in FORMATS:
+            buffer = io.BytesIO()
+            resized.save(buffer, pillow_format, quality=QUALITY)
+            name = storage.save(_derivative_name(field.name, target, key), ContentFile(buffer.getvalue()))
+            derivatives.setdefault(key, []).append({
+                'url': storage.url(name),
+                'name': name,
+                'width': target,
+                'height': resized.height,
+            })
+    return {
+        'width': width,
+        'height': height,
+        'placeholder': _placeholder(image),
+        'derivatives': derivatives,
+    }
+
+
+def delete_derivatives(storage, derivatives):
+    for key, _ in FORMATS:
+        for variant in derivatives.get(key, []):
+            try:
+                storage.delete(variant['name'])
+            except Exception:
+                logger.warning("Dérivé introuvable : %s", variant['name'])
+
+
+def generate(model_label, pk):
+    """Tâche : (re)génère les dérivés d'une image"""
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    field = getattr(instance, model.source_field)
+    if field.name == instance.derivatives.get('source'):
+        return
+    values = {'width': None, 'height': None, 'placeholder': '', 'derivatives': {}}
+    if field:
+        values = build_derivatives(field)
+    # update() : pas de post_save, donc pas de nouvelle génération
+    model.objects.filter(pk=pk).update(**values)
+    release(instance)
+
+
+def release(instance):
+    """Supprime les anciens dérivés d'une image s'ils ne servent plus à aucune ligne"""
+    source = instance.derivatives.get('source')
+    if source and not type(instance).objects.filter(derivatives__source=source).exists():
+        delete_derivatives(getattr(instance, instance.source_field).storage, instance.derivatives)
+
+
+def schedule(instance):
+    """À appeler après l'enregistrement : génère les dérivés si l'image a changé"""
+    field = getattr(instance, instance.source_field)
+    if field.name != instance.derivatives.get('source'):
+        enqueue(generate, instance._meta.label, instance.pk)
+
+
+def backfill(model, force=False):
+    """
+    Génère les dérivés manquants d'un modèle. Les lignes partageant le
+    même fichier (ex. données de seed_shop) ne sont traitées qu'une fois.
+    Retourne le nombre de fichiers traités.
+    """
+    field_name = model.source_field
+    rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+    if not force:
+        rows = rows.filter(derivatives={})
+    names = list(rows.values_list(field_name, flat=True).distinct())
+    done = 0
+    for name in names:
+        instance = model.objects.filter(**{field_name: name}).first()
+        field = getattr(instance, field_name)
+        try:
+            values = build_derivatives(field)
+        except (OSError, ValueError):
+            logger.exception("Image illisible : %s", name)
+            continue
+        model.objects.filter(**{field_name: name}).update(**values)
+        delete_derivatives(field.storage, instance.derivatives)
+        done += 1
+    return done
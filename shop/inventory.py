@@ -0,0 +1,154 @@
+"""
+Stock par variante (SKU).
+
+Le stock vendable est celui de ProductVariant ; Product.quantite_stocks
+en est la somme, recalculée ici à chaque mouvement (jamais par delta : un
+total ayant dérivé est corrigé au lieu de faire échouer le checkout) pour
+que le catalogue (cartes produit, alertes de stock bas) n'ait pas à joindre
+les variantes.
+
+- resolve_variant() : combinaison postée par la fiche produit -> SKU ;
+- reserve() : verrouille les SKU du panier (SELECT ... FOR UPDATE, toujours
+  dans l'ordre des id pour éviter les interblocages), vérifie et décrémente ;
+- restock() : remise en stock (commandes annulées) ;
+- availability() : stock et prix de toutes les variantes d'un produit,
+  calculés sur la liste préchargée (aucune requête).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, ProductVariant
+
+OPTION_FIELDS = ('color', 'size', 'capacity')
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variant, available):
+        self.variant = variant
+        self.available = available
+        name = variant if variant is not None else "un article de votre panier"
+        super().__init__(f"Désolé, le stock pour '{name}' est insuffisant ({available} disponible(s)).")
+
+
+def _option_id(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def resolve_variant(product, options):
+    """
+    Variante correspondant aux options postées (color, size, capacity), en une requête.
+
+    Une option fournie doit correspondre exactement ; une option absente
+    (lien « Ajouter au panier » sans choix) laisse choisir la variante la
+    mieux fournie. Retourne None si aucune variante ne convient.
+    """
+    chosen = {field: _option_id(options.get(field)) for field in OPTION_FIELDS}
+    candidates = [
+        variant for variant in ProductVariant.objects.select_related('product').filter(product=product)
+        if all(value is None or getattr(variant, f'{field}_id') == value for field, value in chosen.items())
+    ]
+    exact = [variant for variant in candidates
+             if all(getattr(variant, f'{field}_id') == value for field, value in chosen.items())]
+    if exact or all(chosen.values()):
+        return exact[0] if exact else None
+    return min(candidates, key=lambda variant: (-variant.stock, variant.id), default=None)
+
+
+def availability(product):
+    """{variant_id: {...}} pour la fiche produit (utilise product.variants préchargées)"""
+    return {
+        variant.id: {
+            'color': variant.color_id,
+            'size': variant.size_id,
+            'capacity': variant.capacity_id,
+            'stock': variant.stock,
+            'price': str(variant.price),
+        }
+        for variant in product.variants.all()
+    }
+
+
+def options(product):
+    """Couleurs, tailles et capacités proposées, dans l'ordre des variantes (sans requête)"""
+    found = {field: {} for field in OPTION_FIELDS}
+    for variant in product.variants.all():
+        for field in OPTION_FIELDS:
+            option = getattr(variant, field)
+            if option is not None:
+                found[field].setdefault(option.id, option)
+    return {field: list(values.values()) for field, values in found.items()}
+
+
+def reserve(lines):
+    """
+    Décrémente le stock des SKU pour [(variant_id, quantité)] (3 requêtes).
+
+    À appeler dans une transaction : les lignes restent verrouillées jusqu'au
+    commit, deux paniers ne peuvent pas vendre la même dernière unité.
+    Lève InsufficientStock sans rien modifier si une variante ne suffit pas.
+    """
+    wanted = defaultdict(int)
+    for variant_id, quantity in lines:
+        wanted[variant_id] += quantity
+    if not wanted:
+        return {}
+    # Pas de savepoint : toutes les vérifications précèdent les écritures
+    with transaction.atomic(savepoint=False):
+        variants = {
+            variant.id: variant
+            for variant in ProductVariant.objects.select_for_update(of=('self',))
+            .select_related('product', 'color', 'size', 'capacity')
+            .filter(id__in=list(wanted))
+            .order_by('id')
+        }
+        for variant_id, quantity in wanted.items():
+            variant = variants.get(variant_id)
+            if variant is None or variant.stock < quantity:
+                raise InsufficientStock(variant, variant.stock if variant else 0)
+        for variant_id, quantity in wanted.items():
+            variants[variant_id].stock -= quantity
+        ProductVariant.objects.bulk_update(variants.values(), ['stock'])
+        sync_product_stock({variant.product_id for variant in variants.values()})
+    return variants
+
+
+def restock(quantities):
+    """Remet en stock {variant_id: quantité} (2 requêtes)"""
+    quantities = {pk: qty for pk, qty in quantities.items() if pk and qty}
+    if not quantities:
+        return
+    whens = [When(id=pk, then=F('stock') + qty) for pk, qty in quantities.items()]
+    ProductVariant.objects.filter(id__in=list(quantities)).update(
+        stock=Case(*whens, default=F('stock'), output_field=PositiveIntegerField())
+    )
+    sync_product_stock(ProductVariant.objects.filter(id__in=list(quantities)).values('product_id'))
+
+
+def sync_product_stock(product_ids):
+    """
+    Recalcule Product.quantite_stocks depuis les variantes (1 requête) : après
+    une réservation, une remise en stock, une saisie admin, un import...
+    `product_ids` : liste d'id ou sous-requête.
+    """
+    total = (
+        ProductVariant.objects.filter(product=OuterRef('pk'))
+        .order_by().values('product').annotate(total=Sum('stock')).values('total')
+    )
+    Product.objects.filter(id__in=product_ids).update(
+        quantite_stocks=Coalesce(Subquery(total), Value(0), output_field=PositiveIntegerField()),
+        # update() ne touche pas auto_now : le stock fait partie de la fiche (ETag de l'API catalogue)
+        date_modification=timezone.now(),
+    )
+
+
+def ensure_default_variant(product):
+    """Un produit sans options est vendu via une variante unique (toutes options vides)"""
+    if not product.variants.exists():
+        ProductVariant.objects.create(product=product, stock=product.quantite_stocks)
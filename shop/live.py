@@ -0,0 +1,231 @@
+"""
+Événements temps réel du tableau de bord admin (Server-Sent Events).
+
+Le checkout et la machine à états publient des événements déjà calculés
+(nouvelle commande, encaissement, stock bas) ; chaque tableau de bord
+ouvert reçoit une copie via une file asyncio. Aucune requête SQL n'est
+faite par connexion : 50 onglets ouverts coûtent autant qu'un seul.
+
+Le broker est choisi par settings.SHOP_LIVE_BROKER :
+  - InProcessBroker : diffusion dans le processus seulement. Avec plusieurs
+    workers gunicorn, un tableau de bord ne reçoit que les événements du
+    worker qui sert sa connexion SSE : à réserver à un worker unique
+    (WEB_CONCURRENCY=1, runserver) ;
+  - SharedCacheBroker (défaut dès que WEB_CONCURRENCY > 1) : les événements
+    passent par le cache partagé (Redis ou table shop_cache), chaque worker
+    les relit et les diffuse à ses propres abonnés ;
+  - LocalBroker : mémorise les événements, pour les tests
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+POLL_SECONDS = 1
+SEQUENCE_CACHE_KEY = 'shop:live:seq'
+EVENT_CACHE_KEY = 'shop:live:event:{}'
+EVENT_CACHE_TIMEOUT = 60
+MAX_CLAIMS = 10
+# Délai laissé à un publieur entre son incr() et son add() avant d'abandonner le numéro
+GAP_GRACE_SECONDS = 2
+
+
+class InProcessBroker:
+    """Diffuse les événements à tous les abonnés du processus (thread-safe)"""
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _deliver(queue, message):
+        if queue.full():
+            # Client trop lent : on sacrifie le plus ancien événement
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, (event, data))
+            except RuntimeError:
+                # Boucle fermée : l'abonné sera retiré à sa déconnexion
+                pass
+
+    async def subscribe(self, heartbeat=HEARTBEAT_SECONDS):
+        """Générateur asynchrone d'événements ; produit None à chaque battement de cœur"""
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_queue))
+        with self._lock:
+            self._subscribers.add(entry)
+        self._subscribed()
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(entry[1].get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers.discard(entry)
+
+    def _subscribed(self):
+        pass
+
+
+class SharedCacheBroker(InProcessBroker):
+    """
+    Diffusion entre workers par un journal dans le cache partagé. Dans chaque
+    processus, une seule tâche relit le journal toutes les POLL_SECONDS tant
+    qu'un tableau de bord y est ouvert : une lecture du cache par seconde et
+    par worker, quel que soit le nombre d'onglets.
+    """
+
+    def __init__(self, max_queue=100, poll_seconds=POLL_SECONDS, grace_seconds=GAP_GRACE_SECONDS):
+        super().__init__(max_queue)
+        self.poll_seconds = poll_seconds
+        self.grace_seconds = grace_seconds
+        self._position = None
+        self._gap_since = None
+        self._poller = None
+
+    @staticmethod
+    def _next_sequence():
+        try:
+            return cache.incr(SEQUENCE_CACHE_KEY)
+        except ValueError:
+            # Première publication, ou cache vidé
+            cache.add(SEQUENCE_CACHE_KEY, 0, None)
+            return cache.incr(SEQUENCE_CACHE_KEY)
+
+    def publish(self, event, data):
+        # incr() n'est atomique qu'avec Redis : add() départage deux workers ayant tiré le même numéro
+        for _ in range(MAX_CLAIMS):
+            sequence = self._next_sequence()
+            if cache.add(EVENT_CACHE_KEY.format(sequence), (event, data), EVENT_CACHE_TIMEOUT):
+                return
+        logger.warning("Événement temps réel perdu : %s", event)
+
+    def poll(self):
+        """
+        Diffuse aux abonnés du processus les événements publiés depuis le dernier passage.
+
+        Un numéro tiré par incr() dont l'événement n'est pas encore écrit bloque
+        la lecture à cet endroit : il est relu aux passages suivants, puis
+        abandonné après grace_seconds (publieur tombé, événement expiré).
+        """
+        sequence = cache.get(SEQUENCE_CACHE_KEY) or 0
+        if self._position is None or sequence < self._position:
+            # Premier passage ou cache vidé : on part de maintenant, sans rejouer l'historique
+            self._position = sequence
+            self._gap_since = None
+            return
+        numbers = range(self._position + 1, sequence + 1)
+        events = cache.get_many([EVENT_CACHE_KEY.format(n) for n in numbers]) if numbers else {}
+        for n in numbers:
+            event = events.get(EVENT_CACHE_KEY.format(n))
+            if event is None:
+                now = time.monotonic()
+                if self._gap_since is None:
+                    self._gap_since = now
+                if now - self._gap_since < self.grace_seconds:
+                    return
+                logger.warning("Événement temps réel %s jamais écrit, ignoré", n)
+            else:
+                super().publish(*event)
+            self._position = n
+            self._gap_since = None
+
+    def _subscribed(self):
+        loop = asyncio.get_running_loop()
+        if self._poller is None or self._poller.done() or self._poller.get_loop() is not loop:
+            self._poller = loop.create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        while self._subscribers:
+            try:
+                await sync_to_async(self.poll)()
+            except Exception:
+                logger.exception("Lecture du journal temps réel impossible")
+            await asyncio.sleep(self.poll_seconds)
+
+
+class LocalBroker:
+    """Broker de test : garde les événements publiés et les rejoue aux abonnés"""
+
+    def __init__(self):
+        self.events = []
+
+    def publish(self, event, data):
+        self.events.append((event, data))
+
+    async def subscribe(self, heartbeat=None):
+        for message in list(self.events):
+            yield message
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'SHOP_LIVE_BROKER', 'shop.live.InProcessBroker'))()
+    return _broker
+
+
+def publish(event, data):
+    """Publie l'événement une fois la transaction validée (rien si elle est annulée)"""
+    transaction.on_commit(lambda: get_broker().publish(event, data))
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(broker=None):
+    broker = broker or get_broker()
+    yield "retry: 5000\n\n"
+    async for message in broker.subscribe():
+        if message is None:
+            yield ": ping\n\n"
+        else:
+            yield format_sse(*message)
+
+
+# --- Événements publiés par la boutique ---
+
+def publish_new_order(order):
+    publish('order', {
+        'id': order.id,
+        'reference': order.reference,
+        'full_name': order.full_name,
+        'city': order.city,
+        'total_amount': float(order.total_amount),
+        'created_at': order.created_at.isoformat(),
+    })
+
+
+def publish_revenue(amount, count):
+    publish('revenue', {'amount': float(amount), 'count': count})
+
+
+def publish_low_stock(product):
+    publish('low_stock', {
+        'id': product.id,
+        'nom': product.nom,
+        'quantite_stocks': product.quantite_stocks,
+        'seuil_stocks_bas': product.seuil_stocks_bas,
+    })
@@ -0,0 +1,47 @@
+"""
+Déplace les commandes terminées anciennes vers les tables d'archive.
+
+    python manage.py archive_orders                  # plus de SHOP_ORDER_ARCHIVE_DAYS jours
+    python manage.py archive_orders --days 180 --batch-size 500
+    python manage.py archive_orders --dry-run
+
+Par lots (une transaction courte chacun) pour ne pas bloquer le checkout
+ni le back-office. Voir shop/order_archive.py.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import order_archive
+from shop.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = "Archive les commandes livrées ou annulées anciennes (avec leurs lignes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Âge minimal en jours (défaut : SHOP_ORDER_ARCHIVE_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Compte les commandes concernées sans rien déplacer")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 1:
+            raise CommandError("--days doit être strictement positif")
+        before = order_archive.cutoff(options['days'])
+        candidates = order_archive.archivable(before)
+
+        if options['dry_run']:
+            count = candidates.count()
+            items = OrderItem.objects.filter(order__in=candidates).count()
+            self.stdout.write(f"{count} commandes ({items} lignes) antérieures au {before:%d/%m/%Y} à archiver.")
+            return
+
+        orders = items = 0
+        while True:
+            ids = list(candidates.order_by('created_at', 'id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            moved, moved_items = order_archive.archive_batch(ids)
+            if not moved:
+                break
+            orders, items = orders + moved, items + moved_items
+            self.stdout.write(f"  {orders} commandes archivées...")
+        self.stdout.write(self.style.SUCCESS(f"{orders} commandes et {items} lignes archivées."))
@@ -0,0 +1,322 @@
+"""
+Banc d'essai de charge des parcours principaux de la boutique.
+
+    python manage.py seed_shop --products 5000 --orders 20000
+    python manage.py bench_shop --concurrency 1,4,16 --requests 200
+    python manage.py bench_shop --compare bench_results/ancien.json
+
+Par défaut les requêtes passent par le client de test Django, dans le
+processus (latence applicative + SQL, requêtes SQL comptées). Avec
+--base-url, les scénarios en lecture sont joués en HTTP contre un serveur
+lancé à part (gunicorn, uvicorn...) : seule la latence est alors mesurée.
+
+Avec --asgi, les scénarios en lecture passent par le client de test async
+(ASGIHandler) : les N clients partagent une seule boucle asyncio, comme
+dans un worker uvicorn. Vues catalogue async contre vues synchrones :
+
+    ASYNC_CATALOG=False python manage.py bench_shop --asgi --output bench_results/sync.json
+    python manage.py bench_shop --asgi --compare bench_results/sync.json
+
+Les résultats (p50 / p95 / p99, débit, requêtes SQL par requête) sont
+enregistrés en JSON pour comparer deux commits.
+"""
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import AsyncClient, Client
+from django.utils import timezone
+
+from shop.models import Category, Product
+
+SCENARIOS = ['home', 'listing', 'detail', 'add_to_cart', 'checkout']
+READ_ONLY_SCENARIOS = {'home', 'listing', 'detail'}
+SEARCH_TERMS = ['pro', 'samsung', 'max', 'air', 'ultra', 'lite', 'phone']
+SORTS = ['', 'price_asc', 'price_desc', 'oldest', 'popular', 'rating']
+# Le checkout redirige (302) quand il échoue : seul le 200 « merci » compte comme succès
+EXPECTED_STATUS = {'checkout': 200}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Worker:
+    """Un utilisateur virtuel : un client HTTP (ou de test) et son propre compte"""
+
+    def __init__(self, index, base_url, catalog):
+        self.base_url = base_url
+        self.catalog = catalog
+        self.rng = random.Random(index)
+        self.queries = 0
+        if not base_url:
+            self.client = Client()
+            user, created = User.objects.get_or_create(username=f'bench-{index}', defaults={'email': f'bench{index}@example.ga'})
+            self.client.force_login(user)
+
+    def _count_queries(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def request(self, method, path, data=None):
+        """Retourne (statut, nombre de requêtes SQL)"""
+        if self.base_url:
+            with urllib.request.urlopen(self.base_url.rstrip('/') + path, timeout=30) as response:
+                response.read()
+                return response.status, None
+        self.queries = 0
+        with connection.execute_wrapper(self._count_queries):
+            response = getattr(self.client, method)(path, data or {})
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+        return response.status_code, self.queries
+
+    def prepare(self, scenario):
+        # Le checkout a besoin d'un panier : on le remplit hors chronométrage
+        if scenario == 'checkout':
+            self.client.post(f"/cart/add/{self.pick_product()['id']}/", {'quantity': 1})
+
+    def pick_product(self):
+        products = self.catalog['products']
+        return products[min(int(self.rng.paretovariate(1.16)) - 1, len(products) - 1)]
+
+    def run(self, scenario):
+        return self.request(*self.build(scenario))
+
+    def build(self, scenario):
+        """Retourne (méthode, chemin, données) de la prochaine requête du scénario"""
+        rng = self.rng
+        if scenario == 'home':
+            return 'get', '/', None
+        if scenario == 'listing':
+            params = {}
+            if rng.random() < 0.4:
+                params['search'] = rng.choice(SEARCH_TERMS)
+            if rng.random() < 0.4 and self.catalog['categories']:
+                params['category'] = rng.choice(self.catalog['categories'])
+            if rng.random() < 0.2:
+                params['min_price'] = rng.choice([5000, 20000, 50000])
+            if rng.random() < 0.5:
+                params['sort'] = rng.choice(SORTS)
+            if rng.random() < 0.3 and not params.keys() - {'sort'}:
+                params['page'] = 2
+            query = '&'.join(f'{key}={value}' for key, value in params.items())
+            return 'get', f"/products/?{query}", None
+        if scenario == 'detail':
+            return 'get', f"/products/{self.pick_product()['slug']}/", None
+        if scenario == 'add_to_cart':
+            return 'post', f"/cart/add/{self.pick_product()['id']}/", {'quantity': 1}
+        if scenario == 'checkout':
+            return 'post', '/checkout/', {
+                'full_name': 'Bench Client', 'email': 'bench@example.ga', 'phone': '+241 077000000',
+                'address': 'Quartier Louis, Libreville', 'city': 'Libreville',
+            }
+        raise ValueError(scenario)
+
+
+class Command(BaseCommand):
+    help = "Mesure p50/p95/p99 et requêtes SQL par requête des parcours home, listing, détail, panier et checkout"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+        parser.add_argument('--concurrency', default='1,4,16', help="Niveaux de concurrence, ex. 1,4,16")
+        parser.add_argument('--requests', type=int, default=100, help="Requêtes par scénario et par niveau")
+        parser.add_argument('--warmup', type=int, default=5, help="Requêtes de chauffe (non mesurées) par worker")
+        parser.add_argument('--base-url', default=None, help="Serveur HTTP à tester (scénarios en lecture seule)")
+        parser.add_argument('--asgi', action='store_true',
+                            help="Client de test async sur une boucle asyncio (scénarios en lecture seule)")
+        parser.add_argument('--output', default=None, help="Fichier JSON de résultats (défaut : bench_results/)")
+        parser.add_argument('--compare', default=None, help="Fichier JSON de référence à comparer")
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in options['scenarios'].split(',') if s]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Scénarios inconnus : {', '.join(sorted(unknown))}")
+        if options['base_url'] or options['asgi']:
+            skipped = [s for s in scenarios if s not in READ_ONLY_SCENARIOS]
+            if skipped:
+                mode = 'HTTP' if options['base_url'] else 'ASGI'
+                self.stdout.write(self.style.WARNING(f"Mode {mode} : scénarios ignorés {', '.join(skipped)}"))
+            scenarios = [s for s in scenarios if s in READ_ONLY_SCENARIOS]
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        catalog = {
+            'products': list(Product.objects.filter(quantite_stocks__gt=10).order_by('-ventes_total').values('id', 'slug')),
+            'categories': list(Category.objects.values_list('slug', flat=True)),
+        }
+        if not catalog['products']:
+            raise CommandError("Catalogue vide : lancez d'abord `manage.py seed_shop`.")
+        if not options['base_url']:
+            # Le client de test exige « testserver » dans ALLOWED_HOSTS
+            settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+
+        results = []
+        for scenario in scenarios:
+            for level in levels:
+                result = self.run_scenario(scenario, level, options, catalog)
+                results.append(result)
+                self.print_result(result)
+
+        report = {
+            'meta': self.meta(options),
+            'results': results,
+        }
+        output = options['output'] or self.default_output(report['meta'])
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        Path(output).write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Résultats enregistrés dans {output}"))
+
+        if options['compare']:
+            self.compare(json.loads(Path(options['compare']).read_text()), report)
+
+    def run_scenario(self, scenario, level, options, catalog):
+        if options['asgi'] and not options['base_url']:
+            return self.run_scenario_asgi(scenario, level, options, catalog)
+        per_worker = max(1, options['requests'] // level)
+        timings, query_counts, errors = [], [], []
+        lock = threading.Lock()
+
+        def work(index):
+            worker = Worker(index, options['base_url'], catalog)
+            local_timings, local_queries, local_errors = [], [], []
+            try:
+                for i in range(options['warmup'] + per_worker):
+                    if not options['base_url']:
+                        worker.prepare(scenario)
+                    start = time.perf_counter()
+                    try:
+                        status, queries = worker.run(scenario)
+                    except Exception as exc:
+                        local_errors.append(repr(exc))
+                        continue
+                    elapsed = time.perf_counter() - start
+                    if i < options['warmup']:
+                        continue
+                    expected = EXPECTED_STATUS.get(scenario)
+                    if status >= 400 or (expected and status != expected):
+                        local_errors.append(f"HTTP {status}")
+                    local_timings.append(elapsed)
+                    if queries is not None:
+                        local_queries.append(queries)
+            finally:
+                close_old_connections()
+            with lock:
+                timings.extend(local_timings)
+                query_counts.extend(local_queries)
+                errors.extend(local_errors)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            list(pool.map(work, range(level)))
+        wall = time.perf_counter() - start
+        return self.summarize(scenario, level, timings, query_counts, errors, wall)
+
+    def run_scenario_asgi(self, scenario, level, options, catalog):
+        """N clients concurrents sur une seule boucle asyncio, comme un worker uvicorn"""
+        per_worker = max(1, options['requests'] // level)
+        # Comptes et sessions créés avant la boucle (ORM synchrone)
+        workers = [Worker(index, None, catalog) for index in range(level)]
+        timings, errors = [], []
+
+        async def work(worker):
+            client = AsyncClient()
+            client.cookies = worker.client.cookies
+            for i in range(options['warmup'] + per_worker):
+                method, path, data = worker.build(scenario)
+                start = time.perf_counter()
+                try:
+                    response = await getattr(client, method)(path, data or {})
+                except Exception as exc:
+                    errors.append(repr(exc))
+                    continue
+                elapsed = time.perf_counter() - start
+                if i < options['warmup']:
+                    continue
+                if response.status_code >= 400:
+                    errors.append(f"HTTP {response.status_code}")
+                timings.append(elapsed)
+
+        async def main():
+            await asyncio.gather(*(work(worker) for worker in workers))
+
+        start = time.perf_counter()
+        asyncio.run(main())
+        wall = time.perf_counter() - start
+        return self.summarize(scenario, level, timings, [], errors, wall)
+
+    def summarize(self, scenario, level, timings, query_counts, errors, wall):
+        ms = [t * 1000 for t in timings]
+        return {
+            'scenario': scenario,
+            'concurrency': level,
+            'requests': len(timings),
+            'errors': len(errors),
+            'error_samples': sorted(set(errors))[:5],
+            'p50_ms': percentile(ms, 50),
+            'p95_ms': percentile(ms, 95),
+            'p99_ms': percentile(ms, 99),
+            'max_ms': max(ms) if ms else None,
+            'throughput_rps': len(timings) / wall if wall else None,
+            'queries_per_request': sum(query_counts) / len(query_counts) if query_counts else None,
+        }
+
+    def print_result(self, r):
+        def fmt(value, pattern='{:8.1f}'):
+            return pattern.format(value) if value is not None else '       -'
+        self.stdout.write(
+            f"{r['scenario']:<12} c={r['concurrency']:<3} n={r['requests']:<5} err={r['errors']:<3} "
+            f"p50={fmt(r['p50_ms'])}ms p95={fmt(r['p95_ms'])}ms p99={fmt(r['p99_ms'])}ms "
+            f"{fmt(r['throughput_rps'])} req/s  SQL/req={fmt(r['queries_per_request'], '{:6.1f}')}"
+        )
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                    cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'base_url': options['base_url'],
+            'asgi': options['asgi'],
+            'async_catalog': getattr(settings, 'SHOP_ASYNC_CATALOG', True),
+            'products': Product.objects.count(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
+
+    def default_output(self, meta):
+        stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+        return str(Path(settings.BASE_DIR) / 'bench_results' / f"{stamp}-{meta['commit'] or 'local'}.json")
+
+    def compare(self, before, after):
+        self.stdout.write(f"\nComparaison {before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+        previous = {(r['scenario'], r['concurrency']): r for r in before['results']}
+        for r in after['results']:
+            old = previous.get((r['scenario'], r['concurrency']))
+            if not old:
+                continue
+            parts = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_per_request'):
+                if old.get(key) and r.get(key) is not None:
+                    parts.append(f"{key}={(r[key] - old[key]) / old[key] * 100:+.0f}%")
+            self.stdout.write(f"{r['scenario']:<12} c={r['concurrency']:<3} " + ' '.join(parts))
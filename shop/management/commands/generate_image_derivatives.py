@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from shop.images import backfill
+from shop.models import Category, ProductImage
+
+
+class Command(BaseCommand):
+    help = "Génère les dérivés responsive (WebP/JPEG, placeholder) des images existantes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Régénère aussi les images qui ont déjà leurs dérivés")
+
+    def handle(self, *args, **options):
+        for model in (ProductImage, Category):
+            done = backfill(model, force=options['force'])
+            self.stdout.write(f"{model._meta.verbose_name_plural} : {done} fichier(s) traité(s)")
+        self.stdout.write(self.style.SUCCESS("Dérivés d'images à jour."))
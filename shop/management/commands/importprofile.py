@@ -0,0 +1,105 @@
+"""
+Coût des imports au démarrage d'un worker.
+
+    python manage.py importprofile
+    python manage.py importprofile --limit 30 --check
+
+Lance un interpréteur neuf avec `python -X importtime` qui fait ce que
+fait un worker avant sa première requête (django.setup, application
+ASGI, URLconf, shop.warmup) et affiche :
+- le temps total de démarrage à froid, comparé à SHOP_COLD_START_TARGET_MS ;
+- le coût cumulé par paquet de premier niveau et les modules les plus lents ;
+- les modules de SHOP_LAZY_MODULES importés quand même au démarrage.
+
+--check sort en erreur si l'objectif est dépassé ou si un module « lazy »
+est chargé au démarrage (à brancher en CI).
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import django
+django.setup()
+from config.asgi import application
+from shop.warmup import warm
+warm()
+print(json.dumps({'total_ms': (time.perf_counter() - start) * 1000}))
+"""
+
+# import time:  self [us] | cumulative | imported package
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(stderr):
+    """Retourne [(module, self_us, cumulative_us, profondeur)]"""
+    modules = []
+    for line in stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Mesure le démarrage à froid d'un worker et le coût de chaque import"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=15, help="Nombre de paquets / modules affichés")
+        parser.add_argument('--check', action='store_true',
+                            help="Échoue si l'objectif est dépassé ou si un module lazy est importé")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"Le démarrage a échoué :\n{result.stderr[-2000:]}")
+        total_ms = json.loads(result.stdout.strip().splitlines()[-1])['total_ms']
+        modules = parse_importtime(result.stderr)
+        limit = options['limit']
+
+        by_package = defaultdict(int)
+        for module, self_us, _, _ in modules:
+            by_package[module.split('.')[0]] += self_us
+        imports_ms = sum(by_package.values()) / 1000
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Paquets (temps propre cumulé, {len(modules)} modules) :"))
+        for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:limit]:
+            self.stdout.write(f"  {self_us / 1000:8.1f} ms  {package}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Modules les plus lents (cumulé, imports de premier niveau) :"))
+        top_level = [m for m in modules if m[3] == 0]
+        for module, _, cumulative_us, _ in sorted(top_level, key=lambda m: -m[2])[:limit]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+
+        problems = []
+        loaded = {module.split('.')[0] for module, *_ in modules}
+        for module in getattr(settings, 'SHOP_LAZY_MODULES', []):
+            if module in loaded:
+                problems.append(f"{module} est importé au démarrage (devrait l'être au premier usage)")
+
+        target_ms = getattr(settings, 'SHOP_COLD_START_TARGET_MS', 500)
+        self.stdout.write('')
+        self.stdout.write(f"Imports : {imports_ms:.0f} ms ; démarrage à froid : {total_ms:.0f} ms "
+                          f"(objectif {target_ms} ms)")
+        if total_ms > target_ms:
+            problems.append(f"démarrage à froid de {total_ms:.0f} ms > objectif {target_ms} ms")
+
+        for problem in problems:
+            self.stdout.write(self.style.WARNING(f"  ! {problem}"))
+        if problems and options['check']:
+            raise CommandError(f"{len(problems)} problème(s) au démarrage")
+        if not problems:
+            self.stdout.write(self.style.SUCCESS("Démarrage dans l'objectif."))
@@ -0,0 +1,409 @@
+"""
+Conseiller d'index : rejoue les vues principales, capture leurs requêtes
+SQL, les passe à EXPLAIN et signale les parcours séquentiels et les tris
+sans index.
+
+    python manage.py index_advisor
+    python manage.py index_advisor --path "/products/?sort=price_desc" --verbose
+    python manage.py index_advisor --emit-migration
+
+Les vues sont rejouées dans une transaction annulée (rien n'est écrit) et
+sans cache. Sur PostgreSQL, EXPLAIN est lancé avec enable_seqscan = off :
+un « Seq Scan » restant signifie qu'aucun index ne peut servir, quelle que
+soit la taille de la table. Les suggestions (colonnes d'égalité, puis
+colonne de plage ou de tri) sont ignorées quand un index existant les
+couvre déjà. --emit-migration écrit les AddIndex correspondants : reportez
+les mêmes index dans Meta.indexes (affichés) avant le prochain
+makemigrations.
+"""
+import json
+import re
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, migrations, models, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+
+from shop.models import Category, Order, Product
+from shop.query_budget import normalize_sql
+
+# "table"."colonne" ou alias de sous-requête (U0."colonne")
+_COLUMN_RE = re.compile(
+    r'(?:"(\w+)"|\b(\w+))\."(\w+)"\s*(<=|>=|<>|!=|=|<|>|BETWEEN|LIKE|GLOB|ILIKE|REGEXP|IN|IS)?'
+    r'\s*(\(?\s*(?:"\w+"|\b\w+)\.")?', re.I)
+_ORDER_COLUMN_RE = re.compile(r'(?:"(\w+)"|\b(\w+))\."(\w+)"\s*(ASC|DESC)?', re.I)
+_ALIAS_RE = re.compile(r'"(\w+)"\s+(?:AS\s+)?([A-Z]\d+)\b')
+_JOIN_RE = re.compile(
+    r'JOIN\s+"\w+"(?:\s+\w+)?\s+ON\s+\((?:"(\w+)"|(\w+))\."(\w+)"\s*=\s*(?:"(\w+)"|(\w+))\."(\w+)"\)', re.I)
+_FROM_RE = re.compile(r'\bFROM\s+"(\w+)"', re.I)
+_SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)$')
+_RANGE_OPERATORS = {'<', '>', '<=', '>=', 'BETWEEN'}
+_UNINDEXABLE_OPERATORS = {'LIKE', 'GLOB', 'ILIKE', 'REGEXP'}
+MAX_INDEX_COLUMNS = 3
+
+
+def _clauses(sql):
+    """Retourne (WHERE, ORDER BY) de la requête principale (texte brut)"""
+    upper = sql.upper()
+    where_at = upper.find(' WHERE ')
+    order_at = upper.rfind(' ORDER BY ')
+    where = ''
+    if where_at != -1:
+        end = len(sql)
+        for keyword in (' GROUP BY ', ' ORDER BY ', ' LIMIT '):
+            position = upper.find(keyword, where_at)
+            if position != -1:
+                end = min(end, position)
+        where = sql[where_at + 7:end]
+    order = ''
+    if order_at != -1:
+        limit_at = upper.find(' LIMIT ', order_at)
+        order = sql[order_at + 10:limit_at if limit_at != -1 else len(sql)]
+    return where, order
+
+
+def _in_function(text, position):
+    """Vrai si la colonne en `position` est un argument de fonction (LOWER(...), extract...)"""
+    depth = 0
+    for index in range(position - 1, -1, -1):
+        char = text[index]
+        if char == ')':
+            depth += 1
+        elif char == '(':
+            if depth:
+                depth -= 1
+            elif index and (text[index - 1].isalnum() or text[index - 1] == '_'):
+                return True
+    return False
+
+
+def resolve_alias(sql, name):
+    """Alias de sous-requête (U0, T3) -> table"""
+    for table, alias in _ALIAS_RE.findall(sql):
+        if alias == name:
+            return table
+    return name
+
+
+def suggest_columns(sql, table, reference=None):
+    """
+    Colonnes d'un index composite pour `table` (désignée par `reference`
+    si c'est un alias) : égalités d'abord, puis une plage ou les colonnes de
+    tri (préfixées de '-' si DESC).
+    """
+    reference = reference or table
+    where, order = _clauses(sql)
+    equality, ranges = [], []
+    # Jointure filtrée sur l'autre table (categorie__slug=...) : la clé étrangère compte comme une égalité
+    for left, left_alias, left_column, right, right_alias, right_column in _JOIN_RE.findall(sql):
+        sides = ((left or left_alias, left_column), (right or right_alias, right_column))
+        for (name, column), (other, _) in (sides, sides[::-1]):
+            if name == reference and re.search(rf'(?:"{other}"|\b{other})\."', where) and column not in equality:
+                equality.append(column)
+    for match in _COLUMN_RE.finditer(where):
+        quoted, alias, column, operator, operand_column = match.groups()
+        if (quoted or alias) != reference or _in_function(where, match.start()):
+            # Colonne d'une autre table ou passée à une fonction : hors sujet
+            continue
+        operator = (operator or '').upper()
+        previous = where[:match.start()].rstrip(' (')[-1:]
+        if operator in _UNINDEXABLE_OPERATORS or operand_column or (previous and previous in '=<>'):
+            # LIKE '%...%', comparaison entre deux colonnes
+            continue
+        target = ranges if operator in _RANGE_OPERATORS else equality
+        if column not in equality and column not in target:
+            target.append(column)
+    columns = list(equality)
+    if ranges:
+        columns.append(ranges[0])
+    else:
+        for quoted, alias, column, direction in _ORDER_COLUMN_RE.findall(order):
+            if (quoted or alias) != reference:
+                break
+            if column not in equality:
+                columns.append(f"-{column}" if direction.upper() == 'DESC' else column)
+    return columns[:MAX_INDEX_COLUMNS]
+
+
+class Finding:
+    def __init__(self, table, reference, kind, detail):
+        self.table = table
+        self.reference = reference  # nom ou alias de la table dans la requête
+        self.kind = kind  # 'scan' ou 'sort'
+        self.detail = detail
+        self.shapes = {}
+        self.paths = set()
+
+
+class Command(BaseCommand):
+    help = "Rejoue les vues, passe leurs requêtes à EXPLAIN et propose les index manquants"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', default=[], help="URL supplémentaire à rejouer (répétable)")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Base sur laquelle lancer EXPLAIN")
+        parser.add_argument('--min-rows', type=int, default=500,
+                            help="Pas de suggestion pour les tables plus petites (parcours complet normal)")
+        parser.add_argument('--emit-migration', action='store_true', help="Écrit une migration AddIndex pour shop")
+        parser.add_argument('--verbose', action='store_true', help="Affiche les plans et requêtes")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"Base non prise en charge : {connection.vendor}")
+        self.verbose = options['verbose']
+
+        captured = self.capture(options['path'])
+        if not captured:
+            raise CommandError("Aucune requête capturée : base vide ? (voir `manage.py seed_shop`)")
+        self.stdout.write(f"{sum(len(v['paths']) for v in captured.values())} exécutions, "
+                          f"{len(captured)} formes de requêtes distinctes ({connection.vendor})")
+
+        findings = self.explain_all(connection, captured)
+        suggestions = self.report(connection, findings, options['min_rows'])
+        if options['emit_migration']:
+            self.emit_migration(suggestions)
+
+    # --- 1. Capture ---
+
+    def scenario_paths(self):
+        paths = ['/', '/products/', '/products/?sort=price_asc', '/products/?sort=popular', '/products/?sort=rating',
+                 '/products/?search=pro']
+        category = Category.objects.annotate(n=Count('products')).order_by('-n').first()
+        if category:
+            paths.append(f'/products/?category={category.slug}')
+        product = Product.objects.order_by('-ventes_total').first()
+        if product:
+            paths.append(f'/products/{product.slug}/')
+            paths.append(f'/products/{product.id}/avis/')
+        paths += ['/cart/', '/mes-commandes/']
+        order = Order.objects.order_by('-id').first()
+        if order:
+            paths.append(f'/dashboard/orders/lookup/?q={order.email}')
+            paths.append(f'/dashboard/orders/lookup/?q={order.full_name.split()[0]}')
+        paths += ['/admin/', '/admin/shop/order/', '/admin/shop/order/?status=PENDING', '/admin/shop/product/']
+        return paths
+
+    def capture(self, extra_paths):
+        captured = {}
+
+        def wrapper(execute, sql, params, many, context):
+            # Seules les requêtes émises par les vues comptent (pas la connexion du client)
+            if current['path'] and not many and sql.lstrip().upper().startswith('SELECT'):
+                entry = captured.setdefault(normalize_sql(sql), {'sql': sql, 'params': params, 'paths': []})
+                entry['paths'].append(current['path'])
+            return execute(sql, params, many, context)
+
+        current = {'path': None}
+        dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        # Transaction annulée à la fin : les vues peuvent écrire (panier, compteurs...) sans effet
+        with override_settings(CACHES=dummy_cache, ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver']), \
+                transaction.atomic():
+            customer = (User.objects.annotate(n=Count('orders')).filter(n__gt=0).order_by('-n').first()
+                        or User.objects.first())
+            staff = User.objects.create_superuser('index-advisor', 'index-advisor@example.ga', None)
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(wrapper))
+                for path in self.scenario_paths() + list(extra_paths):
+                    client = Client()
+                    is_admin = path.startswith(('/admin/', '/dashboard/'))
+                    user = staff if is_admin else customer
+                    if user:
+                        client.force_login(user)
+                    current['path'] = path
+                    response = client.get(path)
+                    current['path'] = None
+                    if self.verbose:
+                        self.stdout.write(f"  GET {path} -> {response.status_code}")
+            transaction.set_rollback(True)
+        return captured
+
+    # --- 2. EXPLAIN ---
+
+    def explain_all(self, connection, captured):
+        findings = {}
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                for shape, entry in captured.items():
+                    try:
+                        problems = self.explain(connection, cursor, entry['sql'], entry['params'])
+                    except Exception as exc:
+                        if self.verbose:
+                            self.stdout.write(self.style.WARNING(f"EXPLAIN impossible : {exc}\n  {entry['sql'][:200]}"))
+                        continue
+                    for table, reference, kind, detail in problems:
+                        finding = findings.setdefault((table, kind, shape), Finding(table, reference, kind, detail))
+                        finding.shapes[shape] = entry['sql']
+                        finding.paths.update(entry['paths'])
+            transaction.set_rollback(True, using=connection.alias)
+        return findings
+
+    def explain(self, connection, cursor, sql, params):
+        """Retourne [(table, nom ou alias dans la requête, 'scan' | 'sort', détail du plan)]"""
+        problems = []
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            main = _FROM_RE.search(sql)
+            for row in cursor.fetchall():
+                detail = row[-1]
+                match = _SQLITE_SCAN_RE.match(detail)
+                if match and 'USING' not in match.group(2):
+                    problems.append((resolve_alias(sql, match.group(1)), match.group(1), 'scan', detail))
+                elif 'TEMP B-TREE FOR ORDER BY' in detail and main:
+                    problems.append((main.group(1), main.group(1), 'sort', detail))
+            return problems
+
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        def relations(node):
+            found = [(node['Relation Name'], node.get('Alias'))] if 'Relation Name' in node else []
+            for child in node.get('Plans', []):
+                found += relations(child)
+            return found
+
+        def walk(node):
+            if node['Node Type'] == 'Seq Scan':
+                problems.append((node['Relation Name'], node.get('Alias', node['Relation Name']), 'scan',
+                                 f"Seq Scan {node.get('Filter', '')}".strip()))
+            elif node['Node Type'] == 'Sort':
+                for relation, alias in relations(node)[:1]:
+                    problems.append((relation, alias or relation, 'sort', f"Sort {', '.join(node.get('Sort Key', []))}"))
+            for child in node.get('Plans', []):
+                walk(child)
+
+        walk(plan[0]['Plan'])
+        return problems
+
+    # --- 3. Rapport ---
+
+    def table_rows(self, connection, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+                row = cursor.fetchone()
+                return max(row[0], 0) if row else 0
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
+
+    def existing_indexes(self, connection, table):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        indexes, unique = [], set()
+        for constraint in constraints.values():
+            if constraint.get('index') or constraint.get('unique') or constraint.get('primary_key'):
+                columns = [column for column in constraint['columns'] if column]
+                indexes.append(columns)
+                if len(columns) == 1 and (constraint.get('unique') or constraint.get('primary_key')):
+                    unique.add(columns[0])
+        return indexes, unique
+
+    def report(self, connection, findings, min_rows):
+        models_by_table = {model._meta.db_table: model for model in apps.get_models()}
+        by_table = defaultdict(list)
+        for finding in findings.values():
+            by_table[finding.table].append(finding)
+
+        suggestions = {}
+        for table in sorted(by_table):
+            model = models_by_table.get(table)
+            if model is None:
+                # Tables internes (sqlite_master, index plein texte...)
+                continue
+            rows = self.table_rows(connection, table)
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{model._meta.label} ({table}) : {rows} lignes"))
+            existing, unique = self.existing_indexes(connection, table)
+            for finding in by_table[table]:
+                paths = ', '.join(sorted(finding.paths)[:4])
+                kind = "parcours séquentiel" if finding.kind == 'scan' else "tri sans index"
+                self.stdout.write(f"  {kind} : {finding.detail}  [{paths}]")
+                sql = next(iter(finding.shapes.values()))
+                if self.verbose:
+                    self.stdout.write(f"    {sql[:400]}")
+                columns = suggest_columns(sql, table, finding.reference)
+                if not columns:
+                    self.stdout.write("    -> aucun filtre ni tri indexable (lecture complète attendue)")
+                    continue
+                plain = [c.lstrip('-') for c in columns]
+                if plain[0] in unique:
+                    self.stdout.write("    -> recherche par clé unique, rien à ajouter")
+                    continue
+                if any(index[:len(plain)] == plain for index in existing):
+                    self.stdout.write(f"    -> index existant sur ({', '.join(plain)}) non retenu par le planificateur")
+                    continue
+                if rows < min_rows:
+                    self.stdout.write(f"    -> ({', '.join(columns)}) : table trop petite (< {min_rows}), ignoré")
+                    continue
+                fields = self.field_names(model, columns)
+                if fields:
+                    suggestions.setdefault((model, tuple(fields)), None)
+                    self.stdout.write(self.style.WARNING(f"    -> index suggéré : {model.__name__}({', '.join(fields)})"))
+
+        self.stdout.write('')
+        if not suggestions:
+            self.stdout.write(self.style.SUCCESS("Aucun index manquant détecté."))
+            return []
+
+        def plain(fields):
+            return [field.lstrip('-') for field in fields]
+
+        # (status) est inutile si (status, -created_at, -id) est aussi proposé
+        kept = [
+            (model, fields) for model, fields in suggestions
+            if not any(other_model is model and len(other) > len(fields) and plain(other)[:len(fields)] == plain(fields)
+                       for other_model, other in suggestions)
+        ]
+        indexes = []
+        self.stdout.write(self.style.MIGRATE_HEADING("À ajouter dans Meta.indexes :"))
+        for model, fields in kept:
+            index = models.Index(fields=list(fields), name='')
+            index.set_name_with_model(model)
+            indexes.append((model, index))
+            self.stdout.write(f"  {model.__name__}: models.Index(fields={list(fields)!r}, name={index.name!r}),")
+        return indexes
+
+    def field_names(self, model, columns):
+        """Colonnes SQL -> noms de champs du modèle (None si une colonne est inconnue)"""
+        by_column = {field.column: field.name for field in model._meta.concrete_fields}
+        fields = []
+        for column in columns:
+            descending = column.startswith('-')
+            name = by_column.get(column.lstrip('-'))
+            if name is None:
+                return None
+            fields.append(f"-{name}" if descending else name)
+        return fields
+
+    # --- 4. Migration ---
+
+    def emit_migration(self, indexes):
+        shop_indexes = [(model, index) for model, index in indexes if model._meta.app_label == 'shop']
+        if not shop_indexes:
+            self.stdout.write("Pas de migration à écrire.")
+            return
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        leaf = loader.graph.leaf_nodes('shop')[0]
+        number = int(leaf[1].split('_')[0]) + 1
+        migration = migrations.Migration(f"{number:04d}_advisor_indexes", 'shop')
+        migration.dependencies = [leaf]
+        migration.operations = [
+            migrations.AddIndex(model_name=model._meta.model_name, index=index) for model, index in shop_indexes
+        ]
+        writer = MigrationWriter(migration)
+        with open(writer.path, 'w', encoding='utf-8') as handle:
+            handle.write(writer.as_string())
+        self.stdout.write(self.style.SUCCESS(f"Migration écrite : {writer.path}"))
+        self.stdout.write("Reportez les index ci-dessus dans Meta.indexes pour que makemigrations reste stable.")
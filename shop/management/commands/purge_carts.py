@@ -0,0 +1,101 @@
+"""
+Supprime les paniers vides ou abandonnés (sans activité depuis N jours).
+
+    python manage.py purge_carts                      # SHOP_CART_RETENTION_DAYS
+    python manage.py purge_carts --days 30 --stats paniers.json
+    python manage.py purge_carts --dry-run
+
+Avant suppression, les paniers abandonnés (non vides) sont résumés pour le
+marketing : nombre, clients, articles, valeur au prix catalogue et produits
+les plus délaissés. Suppression par lots (une transaction courte chacun) sur
+l'index shop_cart_updated_idx.
+"""
+import datetime
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from shop.models import Cart, CartItem
+
+TOP_PRODUCTS = 10
+
+
+class Command(BaseCommand):
+    help = "Supprime les paniers vides ou abandonnés et publie les statistiques d'abandon"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Jours sans activité (défaut : SHOP_CART_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--stats', help="Écrit aussi les statistiques d'abandon dans ce fichier JSON")
+        parser.add_argument('--dry-run', action='store_true', help="Statistiques seules, rien n'est supprimé")
+
+    def handle(self, *args, **options):
+        days = settings.SHOP_CART_RETENTION_DAYS if options['days'] is None else options['days']
+        if days < 1:
+            raise CommandError("--days doit être strictement positif")
+        before = timezone.now() - datetime.timedelta(days=days)
+        stale = Cart.objects.filter(updated_at__lt=before)
+
+        stats = self.abandoned_stats(stale, before, days)
+        self.report(stats)
+        if options['stats']:
+            with open(options['stats'], 'w', encoding='utf-8') as output:
+                json.dump(stats, output, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2)
+
+        if options['dry_run']:
+            return
+        deleted = 0
+        while True:
+            ids = list(stale.order_by('updated_at').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            with transaction.atomic():
+                # Revérifié : un panier réactivé entre-temps est conservé (ses articles partent en cascade sinon)
+                _, counts = Cart.objects.filter(id__in=ids, updated_at__lt=before).delete()
+            deleted += counts.get(Cart._meta.label, 0)
+        self.stdout.write(self.style.SUCCESS(f"{deleted} paniers supprimés (inactifs depuis {days} jours)."))
+
+    def abandoned_stats(self, stale, before, days):
+        """Résumé des paniers non vides sur le point d'être supprimés (deux requêtes)"""
+        items = CartItem.objects.filter(cart__in=stale)
+        line_value = ExpressionWrapper(
+            F('quantity') * (F('product__prix') + F('variant__price_delta')),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+        totals = items.aggregate(
+            paniers=Count('cart', distinct=True),
+            clients=Count('cart__user', distinct=True),
+            articles=Sum('quantity'),
+            valeur=Sum(line_value),
+        )
+        top = items.values('product_id', 'product__nom').annotate(
+            quantite=Sum('quantity'), paniers=Count('cart', distinct=True),
+        ).order_by('-quantite')[:TOP_PRODUCTS]
+        return {
+            'date': timezone.now(),
+            'inactifs_depuis': before,
+            'jours': days,
+            'paniers_inactifs': stale.count(),
+            'paniers_abandonnes': totals['paniers'],
+            'clients': totals['clients'],
+            'articles': totals['articles'] or 0,
+            'valeur': totals['valeur'] or 0,
+            'produits': [
+                {'id': row['product_id'], 'nom': row['product__nom'], 'quantite': row['quantite'], 'paniers': row['paniers']}
+                for row in top
+            ],
+        }
+
+    def report(self, stats):
+        self.stdout.write(
+            f"{stats['paniers_inactifs']} paniers inactifs depuis {stats['jours']} jours, dont "
+            f"{stats['paniers_abandonnes']} abandonnés ({stats['clients']} clients, {stats['articles']} articles, "
+            f"{stats['valeur']} FCFA au prix catalogue)."
+        )
+        for product in stats['produits']:
+            self.stdout.write(f"  {product['nom']} : {product['quantite']} dans {product['paniers']} paniers")
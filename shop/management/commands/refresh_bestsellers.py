@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from shop.bestsellers import rebuild, refresh_windows
+
+
+class Command(BaseCommand):
+    help = "Fait glisser les fenêtres 7j / 30j du classement des meilleures ventes (à lancer chaque nuit)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recalcule tous les compteurs depuis l'historique des commandes")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuild()
+        else:
+            refresh_windows()
+        self.stdout.write(self.style.SUCCESS("Classement des meilleures ventes mis à jour."))
@@ -0,0 +1,326 @@
+"""
+Génère un jeu de données réaliste pour reproduire la production en local.
+
+    python manage.py seed_shop --products 5000 --users 2000 --orders 20000
+
+Tout passe par bulk_create (quelques secondes pour des dizaines de
+milliers de lignes). Les distributions imitent une vraie boutique :
+popularité des produits en loi de Zipf, prix log-normaux, clients
+réguliers minoritaires mais très actifs, commandes étalées dans le temps.
+"""
+import datetime
+import io
+import itertools
+import random
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from shop import api, autocomplete, bestsellers, images, pricing, reviews, shipping
+from shop.models import (
+    Capacity, Cart, CartItem, Category, Color, DeliveryZone, Order, OrderItem, Product, ProductImage,
+    ProductVariant, PromotionRule, Review, Size, SubCategory, normalize_phone,
+)
+
+CATEGORY_NAMES = [
+    'Smartphones', 'Ordinateurs', 'Tablettes', 'Audio', 'Montres connectées', 'Accessoires',
+    'Gaming', 'Photo', 'Télévisions', 'Électroménager', 'Réseau', 'Stockage',
+]
+BRANDS = ['Samsung', 'Apple', 'Xiaomi', 'Tecno', 'Infinix', 'HP', 'Lenovo', 'Sony', 'JBL', 'Huawei', 'Oppo', 'Dell']
+ADJECTIVES = ['Pro', 'Max', 'Lite', 'Ultra', 'Plus', 'Mini', 'Neo', 'Air', 'Edge', 'X']
+ZONES = ['Libreville', 'Akanda', 'Owendo', 'Ntoum', 'Port-Gentil', 'Franceville', 'Oyem', 'Lambaréné']
+# Zone : (quartiers rattachés, frais de base, jours supplémentaires)
+ZONE_RULES = {
+    'Libreville': ('Louis\nNzeng-Ayong\nGlass\nAkébé\nNombakélé', 0, 0),
+    'Akanda': ('Angondjé\nCap Estérias', 500, 0),
+    'Owendo': ('', 500, 0),
+    'Ntoum': ('', 1500, 1),
+    'Port-Gentil': ('', 3000, 2),
+    'Franceville': ('Moanda', 5000, 4),
+    'Oyem': ('Bitam', 5000, 4),
+    'Lambaréné': ('', 3500, 3),
+}
+COLORS = [('Noir', '#000000'), ('Blanc', '#FFFFFF'), ('Bleu', '#1E40AF'), ('Rouge', '#DC2626'), ('Or', '#D4AF37')]
+SIZES = ['S', 'M', 'L', 'XL']
+CAPACITIES = ['64 Go', '128 Go', '256 Go', '512 Go', '1 To']
+FIRST_NAMES = ['Jean', 'Marie', 'Paul', 'Aïcha', 'Christelle', 'Rodrigue', 'Sandrine', 'Ulrich', 'Grâce', 'Loïc']
+LAST_NAMES = ['Mba', 'Nzé', 'Obiang', 'Ndong', 'Moussavou', 'Ondo', 'Bongo', 'Mintsa', 'Essono', 'Koumba']
+COMMENTS = [
+    "Très bon produit, livraison rapide.", "Conforme à la description.", "Un peu cher mais de qualité.",
+    "Je recommande !", "Déçu par l'autonomie.", "Parfait pour le travail.", "Emballage soigné.",
+]
+STATUS_WEIGHTS = {'PENDING': 15, 'PAID': 20, 'SHIPPED': 15, 'DELIVERED': 40, 'CANCELLED': 10}
+
+
+def zipf_weights(n, s=1.1):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+class Command(BaseCommand):
+    help = "Génère catégories, produits (images, variantes, zones), clients, paniers, avis et commandes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=8)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--carts', type=int, default=100, help="Nombre de clients avec un panier rempli")
+        parser.add_argument('--reviews', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=365, help="Période couverte par les commandes")
+        parser.add_argument('--images', type=int, default=12, help="Nombre d'images distinctes générées")
+        parser.add_argument('--seed', type=int, default=None, help="Graine aléatoire (résultats reproductibles)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Suffixe propre à ce lancement : on peut semer plusieurs fois sans collision de slug
+        self.tag = uuid.UUID(int=self.rng.getrandbits(128)).hex[:6]
+
+        with transaction.atomic():
+            categories, subcategories = self.seed_categories(options['categories'])
+            zones, colors, sizes, capacities = self.seed_references()
+            products = self.seed_products(options['products'], categories, subcategories)
+            self.seed_images(products, options['images'])
+            self.seed_promotions(categories)
+            self.seed_variants(products, zones, colors, sizes, capacities)
+            users = self.seed_users(options['users'])
+            weights = zipf_weights(len(products))
+            self.seed_carts(users[:options['carts']], products, weights)
+            self.seed_reviews(options['reviews'], users, products, weights)
+            self.seed_orders(options['orders'], options['days'], users, products, weights, zones)
+            bestsellers.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Données générées (lot {self.tag}) : {len(categories)} catégories, {len(products)} produits, "
+            f"{len(users)} clients, {options['reviews']} avis, {options['orders']} commandes."
+        ))
+
+    def bulk(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    # --- Catalogue ---
+
+    def seed_categories(self, count):
+        names = [CATEGORY_NAMES[i % len(CATEGORY_NAMES)] + (f" {i // len(CATEGORY_NAMES) + 1}" if i >= len(CATEGORY_NAMES) else '')
+                 for i in range(count)]
+        categories = self.bulk(Category, [
+            Category(name=f"{name} {self.tag}", slug=slugify(f"{name}-{self.tag}"), desc=f"Univers {name}")
+            for name in names
+        ])
+        subcategories = self.bulk(SubCategory, [
+            SubCategory(category=category, name=f"Gamme {i + 1}") for category in categories for i in range(3)
+        ])
+        return categories, subcategories
+
+    def seed_references(self):
+        zones = [
+            DeliveryZone.objects.get_or_create(name=name, defaults=dict(
+                zip(('villes', 'frais_base', 'delai_supplementaire'), ZONE_RULES[name])))[0]
+            for name in ZONES
+        ]
+        colors = [Color.objects.get_or_create(name=name, defaults={'code_hex': code})[0] for name, code in COLORS]
+        sizes = [Size.objects.get_or_create(name=name)[0] for name in SIZES]
+        capacities = [Capacity.objects.get_or_create(name=name)[0] for name in CAPACITIES]
+        return zones, colors, sizes, capacities
+
+    def seed_products(self, count, categories, subcategories):
+        rng = self.rng
+        now = timezone.now()
+        products = []
+        for i in range(count):
+            category = rng.choice(categories)
+            brand = rng.choice(BRANDS)
+            nom = f"{brand} {category.name.split()[0]} {rng.choice(ADJECTIVES)} {i + 1}"
+            prix = Decimal(round(rng.lognormvariate(11.5, 0.9), -2) or 5000)
+            en_promo = rng.random() < 0.15
+            products.append(Product(
+                nom=nom,
+                slug=slugify(f"{nom}-{self.tag}"),
+                categorie=category,
+                subcategorie=rng.choice([s for s in subcategories if s.category_id == category.id]),
+                etat='neuf' if rng.random() < 0.85 else 'occasion',
+                marque=brand,
+                description_courte=f"{nom} : performances et fiabilité au meilleur prix.",
+                description_longue=f"Découvrez le {nom}. " * 10,
+                caracteristiques="Garantie constructeur\nLivraison rapide",
+                prix=prix,
+                prix_achat=(prix * Decimal('0.7')).quantize(Decimal('1')),
+                prix_promotionnel=(prix * Decimal('0.85')).quantize(Decimal('1')) if en_promo else None,
+                date_debut_promo=now - datetime.timedelta(days=5) if en_promo else None,
+                date_fin_promo=now + datetime.timedelta(days=rng.randint(1, 30)) if en_promo else None,
+                # ~5 % en rupture, ~10 % sous le seuil d'alerte
+                quantite_stocks=rng.choices([0, rng.randint(1, 5), rng.randint(10, 500)], [1, 2, 17])[0],
+                frais_livraison_fixe=Decimal(rng.choice([0, 1000, 2000, 3500, 5000])),
+                livraison_gratuite=rng.random() < 0.2,
+                delai_min=1,
+                delai_max=rng.choice([2, 3, 5, 7]),
+            ))
+        products = self.bulk(Product, products)
+        # date_ajout est en auto_now_add : on étale les dates après coup
+        for product in products:
+            product.date_ajout = now - datetime.timedelta(days=rng.randint(0, 720), minutes=rng.randint(0, 1440))
+        Product.objects.bulk_update(products, ['date_ajout'], batch_size=self.batch_size)
+        return products
+
+    def seed_promotions(self, categories):
+        # Soldes en cours sur une marque et une catégorie, une opération à venir sur tout le catalogue
+        rng = self.rng
+        now = timezone.now()
+        category = rng.choice(categories)
+        brand = rng.choice(BRANDS)
+        self.bulk(PromotionRule, [
+            PromotionRule(nom=f"Semaine {brand} {self.tag}", type_remise='POURCENT', valeur=Decimal(10), marque=brand,
+                          date_debut=now - datetime.timedelta(days=2), date_fin=now + datetime.timedelta(days=5)),
+            PromotionRule(nom=f"Soldes {category.name}", type_remise='POURCENT', valeur=Decimal(20), categorie=category,
+                          date_debut=now - datetime.timedelta(days=1), date_fin=now + datetime.timedelta(days=10),
+                          priorite=1),
+            PromotionRule(nom=f"Black Friday {self.tag}", type_remise='MONTANT', valeur=Decimal(5000),
+                          date_debut=now + datetime.timedelta(days=30), date_fin=now + datetime.timedelta(days=33)),
+        ])
+        # bulk_create ne déclenche pas post_save : index des règles recompilé après le commit
+        transaction.on_commit(pricing.invalidate)
+
+    def seed_images(self, products, distinct):
+        # Quelques images générées une seule fois puis partagées (pas d'envoi massif vers le stockage)
+        from PIL import Image
+
+        names = []
+        for i in range(distinct):
+            buffer = io.BytesIO()
+            color = tuple(self.rng.randint(40, 220) for _ in range(3))
+            Image.new('RGB', (800, 600), color).save(buffer, format='JPEG', quality=80)
+            names.append(default_storage.save(f'products/images/seed-{self.tag}-{i}.jpg', ContentFile(buffer.getvalue())))
+        self.bulk(ProductImage, [
+            ProductImage(product=product, image=self.rng.choice(names))
+            for product in products for _ in range(self.rng.randint(1, 4))
+        ])
+        # bulk_create ne déclenche pas post_save : dérivés responsive générés une fois par fichier
+        images.backfill(ProductImage)
+
+    def seed_variants(self, products, zones, colors, sizes, capacities):
+        rng = self.rng
+        through = Product.zones_livraison.through
+        zone_links, variants = [], []
+        for product in products:
+            # ~30 % des produits réservés à quelques zones (toujours Libreville), les autres livrables partout
+            if rng.random() < 0.3:
+                zone_links += [through(product_id=product.id, deliveryzone_id=zone.id)
+                               for zone in [zones[0], *rng.sample(zones[1:], rng.randint(0, len(zones) - 2))]]
+            # Une variante par combinaison proposée, le stock du produit réparti entre elles
+            combinations = list(itertools.product(
+                rng.sample(colors, rng.choice([0, 0, 1, 2, 3])) or [None],
+                rng.sample(sizes, rng.choice([0, 0, 0, 2, 4])) or [None],
+                rng.sample(capacities, rng.choice([0, 0, 2, 3])) or [None],
+            ))
+            share, extra = divmod(product.quantite_stocks, len(combinations))
+            for i, (color, size, capacity) in enumerate(combinations):
+                variant = ProductVariant(
+                    product=product, color=color, size=size, capacity=capacity, stock=share + (i < extra),
+                    price_delta=Decimal(500 * i) if capacity else Decimal(0),
+                )
+                variant.sku = variant.build_sku()
+                variants.append(variant)
+        self.bulk(through, zone_links)
+        # bulk_create ne déclenche pas les signaux : matrice de livraison, ETag de l'API et suggestions renouvelés après le commit
+        transaction.on_commit(shipping.invalidate)
+        transaction.on_commit(api.invalidate)
+        transaction.on_commit(autocomplete.invalidate)
+        self.variants = defaultdict(list)
+        for variant in self.bulk(ProductVariant, variants):
+            self.variants[variant.product_id].append(variant)
+
+    # --- Clients ---
+
+    def seed_users(self, count):
+        password = make_password('nexus-seed')  # un seul hachage pour tous les comptes
+        users = self.bulk(User, [
+            User(username=f"client-{self.tag}-{i}", email=f"client{i}.{self.tag}@example.ga", password=password,
+                 first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES))
+            for i in range(count)
+        ])
+        return users
+
+    def seed_carts(self, users, products, weights):
+        # Un panier naît au premier ajout : ici, chaque client a déjà un panier rempli
+        carts = self.bulk(Cart, [Cart(user=user) for user in users])
+        items = []
+        for cart in carts:
+            for product in set(self.rng.choices(products, weights, k=self.rng.randint(1, 5))):
+                items.append(CartItem(cart=cart, product=product, variant=self.rng.choice(self.variants[product.id]),
+                                      quantity=self.rng.randint(1, 3)))
+        self.bulk(CartItem, items)
+
+    def seed_reviews(self, count, users, products, weights):
+        rating_weights = [5, 5, 10, 30, 50]
+        created = self.bulk(Review, [
+            Review(product=product, user=self.rng.choice(users),
+                   rating=self.rng.choices(range(1, 6), rating_weights)[0], comment=self.rng.choice(COMMENTS))
+            for product in self.rng.choices(products, weights, k=count)
+        ])
+        now = timezone.now()
+        for review in created:
+            review.created_at = now - datetime.timedelta(days=self.rng.randint(0, 365))
+        Review.objects.bulk_update(created, ['created_at'], batch_size=self.batch_size)
+        # bulk_create ne déclenche pas les signaux : agrégats recalculés en une requête
+        reviews.rebuild()
+
+    def seed_orders(self, count, days, users, products, weights, zones):
+        rng = self.rng
+        now = timezone.now()
+        zones_by_name = {zone.name: zone for zone in zones}
+        # Clients réguliers : quelques-uns passent beaucoup de commandes (Pareto)
+        user_weights = [rng.paretovariate(1.2) for _ in users]
+        statuses, status_weights = zip(*STATUS_WEIGHTS.items())
+        orders, lines = [], []
+        for i in range(count):
+            user = rng.choices(users, user_weights)[0]
+            status = rng.choices(statuses, status_weights)[0]
+            phone = f"+241 0{rng.choice([6, 7])}{rng.randint(1000000, 9999999)}"
+            created_at = now - datetime.timedelta(days=rng.random() ** 1.5 * days)  # plus dense récemment
+            picked = set(rng.choices(products, weights, k=rng.choices([1, 2, 3, 4], [55, 25, 12, 8])[0]))
+            order_lines = [(product, rng.choice(self.variants[product.id]), rng.choices([1, 2, 3], [80, 15, 5])[0])
+                           for product in picked]
+            city = rng.choices(ZONES, [50, 10, 10, 5, 10, 5, 5, 5])[0]
+            zone = zones_by_name[city]
+            shipping = max(product.frais_livraison_fixe for product in picked) + zone.frais_base
+            total = sum((product.prix + variant.price_delta) * qty for product, variant, qty in order_lines) + shipping
+            orders.append(Order(
+                user=user,
+                full_name=f"{user.first_name} {user.last_name}",
+                email=user.email,
+                phone=phone,
+                phone_normalized=normalize_phone(phone),
+                address=f"Quartier {rng.randint(1, 99)}, BP {rng.randint(100, 9999)}",
+                city=city,
+                zone=zone,
+                delai_min=max(product.delai_min for product in picked) + zone.delai_supplementaire,
+                delai_max=max(product.delai_max for product in picked) + zone.delai_supplementaire,
+                total_amount=total,
+                shipping_cost=shipping,
+                status=status,
+                is_paid=status in ('PAID', 'SHIPPED', 'DELIVERED'),
+                order_key=uuid.uuid4().hex,
+                reference=f"NEX-{created_at.year}-{uuid.UUID(int=rng.getrandbits(128)).hex[:8].upper()}",
+            ))
+            lines.append((created_at, order_lines))
+
+        orders = self.bulk(Order, orders)
+        for order, (created_at, _) in zip(orders, lines):
+            order.created_at = created_at
+        Order.objects.bulk_update(orders, ['created_at'], batch_size=self.batch_size)
+        self.bulk(OrderItem, [
+            OrderItem(order=order, product=product, variant=variant, price=product.prix + variant.price_delta,
+                      quantity=qty, color=variant.color and variant.color.name, size=variant.size and variant.size.name,
+                      capacity=variant.capacity and variant.capacity.name)
+            for order, (_, order_lines) in zip(orders, lines) for product, variant, qty in order_lines
+        ])
@@ -0,0 +1,163 @@
+"""
+Synchronise stocks et prix depuis le fichier quotidien d'un fournisseur.
+
+    python manage.py sync_stock fournisseur.csv
+    python manage.py sync_stock fournisseur.csv --delimiter ";" --dry-run
+    cat fournisseur.csv | python manage.py sync_stock -
+
+Colonnes : sku (ProductVariant.sku), stock, prix (facultatif, prix catalogue
+du produit : identique pour toutes ses variantes). Le fichier est lu en
+flux, ligne à ligne, et comparé à un instantané des SKU pris en une
+requête : seules les lignes réellement différentes sont écrites, par
+bulk_update en lots. Les produits non modifiés gardent leur
+date_modification (ETag de l'API et caches qui en dépendent restent valides).
+"""
+import csv
+import io
+import re
+import sys
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from shop import inventory
+from shop.models import Product, ProductVariant
+
+REQUIRED_COLUMNS = {'sku', 'stock'}
+
+
+def parse_price(value):
+    """« 12 500,00 » ou « 12500.00 » -> Decimal('12500.00') ; vide -> None"""
+    value = re.sub(r'\s', '', value or '').replace(',', '.')
+    if not value:
+        return None
+    price = Decimal(value)
+    if price < 0:
+        raise InvalidOperation
+    return price.quantize(Decimal('0.01'))
+
+
+class Command(BaseCommand):
+    help = "Met à jour stocks et prix depuis un CSV fournisseur (seules les lignes modifiées sont écrites)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier CSV, ou - pour l'entrée standard")
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Affiche le bilan sans rien écrire")
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.counts = dict.fromkeys(['lignes', 'inchangées', 'inconnues', 'invalides', 'stocks', 'prix'], 0)
+        self.snapshot()
+
+        if options['path'] == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding=options['encoding'], newline='')
+            stock_changes, price_changes = self.diff(stream, options['delimiter'])
+        else:
+            try:
+                with open(options['path'], encoding=options['encoding'], newline='') as stream:
+                    stock_changes, price_changes = self.diff(stream, options['delimiter'])
+            except OSError as error:
+                raise CommandError(f"Lecture impossible : {error}")
+
+        if not options['dry_run']:
+            self.apply(stock_changes, price_changes)
+        self.report(options['dry_run'])
+
+    # --- 1. Instantané ---
+
+    def snapshot(self):
+        """{sku: (variant_id, product_id, stock)} et {product_id: prix}, en une requête"""
+        self.variants, self.prices = {}, {}
+        for sku, variant_id, product_id, stock, prix in ProductVariant.objects.values_list(
+            'sku', 'id', 'product_id', 'stock', 'product__prix'
+        ).iterator(chunk_size=5000):
+            self.variants[sku] = (variant_id, product_id, stock)
+            self.prices[product_id] = prix
+
+    # --- 2. Différences ---
+
+    def diff(self, stream, delimiter):
+        """Parcourt le CSV ; retourne ({variant_id: stock}, {product_id: prix}) des seules valeurs modifiées"""
+        reader = csv.DictReader(stream, delimiter=delimiter)
+        columns = {name.strip().lower() for name in reader.fieldnames or []}
+        if not REQUIRED_COLUMNS <= columns:
+            raise CommandError(f"Colonnes obligatoires manquantes : {', '.join(sorted(REQUIRED_COLUMNS - columns))}")
+
+        stock_changes, price_changes, file_prices, conflicts = {}, {}, {}, set()
+        self.restocked = set()
+        for line, row in enumerate(reader, start=2):
+            self.counts['lignes'] += 1
+            if None in row:
+                # DictReader range sous la clé None les champs au-delà de l'en-tête
+                self.counts['invalides'] += 1
+                self.stderr.write(f"Ligne {line} ignorée : {len(row[None])} colonne(s) de trop")
+                continue
+            row = {key.strip().lower(): (value or '').strip() for key, value in row.items()}
+            known = self.variants.get(row['sku'])
+            if known is None:
+                self.counts['inconnues'] += 1
+                continue
+            variant_id, product_id, stock = known
+            try:
+                new_stock = int(row['stock'])
+                new_price = parse_price(row.get('prix'))
+                if new_stock < 0:
+                    raise ValueError
+            except (ValueError, InvalidOperation):
+                self.counts['invalides'] += 1
+                self.stderr.write(f"Ligne {line} ignorée ({row['sku']}) : stock ou prix invalide")
+                continue
+
+            changed = False
+            if new_stock != stock:
+                stock_changes[variant_id] = new_stock
+                self.restocked.add(product_id)
+                changed = True
+            if new_price is not None:
+                # Prix du produit : toutes ses variantes doivent annoncer le même
+                if file_prices.setdefault(product_id, new_price) != new_price:
+                    conflicts.add(product_id)
+                    self.stderr.write(f"Ligne {line} : prix différent pour le même produit ({row['sku']}), ignoré")
+                elif new_price != self.prices[product_id]:
+                    price_changes[product_id] = new_price
+                    changed = True
+            if not changed:
+                self.counts['inchangées'] += 1
+
+        # Produit dont une ligne a contredit le prix : on ne tranche pas
+        for product_id in conflicts:
+            price_changes.pop(product_id, None)
+        self.counts['stocks'], self.counts['prix'] = len(stock_changes), len(price_changes)
+        return stock_changes, price_changes
+
+    # --- 3. Écriture ---
+
+    def apply(self, stock_changes, price_changes):
+        now = timezone.now()
+        with transaction.atomic():
+            ProductVariant.objects.bulk_update(
+                [ProductVariant(id=pk, stock=stock) for pk, stock in stock_changes.items()],
+                ['stock'], batch_size=self.batch_size,
+            )
+            # bulk_update ignore auto_now : date_modification posée ici, pour ces produits seulement
+            Product.objects.bulk_update(
+                [Product(id=pk, prix=prix, date_modification=now) for pk, prix in price_changes.items()],
+                ['prix', 'date_modification'], batch_size=self.batch_size,
+            )
+            restocked = sorted(self.restocked)
+            for start in range(0, len(restocked), self.batch_size):
+                inventory.sync_product_stock(restocked[start:start + self.batch_size])
+
+    def report(self, dry_run):
+        counts = self.counts
+        self.stdout.write(
+            f"{counts['lignes']} lignes lues : {counts['inchangées']} inchangées, "
+            f"{counts['inconnues']} SKU inconnus, {counts['invalides']} invalides."
+        )
+        verb = "à modifier" if dry_run else "modifiés"
+        self.stdout.write(self.style.SUCCESS(f"{counts['stocks']} stocks et {counts['prix']} prix {verb}."))
@@ -0,0 +1,354 @@
+"""
+Métriques par vue (latence, requêtes SQL, rendu des templates, cache).
+
+- MetricsMiddleware mesure chaque requête et l'attribue au nom de l'URL
+  résolue (home, product_list, admin:index...).
+- Les compteurs sont agrégés dans le processus, dans un « shard » par
+  thread : aucun verrou sur le chemin de la requête, les shards ne sont
+  additionnés qu'à la lecture (endpoint Prometheus).
+- Seule une fraction des requêtes (SHOP_METRICS_SAMPLE_RATE) est
+  instrumentée finement (SQL, templates, cache) ; latence et volume sont
+  toujours comptés.
+- Plusieurs workers : chacun dépose son cumul dans SHOP_METRICS_DIR/<pid>.json
+  (au plus toutes les FLUSH_SECONDS, pendant une requête). L'endpoint,
+  servi par n'importe quel worker, lit tous les fichiers et étiquette chaque
+  série par worker="<pid>" : sum by (view) (...) donne le total du serveur,
+  et un worker redémarré n'est qu'une nouvelle série pour Prometheus.
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_SECONDS = 5
+# Fichier d'un worker arrêté : ses séries disparaissent au bout d'une heure
+STALE_SECONDS = 3600
+
+_current = ContextVar('shop_metrics_request', default=None)
+
+
+class RequestCollector:
+    """Mesures d'une requête en cours (portée par une ContextVar)"""
+    __slots__ = ('sampled', 'queries', 'db_time', 'template_time', 'template_depth', 'cache_hits', 'cache_misses')
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class ViewStats:
+    __slots__ = ('count', 'statuses', 'buckets', 'duration_sum', 'sampled', 'queries', 'db_time',
+                 'template_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.count = 0
+        self.statuses = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.duration_sum = 0.0
+        self.sampled = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for field in cls.__slots__:
+            setattr(stats, field, data[field])
+        return stats
+
+
+def _directory():
+    return Path(getattr(settings, 'SHOP_METRICS_DIR', None) or Path(tempfile.gettempdir()) / 'shop-metrics')
+
+
+class Registry:
+    """Un dictionnaire {vue: ViewStats} par thread, fusionnés à la lecture"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(self, view, status, duration, collector):
+        shard = self._shard()
+        stats = shard.get(view)
+        if stats is None:
+            stats = shard[view] = ViewStats()
+        stats.count += 1
+        status_class = f"{status // 100}xx"
+        stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+        index = 0
+        while index < len(LATENCY_BUCKETS) and duration > LATENCY_BUCKETS[index]:
+            index += 1
+        stats.buckets[index] += 1
+        stats.duration_sum += duration
+        if collector.sampled:
+            stats.sampled += 1
+            stats.queries += collector.queries
+            stats.db_time += collector.db_time
+            stats.template_time += collector.template_time
+            stats.cache_hits += collector.cache_hits
+            stats.cache_misses += collector.cache_misses
+
+    def snapshot(self):
+        """Additionne les shards de tous les threads"""
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            for view, stats in list(shard.items()):
+                total = merged.setdefault(view, ViewStats())
+                total.count += stats.count
+                for status_class, n in list(stats.statuses.items()):
+                    total.statuses[status_class] = total.statuses.get(status_class, 0) + n
+                total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+                for field in ('duration_sum', 'sampled', 'queries', 'db_time', 'template_time',
+                              'cache_hits', 'cache_misses'):
+                    setattr(total, field, getattr(total, field) + getattr(stats, field))
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+    def flush(self):
+        """Dépose le cumul du processus dans SHOP_METRICS_DIR/<pid>.json (écriture atomique)"""
+        self._flushed = time.monotonic()
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        directory = _directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{os.getpid()}.json'
+        temporary = path.with_name(f'.{path.name}.{threading.get_ident()}.tmp')
+        temporary.write_text(json.dumps({view: stats.to_dict() for view, stats in snapshot.items()}))
+        os.replace(temporary, path)
+
+    def maybe_flush(self, force=False):
+        if not force and time.monotonic() - self._flushed < FLUSH_SECONDS:
+            return
+        try:
+            self.flush()
+        except OSError:
+            logger.exception("Écriture des métriques impossible")
+
+    def workers(self):
+        """{pid: {vue: ViewStats}} de tous les workers ; ce processus est lu en direct"""
+        pid = os.getpid()
+        result = {}
+        directory = _directory()
+        if directory.is_dir():
+            for path in directory.glob('*.json'):
+                if not path.stem.isdigit() or int(path.stem) == pid:
+                    continue
+                try:
+                    if time.time() - path.stat().st_mtime > STALE_SECONDS:
+                        path.unlink(missing_ok=True)
+                        continue
+                    data = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    # Worker en train d'écrire ou fichier supprimé entre-temps
+                    continue
+                result[int(path.stem)] = {view: ViewStats.from_dict(stats) for view, stats in data.items()}
+        result[pid] = self.snapshot()
+        return result
+
+
+registry = Registry()
+
+
+def _sample_rate():
+    return getattr(settings, 'SHOP_METRICS_SAMPLE_RATE', 1.0)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        collector = RequestCollector(sampled=random.random() < _sample_rate())
+        return collector, _current.set(collector), time.perf_counter()
+
+    def _finish(self, request, response, collector, token, start):
+        _current.reset(token)
+        registry.record(_view_name(request), response.status_code, time.perf_counter() - start, collector)
+        registry.maybe_flush()
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        collector, token, start = self._start()
+        return self._finish(request, self.get_response(request), collector, token, start)
+
+    async def __acall__(self, request):
+        collector, token, start = self._start()
+        return self._finish(request, await self.get_response(request), collector, token, start)
+
+
+# --- Instrumentation (installée par ShopConfig.ready) ---
+
+def _db_wrapper(execute, sql, params, many, context):
+    collector = _current.get()
+    if collector is None or not collector.sampled:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        collector.queries += 1
+        collector.db_time += time.perf_counter() - start
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def _patch_template_render():
+    from django.template.base import Template
+
+    original = Template.render
+    if getattr(original, '_shop_metrics', False):
+        return
+
+    def render(self, context):
+        collector = _current.get()
+        # Seul le template le plus externe est chronométré (les include sont inclus)
+        if collector is None or not collector.sampled or collector.template_depth:
+            return original(self, context)
+        collector.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            collector.template_time += time.perf_counter() - start
+            collector.template_depth -= 1
+
+    render._shop_metrics = True
+    Template.render = render
+
+
+def _patch_cache_get():
+    for alias in settings.CACHES:
+        cls = type(caches[alias])
+        original = cls.get
+        if getattr(original, '_shop_metrics', False):
+            continue
+
+        def get(self, key, default=None, version=None, _original=original):
+            value = _original(self, key, default, version)
+            collector = _current.get()
+            if collector is not None and collector.sampled:
+                if value is default:
+                    collector.cache_misses += 1
+                else:
+                    collector.cache_hits += 1
+            return value
+
+        get._shop_metrics = True
+        cls.get = get
+
+
+def install():
+    if not getattr(settings, 'SHOP_METRICS_ENABLED', True):
+        return
+    connection_created.connect(_on_connection_created, dispatch_uid='shop_metrics_db')
+    _patch_template_render()
+    _patch_cache_get()
+    # Dernières requêtes d'un worker qui s'arrête (max_requests, redéploiement)
+    atexit.register(registry.maybe_flush, force=True)
+
+
+# --- Export au format texte Prometheus ---
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    workers = sorted(registry.workers().items())
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+
+    series = [
+        (f'view="{_label(view)}",worker="{pid}"', stats)
+        for pid, snapshot in workers for view, stats in sorted(snapshot.items())
+    ]
+    metric('shop_http_requests_total', 'counter', "Requêtes HTTP par vue, worker et classe de statut", [
+        f'shop_http_requests_total{{{labels},status="{status}"}} {n}'
+        for labels, stats in series for status, n in sorted(stats.statuses.items())
+    ])
+
+    samples = []
+    for labels, stats in series:
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + (float('inf'),), stats.buckets):
+            cumulative += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append(f'shop_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+        samples.append(f'shop_http_request_duration_seconds_sum{{{labels}}} {stats.duration_sum:.6f}')
+        samples.append(f'shop_http_request_duration_seconds_count{{{labels}}} {stats.count}')
+    metric('shop_http_request_duration_seconds', 'histogram', "Latence des requêtes par vue et worker", samples)
+
+    for name, field, help_text, fmt in (
+        ('shop_sampled_requests_total', 'sampled', "Requêtes instrumentées (échantillon)", '{}'),
+        ('shop_db_queries_total', 'queries', "Requêtes SQL (requêtes échantillonnées)", '{}'),
+        ('shop_db_duration_seconds_total', 'db_time', "Temps SQL (requêtes échantillonnées)", '{:.6f}'),
+        ('shop_template_render_seconds_total', 'template_time', "Temps de rendu des templates (échantillon)", '{:.6f}'),
+        ('shop_cache_hits_total', 'cache_hits', "Lectures de cache réussies (échantillon)", '{}'),
+        ('shop_cache_misses_total', 'cache_misses', "Lectures de cache manquées (échantillon)", '{}'),
+    ):
+        metric(name, 'counter', help_text, [
+            f'{name}{{{labels}}} {fmt.format(getattr(stats, field))}' for labels, stats in series
+        ])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,74 @@
+# Generated by Django 6.0 on 2026-10-19 02:12
+
+import re
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_phone(value):
+    # Copie de shop.models.normalize_phone à la date de la migration : la fonction vivante peut changer
+    digits = re.sub(r'\D', '', value or '')
+    for prefix in ('00241', '241'):
+        if digits.startswith(prefix) and len(digits) > len(prefix) + 6:
+            digits = digits[len(prefix):]
+            break
+    return digits.lstrip('0')
+
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def backfill_phone_normalized(apps, schema_editor):
+    # Lecture en flux et écriture par lots : jamais toute la table shop_order en mémoire
+    db_alias = schema_editor.connection.alias
+    Order = apps.get_model('shop', 'Order')
+    batch = []
+    for pk, phone in Order.objects.using(db_alias).order_by('id').values_list('id', 'phone').iterator(
+        chunk_size=BACKFILL_BATCH_SIZE
+    ):
+        batch.append(Order(id=pk, phone_normalized=normalize_phone(phone)))
+        if len(batch) == BACKFILL_BATCH_SIZE:
+            Order.objects.using(db_alias).bulk_update(batch, ['phone_normalized'])
+            batch = []
+    if batch:
+        Order.objects.using(db_alias).bulk_update(batch, ['phone_normalized'])
+
+
+def create_trigram_index(apps, schema_editor):
+    # Index trigramme uniquement sur PostgreSQL (SQLite : voir order_lookup.ensure_sqlite_fts)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS shop_order_full_name_trgm ON shop_order USING gin (full_name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS shop_order_full_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_fiche_technique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='shop_order_email_lower_idx'),
+        ),
+        migrations.RunPython(backfill_phone_normalized, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
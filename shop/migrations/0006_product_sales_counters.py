@@ -0,0 +1,99 @@
+# Generated by Django 6.0 on 2026-10-19 02:13
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_sales(apps, schema_editor):
+    """Initialise les compteurs à partir de l'historique (hors commandes annulées)"""
+    db_alias = schema_editor.connection.alias
+    Product = apps.get_model('shop', 'Product')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    ProductSalesDay = apps.get_model('shop', 'ProductSalesDay')
+
+    sold = OrderItem.objects.using(db_alias).filter(product__isnull=False).exclude(order__status='CANCELLED')
+    totals = dict(sold.values('product_id').annotate(qty=Sum('quantity')).values_list('product_id', 'qty'))
+    products = list(Product.objects.using(db_alias).filter(id__in=list(totals)).only('id'))
+    for product in products:
+        product.ventes_total = totals[product.id]
+    Product.objects.using(db_alias).bulk_update(products, ['ventes_total'], batch_size=500)
+
+    # Ventes journalières des 30 derniers jours : les fenêtres 7j / 30j
+    # seront calculées par la tâche planifiée refresh_bestsellers
+    since = timezone.now() - datetime.timedelta(days=30)
+    days = (
+        sold.filter(order__created_at__gte=since)
+        .values('product_id', day=TruncDate('order__created_at'))
+        .annotate(qty=Sum('quantity'))
+    )
+    ProductSalesDay.objects.using(db_alias).bulk_create(
+        [ProductSalesDay(product_id=row['product_id'], jour=row['day'], quantite=row['qty']) for row in days],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_order_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('quantite', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Ventes du jour',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ventes_30j',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ventes_7j',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ventes_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-ventes_total'], name='shop_product_ventes_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-ventes_7j'], name='shop_product_ventes_7j_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-ventes_30j'], name='shop_product_ventes_30j_idx'),
+        ),
+        migrations.AddField(
+            model_name='productsalesday',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='shop.product'),
+        ),
+        migrations.AddIndex(
+            model_name='productsalesday',
+            index=models.Index(fields=['jour'], name='shop_salesday_jour_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsalesday',
+            unique_together={('product', 'jour')},
+        ),
+        migrations.RunPython(backfill_sales, migrations.RunPython.noop),
+    ]
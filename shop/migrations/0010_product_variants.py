@@ -0,0 +1,109 @@
+# Generated by Django 6.0 on 2026-10-19 03:05
+
+import itertools
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def _sku(product_id, color_id, size_id, capacity_id):
+    return f"P{product_id}-C{color_id or 0}-S{size_id or 0}-K{capacity_id or 0}"
+
+
+def create_variants(apps, schema_editor):
+    """
+    Une variante par combinaison des anciennes listes couleurs x tailles x
+    capacités (variante unique sans options sinon). Le stock du produit est
+    réparti entre ses variantes, le total reste identique : à corriger dans
+    l'admin SKU par SKU.
+    """
+    db_alias = schema_editor.connection.alias
+    Product = apps.get_model('shop', 'Product')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+    CartItem = apps.get_model('shop', 'CartItem')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+
+    variants = []
+    for product in Product.objects.using(db_alias).prefetch_related('colors', 'sizes', 'capacities'):
+        combinations = list(itertools.product(
+            list(product.colors.all()) or [None],
+            list(product.sizes.all()) or [None],
+            list(product.capacities.all()) or [None],
+        ))
+        share, extra = divmod(product.quantite_stocks, len(combinations))
+        for i, (color, size, capacity) in enumerate(combinations):
+            variants.append(ProductVariant(
+                product=product, color=color, size=size, capacity=capacity, stock=share + (i < extra),
+                sku=_sku(product.id, color and color.id, size and size.id, capacity and capacity.id),
+            ))
+    ProductVariant.objects.using(db_alias).bulk_create(variants, batch_size=500)
+
+    by_key = {
+        (v.product_id, v.color_id, v.size_id, v.capacity_id): v.id
+        for v in ProductVariant.objects.using(db_alias).only('id', 'product_id', 'color_id', 'size_id', 'capacity_id')
+    }
+
+    # Paniers : combinaison choisie -> variante (créée sans stock si elle n'était pas proposée)
+    items = list(CartItem.objects.using(db_alias).only('id', 'product_id', 'color_id', 'size_id', 'capacity_id'))
+    for item in items:
+        key = (item.product_id, item.color_id, item.size_id, item.capacity_id)
+        if key not in by_key:
+            by_key[key] = ProductVariant.objects.using(db_alias).create(
+                product_id=item.product_id, color_id=item.color_id, size_id=item.size_id,
+                capacity_id=item.capacity_id, stock=0, sku=_sku(*key),
+            ).id
+        item.variant_id = by_key[key]
+    CartItem.objects.using(db_alias).bulk_update(items, ['variant'], batch_size=500)
+
+    # Commandes : les options n'étaient gardées qu'en libellés, rapprochement par nom
+    by_names = {
+        (v.product_id, v.color.name if v.color else None, v.size.name if v.size else None,
+         v.capacity.name if v.capacity else None): v.id
+        for v in ProductVariant.objects.using(db_alias).select_related('color', 'size', 'capacity')
+    }
+    lines = []
+    for line in OrderItem.objects.using(db_alias).filter(product__isnull=False).only('id', 'product_id', 'color', 'size', 'capacity'):
+        variant_id = by_names.get((line.product_id, line.color or None, line.size or None, line.capacity or None))
+        if variant_id:
+            line.variant_id = variant_id
+            lines.append(line)
+    OrderItem.objects.using(db_alias).bulk_update(lines, ['variant'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(blank=True, max_length=64, unique=True)),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('price_delta', models.DecimalField(decimal_places=2, default=0, help_text='Ajouté au prix du produit (négatif pour une remise)', max_digits=12, verbose_name='Écart de prix')),
+                ('capacity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='shop.capacity')),
+                ('color', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='shop.color')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='shop.product')),
+                ('size', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='shop.size')),
+            ],
+            options={
+                'verbose_name': 'Variante (SKU)',
+                'constraints': [models.UniqueConstraint(models.F('product'), django.db.models.functions.comparison.Coalesce('color', 0), django.db.models.functions.comparison.Coalesce('size', 0), django.db.models.functions.comparison.Coalesce('capacity', 0), name='shop_variant_combination_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='variant',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='shop.productvariant'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.productvariant'),
+        ),
+        migrations.RunPython(create_variants, migrations.RunPython.noop),
+    ]
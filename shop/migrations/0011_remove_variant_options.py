@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-19 03:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Séparée de 0010 : sur PostgreSQL, modifier une table déjà écrite dans la même
+    # transaction échoue (« pending trigger events »)
+
+    dependencies = [
+        ('shop', '0010_product_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cartitem',
+            name='variant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='shop.productvariant'),
+        ),
+        migrations.RemoveField(
+            model_name='cartitem',
+            name='capacity',
+        ),
+        migrations.RemoveField(
+            model_name='cartitem',
+            name='color',
+        ),
+        migrations.RemoveField(
+            model_name='cartitem',
+            name='size',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='capacities',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='colors',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='sizes',
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='quantite_stocks',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-19 02:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_remove_variant_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromotionRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100)),
+                ('type_remise', models.CharField(choices=[('POURCENT', 'Pourcentage'), ('MONTANT', 'Montant fixe')], default='POURCENT', max_length=10)),
+                ('valeur', models.DecimalField(decimal_places=2, help_text='% ou montant en FCFA', max_digits=12)),
+                ('marque', models.CharField(blank=True, max_length=100)),
+                ('date_debut', models.DateTimeField(blank=True, null=True)),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+                ('priorite', models.IntegerField(default=0, help_text="La règle applicable de plus forte priorité l'emporte ; à égalité, le prix le plus bas", verbose_name='Priorité')),
+                ('actif', models.BooleanField(default=True)),
+                ('categorie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='shop.category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='shop.product')),
+                ('subcategorie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='shop.subcategory')),
+            ],
+            options={
+                'verbose_name': 'Règle de promotion',
+                'ordering': ['-priorite', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-19 02:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_promotion_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryzone',
+            name='delai_supplementaire',
+            field=models.PositiveIntegerField(default=0, help_text='Jours ajoutés au délai des produits'),
+        ),
+        migrations.AddField(
+            model_name='deliveryzone',
+            name='frais_base',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Ajoutés aux frais de livraison des produits', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='deliveryzone',
+            name='villes',
+            field=models.TextField(blank=True, help_text='Une ville ou un quartier par ligne'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delai_max',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delai_min',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='zone',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='shop.deliveryzone'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='city',
+            field=models.CharField(max_length=100),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 6.0 on 2026-10-19 02:59
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_aggregates(apps, schema_editor):
+    """Agrégats des avis existants (ensuite maintenus par shop.reviews)"""
+    db_alias = schema_editor.connection.alias
+    Product = apps.get_model('shop', 'Product')
+    Review = apps.get_model('shop', 'Review')
+
+    counts = defaultdict(dict)
+    for product_id, rating, n in Review.objects.using(db_alias).order_by().values_list('product', 'rating').annotate(n=Count('id')):
+        counts[product_id][rating] = n
+
+    products = list(Product.objects.using(db_alias).filter(id__in=counts).only('id'))
+    for product in products:
+        by_rating = counts[product.id]
+        total = sum(by_rating.values())
+        product.avis_total = total
+        for stars in range(1, 6):
+            setattr(product, f'avis_{stars}', by_rating.get(stars, 0))
+        average = Decimal(sum(stars * n for stars, n in by_rating.items())) / total
+        product.note_moyenne = average.quantize(Decimal('0.01'))
+    Product.objects.using(db_alias).bulk_update(
+        products, ['avis_total', 'avis_1', 'avis_2', 'avis_3', 'avis_4', 'avis_5', 'note_moyenne'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_shipping_zones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avis_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='avis_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='avis_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='avis_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='avis_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='avis_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='note_moyenne',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-note_moyenne', '-avis_total'], name='shop_product_note_idx'),
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
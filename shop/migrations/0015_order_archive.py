@@ -0,0 +1,71 @@
+# Generated by Django 6.0 on 2026-10-19 03:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_review_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('full_name', models.CharField(max_length=255, verbose_name='Nom complet')),
+                ('email', models.EmailField(max_length=254)),
+                ('phone', models.CharField(max_length=20, verbose_name='Téléphone')),
+                ('phone_normalized', models.CharField(blank=True, db_index=True, max_length=20)),
+                ('address', models.TextField(verbose_name='Adresse exacte')),
+                ('city', models.CharField(max_length=100)),
+                ('delai_min', models.PositiveIntegerField(blank=True, null=True)),
+                ('delai_max', models.PositiveIntegerField(blank=True, null=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('shipping_cost', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('status', models.CharField(choices=[('PENDING', 'En attente'), ('PAID', 'Payée / En préparation'), ('SHIPPED', 'Expédiée'), ('DELIVERED', 'Livrée'), ('CANCELLED', 'Annulée')], max_length=20)),
+                ('is_paid', models.BooleanField(default=False)),
+                ('order_key', models.CharField(blank=True, max_length=255, null=True)),
+                ('reference', models.CharField(max_length=20, unique=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+                ('zone', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to='shop.deliveryzone')),
+            ],
+            options={
+                'verbose_name': 'Commande archivée',
+                'verbose_name_plural': 'Commandes archivées',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('color', models.CharField(blank=True, max_length=50, null=True)),
+                ('size', models.CharField(blank=True, max_length=50, null=True)),
+                ('capacity', models.CharField(blank=True, max_length=50, null=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='shop.archivedorder')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.product')),
+                ('variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.productvariant')),
+            ],
+            options={
+                'verbose_name': 'Ligne de commande archivée',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='shop_archorder_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['-created_at', '-id'], name='shop_archorder_created_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-19 03:25
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Lignes en double d'un même SKU (courses de get_or_create) fusionnées dans la plus ancienne"""
+    db_alias = schema_editor.connection.alias
+    CartItem = apps.get_model('shop', 'CartItem')
+    duplicates = (
+        CartItem.objects.using(db_alias).order_by().values('cart', 'variant')
+        .annotate(n=Count('id'), keep=Min('id'), quantity=Sum('quantity')).filter(n__gt=1)
+    )
+    for line in duplicates:
+        CartItem.objects.using(db_alias).filter(id=line['keep']).update(quantity=line['quantity'])
+        CartItem.objects.using(db_alias).filter(cart=line['cart'], variant=line['variant']).exclude(id=line['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_cart_updated_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'variant'), name='shop_cartitem_line_uniq'),
+        ),
+    ]
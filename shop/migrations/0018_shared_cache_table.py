@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-19 04:10
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    """Table du cache partagé (settings.CACHES sans REDIS_URL) : créée avec le schéma, à chaque `migrate`"""
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_cartitem_line_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
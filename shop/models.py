@@ -1,19 +1,59 @@
-from django.db import models
+from django.db import connections, models, router
 from django.utils.text import slugify
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from decimal import Decimal
+from django.db.models.functions import Coalesce, Least, Lower
 import uuid
 import datetime
+import re
+
+# --- Images responsive ---
+
+class ResponsiveImage(models.Model):
+     """Dimensions, placeholder et dérivés WebP/JPEG d'une image (voir shop/images.py)"""
+     width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+     height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+     placeholder = models.TextField(blank=True, editable=False)
+     derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+     # Nom du champ ImageField source
+     source_field = 'image'
+
+     class Meta:
+        abstract = True
+
+     def srcset(self, key):
+        return ', '.join(f"{v['url']} {v['width']}w" for v in self.derivatives.get(key, []))
+
+     @property
+     def srcset_webp(self):
+        return self.srcset('webp')
+
+     @property
+     def srcset_jpeg(self):
+        return self.srcset('jpeg')
+
+     @property
+     def src(self):
+        """Plus grand JPEG généré, sinon l'original (dérivés pas encore prêts)"""
+        variants = self.derivatives.get('jpeg')
+        if variants:
+            return variants[-1]['url']
+        field = getattr(self, self.source_field)
+        return field.url if field else ''
 
 # --- Modèles Annexes ---
 
-class Category(models.Model):
+class Category(ResponsiveImage):
      name = models.CharField(max_length=100, unique=True)
      desc = models.TextField(blank=True)
      slug = models.SlugField(unique=True, blank=True)
      img = models.ImageField(upload_to='categories/', blank=True, null=True)
 
+     source_field = 'img'
+
      class Meta:
         verbose_name = "Catégorie"
     
@@ -38,6 +78,11 @@ class SubCategory(models.Model):
 
 class DeliveryZone(models.Model):
      name = models.CharField(max_length=100, unique=True)
+     # Villes / quartiers rattachés à la zone (un par ligne) : résolution de la ville saisie au checkout
+     villes = models.TextField(blank=True, help_text="Une ville ou un quartier par ligne")
+     frais_base = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                      help_text="Ajoutés aux frais de livraison des produits")
+     delai_supplementaire = models.PositiveIntegerField(default=0, help_text="Jours ajoutés au délai des produits")
 
      class Meta:
         verbose_name = "Zone de livraison"
@@ -80,11 +125,8 @@ class Product(models.Model):
     description_longue = models.TextField()
     caracteristiques = models.TextField(blank=True)
     fiche_technique = models.TextField(blank=True)
-    
-    # Relations Multiple
-    colors = models.ManyToManyField(Color, blank=True)
-    sizes = models.ManyToManyField(Size, blank=True)
-    capacities = models.ManyToManyField(Capacity, blank=True)
+
+    # Couleurs, tailles et capacités : voir ProductVariant (une ligne par combinaison vendue)
 
     # Médias
     video_demo = models.FileField(upload_to='products/videos/', blank=True, null=True)
@@ -96,8 +138,8 @@ class Product(models.Model):
     date_debut_promo = models.DateTimeField(null=True, blank=True)
     date_fin_promo = models.DateTimeField(null=True, blank=True)
 
-    # Stocks
-    quantite_stocks = models.PositiveIntegerField(default=0)
+    # Stocks : somme des stocks des variantes (maintenue par shop.inventory, lue par le catalogue)
+    quantite_stocks = models.PositiveIntegerField(default=0, editable=False)
     seuil_stocks_bas = models.PositiveIntegerField(default=5)
 
     # Livraison
@@ -116,20 +158,65 @@ class Product(models.Model):
     date_ajout = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
 
+    # Compteurs de ventes (maintenus par shop.bestsellers, jamais saisis à la main)
+    ventes_total = models.PositiveIntegerField(default=0, editable=False)
+    ventes_7j = models.PositiveIntegerField(default=0, editable=False)
+    ventes_30j = models.PositiveIntegerField(default=0, editable=False)
+
+    # Avis : nombre, histogramme 1 à 5 étoiles et moyenne (maintenus par shop.reviews à chaque avis)
+    avis_total = models.PositiveIntegerField(default=0, editable=False)
+    avis_1 = models.PositiveIntegerField(default=0, editable=False)
+    avis_2 = models.PositiveIntegerField(default=0, editable=False)
+    avis_3 = models.PositiveIntegerField(default=0, editable=False)
+    avis_4 = models.PositiveIntegerField(default=0, editable=False)
+    avis_5 = models.PositiveIntegerField(default=0, editable=False)
+    note_moyenne = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-ventes_total'], name='shop_product_ventes_total_idx'),
+            models.Index(fields=['-ventes_7j'], name='shop_product_ventes_7j_idx'),
+            models.Index(fields=['-ventes_30j'], name='shop_product_ventes_30j_idx'),
+            # Nouveautés (accueil, liste par défaut), par catégorie, tri par prix (voir index_advisor)
+            models.Index(fields=['-date_ajout'], name='shop_product_date_ajout_idx'),
+            models.Index(fields=['categorie', '-date_ajout'], name='shop_product_cat_date_idx'),
+            models.Index(fields=['prix'], name='shop_product_prix_idx'),
+            # Tri « Mieux notés »
+            models.Index(fields=['-note_moyenne', '-avis_total'], name='shop_product_note_idx'),
+        ]
+
     @property
-    def est_en_promo(self):
-        """Vérifie si la promotion est actuellement valide"""
+    def promo_produit_active(self):
+        """Promotion propre au produit (prix_promotionnel) valide en ce moment"""
         now = timezone.now()
         if self.prix_promotionnel and self.date_debut_promo and self.date_fin_promo:
             return self.date_debut_promo <= now <= self.date_fin_promo
         return False # Toujours renvoyer False si les conditions ne sont pas réunies
 
+    @property
+    def tarif(self):
+        """Prix résolu par le moteur de promotions (shop/pricing.py), calculé une fois par instance"""
+        if '_tarif' not in self.__dict__:
+            from .pricing import apply
+            apply([self])
+        return self._tarif
+
+    @property
+    def est_en_promo(self):
+        """Vérifie si une promotion (règle ou prix promotionnel) s'applique en ce moment"""
+        return self.tarif.price < self.prix
+
     @property
     def get_price(self):
         """Retourne le prix actuel (promo ou normal)"""
-        if self.est_en_promo:
-            return self.prix_promotionnel
-        return self.prix
+        return self.tarif.price
+
+    @property
+    def histogramme_avis(self):
+        """[(étoiles, nombre, pourcentage)] de 5 à 1 étoile"""
+        total = self.avis_total or 1
+        return [(stars, count, round(count * 100 / total)) for stars in range(5, 0, -1)
+                for count in [getattr(self, f'avis_{stars}')]]
 
     @property
     def benefice_unitaire(self):
@@ -151,10 +238,90 @@ class Product(models.Model):
         return self.nom
 
 # Modèle pour plusieurs images
-class ProductImage(models.Model):
+class ProductImage(ResponsiveImage):
      product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
      image = models.ImageField(upload_to='products/images/')
 
+class ProductVariant(models.Model):
+     """SKU : une combinaison couleur / taille / capacité d'un produit, avec son stock et son écart de prix"""
+     product = models.ForeignKey(Product, related_name='variants', on_delete=models.CASCADE)
+     sku = models.CharField(max_length=64, unique=True, blank=True)
+     # PROTECT : supprimer une couleur fusionnerait silencieusement des variantes
+     color = models.ForeignKey(Color, on_delete=models.PROTECT, null=True, blank=True)
+     size = models.ForeignKey(Size, on_delete=models.PROTECT, null=True, blank=True)
+     capacity = models.ForeignKey(Capacity, on_delete=models.PROTECT, null=True, blank=True)
+     stock = models.PositiveIntegerField(default=0)
+     price_delta = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Écart de prix",
+                                       help_text="Ajouté au prix du produit (négatif pour une remise)")
+
+     class Meta:
+        verbose_name = "Variante (SKU)"
+        constraints = [
+            # Une seule variante par combinaison, option absente comprise (NULL compté comme 0)
+            models.UniqueConstraint(
+                'product', Coalesce('color', 0), Coalesce('size', 0), Coalesce('capacity', 0),
+                name='shop_variant_combination_uniq',
+            ),
+        ]
+
+     def build_sku(self):
+        return f"P{self.product_id}-C{self.color_id or 0}-S{self.size_id or 0}-K{self.capacity_id or 0}"
+
+     def save(self, *args, **kwargs):
+        if not self.sku:
+            self.sku = self.build_sku()
+        super().save(*args, **kwargs)
+
+     @property
+     def label(self):
+        """« Noir / 128 Go », vide pour la variante unique d'un produit sans options"""
+        return ' / '.join(str(option) for option in (self.color, self.size, self.capacity) if option)
+
+     @property
+     def price(self):
+        return self.product.get_price + self.price_delta
+
+     def __str__(self):
+        return f"{self.product.nom} ({self.label})" if self.label else self.product.nom
+
+class PromotionRule(models.Model):
+     """
+     Remise appliquée à tout un périmètre (catalogue, catégorie, sous-catégorie,
+     marque ou produit) pendant une fenêtre de temps. Voir shop/pricing.py.
+     """
+     TYPE_CHOICES = [('POURCENT', 'Pourcentage'), ('MONTANT', 'Montant fixe')]
+
+     nom = models.CharField(max_length=100)
+     type_remise = models.CharField(max_length=10, choices=TYPE_CHOICES, default='POURCENT')
+     valeur = models.DecimalField(max_digits=12, decimal_places=2, help_text="% ou montant en FCFA")
+     # Périmètre : les critères renseignés se cumulent (aucun = tout le catalogue)
+     categorie = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+     subcategorie = models.ForeignKey(SubCategory, on_delete=models.CASCADE, null=True, blank=True)
+     marque = models.CharField(max_length=100, blank=True)
+     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
+     date_debut = models.DateTimeField(null=True, blank=True)
+     date_fin = models.DateTimeField(null=True, blank=True)
+     priorite = models.IntegerField(default=0, verbose_name="Priorité",
+                                    help_text="La règle applicable de plus forte priorité l'emporte ; "
+                                              "à égalité, le prix le plus bas")
+     actif = models.BooleanField(default=True)
+
+     class Meta:
+        verbose_name = "Règle de promotion"
+        ordering = ['-priorite', 'id']
+
+     def clean(self):
+        if self.valeur is not None and self.valeur <= 0:
+            raise ValidationError({'valeur': "La remise doit être positive."})
+        if self.type_remise == 'POURCENT' and self.valeur and self.valeur > 100:
+            raise ValidationError({'valeur': "Un pourcentage ne peut pas dépasser 100."})
+        if self.date_debut and self.date_fin and self.date_fin <= self.date_debut:
+            raise ValidationError({'date_fin': "La fin doit être postérieure au début."})
+
+     def __str__(self):
+        unite = '%' if self.type_remise == 'POURCENT' else ' FCFA'
+        return f"{self.nom} (-{self.valeur.normalize():f}{unite})"
+
 class Review(models.Model):
      product = models.ForeignKey(Product, related_name='reviews', on_delete=models.CASCADE)
      # Utilisation de AUTH_USER_MODEL pour plus de flexibilité
@@ -163,6 +330,21 @@ class Review(models.Model):
      comment = models.TextField()
      created_at = models.DateTimeField(auto_now_add=True)
 
+     class Meta:
+        # Avis d'une fiche produit, du plus récent au plus ancien
+        indexes = [models.Index(fields=['product', '-created_at'], name='shop_review_product_date_idx')]
+
+class ProductSalesDay(models.Model):
+     """Ventes d'un produit pour une journée : sert à faire glisser les fenêtres 7j / 30j"""
+     product = models.ForeignKey(Product, related_name='sales_days', on_delete=models.CASCADE)
+     jour = models.DateField()
+     quantite = models.IntegerField(default=0)
+
+     class Meta:
+        verbose_name = "Ventes du jour"
+        unique_together = ('product', 'jour')
+        indexes = [models.Index(fields=['jour'], name='shop_salesday_jour_idx')]
+
 class Cart(models.Model):
      user = models.OneToOneField(
      settings.AUTH_USER_MODEL, 
@@ -171,43 +353,46 @@ class Cart(models.Model):
      null=True, blank=True
      )
      created_at = models.DateTimeField(auto_now_add=True)
+     # Dernière activité (ajout, quantité, retrait) : base de la purge `manage.py purge_carts`
      updated_at = models.DateTimeField(auto_now=True)
 
+     class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='shop_cart_updated_idx')]
+
      def __str__(self):
         return f"Panier de {self.user.username if self.user else 'Invité'}"
 
+     @classmethod
+     def touch(cls, cart_id):
+        """Marque une activité sur le panier sans le relire (les articles n'ont pas de date)"""
+        cls.objects.filter(pk=cart_id).update(updated_at=timezone.now())
+
+     def _items(self):
+        """Articles préchargés par la vue (views.CART_ITEMS), sinon une requête avec leurs produits"""
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return self.items.all()
+        return self.items.select_related('product')
+
      @property
      def total_price(self):
         """Calcule le prix total de tous les articles du panier"""
      # Utilise total_item_price défini dans CartItem
-        return sum(item.total_item_price for item in self.items.all())
+        return sum(item.total_item_price for item in self._items())
 
      @property
      def items_count(self):
         """Nombre total d'articles (somme des quantités)"""
-        return sum(item.quantity for item in self.items.all())
+        return sum(item.quantity for item in self._items())
     
+     def shipping_quote(self, city=None):
+        """Zone, frais et délai de livraison du panier pour une ville (voir shop/shipping.py)"""
+        from .shipping import quote
+        return quote([(item.product_id, item.quantity) for item in self._items()], city)
+
      @property
      def shipping_cost(self):
-        """Calcule les frais de livraison optimisés"""
-        # .select_related('product') évite de refaire une requête SQL par article
-        items = self.items.select_related('product').all()
-    
-        if not items.exists():
-            return 0
-        
-        # 1. Si un seul produit a la livraison gratuite, tout est gratuit
-        if any(item.product.livraison_gratuite for item in items):
-            return 0
-    
-        # 2. On récupère les frais fixes en s'assurant qu'ils ne sont pas None
-        costs = [
-            item.product.frais_livraison_fixe 
-                for item in items 
-            if item.product.frais_livraison_fixe is not None
-            ]
-        
-        return max(costs) if costs else 0
+        """Frais de livraison estimés avant la saisie de la ville (page panier, récapitulatif)"""
+        return self.shipping_quote().cost
 
      @property
      def total_final(self):
@@ -218,27 +403,80 @@ class Cart(models.Model):
 class CartItem(models.Model):
      cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
      product = models.ForeignKey(Product, on_delete=models.CASCADE)
-
-     # Options choisies par le client
-     color = models.ForeignKey(Color, on_delete=models.SET_NULL, null=True, blank=True)
-     size = models.ForeignKey(Size, on_delete=models.SET_NULL, null=True, blank=True)
-     capacity = models.ForeignKey(Capacity, on_delete=models.SET_NULL, null=True, blank=True)
+     # Combinaison choisie par le client (couleur, taille, capacité)
+     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='cart_items')
     
      quantity = models.PositiveIntegerField(default=1)
 
+     class Meta:
+        # Une ligne par SKU : deux ajouts simultanés ne peuvent pas créer de doublon (voir add())
+        constraints = [models.UniqueConstraint(fields=['cart', 'variant'], name='shop_cartitem_line_uniq')]
+
      def __str__(self):
         return f"{self.quantity} x {self.product.nom}"
 
+     @classmethod
+     def add(cls, cart_id, lines):
+        """Ajoute au panier [(variante, quantité), ...], chaque ligne plafonnée au stock de sa variante.
+
+        Une seule instruction pour tout le lot (INSERT ... ON CONFLICT DO UPDATE
+        quantity = quantity + n) : des clics rapides ou deux onglets s'additionnent
+        sans doublon ni incrément perdu.
+        """
+        merged = {}
+        for variant, quantity in lines:
+            merged[variant.pk] = (variant, merged.get(variant.pk, (None, 0))[1] + quantity)
+        rows = [(variant, min(quantity, variant.stock)) for variant, quantity in merged.values()
+                if quantity > 0 and variant.stock > 0]
+        if not rows:
+            return
+        connection = connections[router.db_for_write(cls)]
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            # Sans ON CONFLICT : la contrainte départage les créations, l'incrément reste atomique
+            for variant, quantity in rows:
+                item, created = cls.objects.get_or_create(
+                    cart_id=cart_id, variant=variant, defaults={'product_id': variant.product_id, 'quantity': quantity}
+                )
+                if not created:
+                    cls.objects.filter(pk=item.pk).update(
+                        quantity=Least(models.F('quantity') + quantity, variant.stock)
+                    )
+            return
+        qn = connection.ops.quote_name
+        table, variants = qn(cls._meta.db_table), qn(ProductVariant._meta.db_table)
+        total = f"{table}.{qn('quantity')} + excluded.{qn('quantity')}"
+        # Stock relu dans l'instruction : le plafond suit une vente ou un réassort entre-temps
+        stock = f"(SELECT {qn('stock')} FROM {variants} WHERE {variants}.{qn('id')} = excluded.{qn('variant_id')})"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({qn('cart_id')}, {qn('product_id')}, {qn('variant_id')}, {qn('quantity')}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(rows))} "
+                f"ON CONFLICT ({qn('cart_id')}, {qn('variant_id')}) DO UPDATE SET "
+                f"{qn('quantity')} = CASE WHEN {total} > {stock} THEN {stock} ELSE {total} END",
+                [value for variant, quantity in rows for value in (cart_id, variant.product_id, variant.pk, quantity)],
+            )
+
      @property
-     def total_item_price(self):
-        # On récupère le prix (promo ou normal)
-        price = self.product.prix_promotionnel if self.product.est_en_promo else self.product.prix
-            
+     def unit_price(self):
+        """Prix du produit (promo ou normal) + écart de prix de la variante"""
+        price = self.product.get_price
         # SÉCURITÉ : Si 'price' est None pour une raison quelconque, on utilise 0.00
         if price is None:
             price = Decimal('0.00')
-                
-        return self.product.get_price * self.quantity
+        return price + self.variant.price_delta
+
+     @property
+     def total_item_price(self):
+        return self.unit_price * self.quantity
+
+def normalize_phone(value):
+    """Garde uniquement les chiffres, sans indicatif (+241 / 00241) ni zéros de tête"""
+    digits = re.sub(r'\D', '', value or '')
+    for prefix in ('00241', '241'):
+        if digits.startswith(prefix) and len(digits) > len(prefix) + 6:
+            digits = digits[len(prefix):]
+            break
+    return digits.lstrip('0')
 
 class Order(models.Model):
      STATUS_CHOICES = [
@@ -248,6 +486,7 @@ class Order(models.Model):
      ('DELIVERED', 'Livrée'),
      ('CANCELLED', 'Annulée'),
      ]
+     is_archived = False
 
      user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders')
     
@@ -255,8 +494,13 @@ class Order(models.Model):
      full_name = models.CharField(max_length=255, verbose_name="Nom complet")
      email = models.EmailField()
      phone = models.CharField(max_length=20, verbose_name="Téléphone")
+     phone_normalized = models.CharField(max_length=20, blank=True, editable=False, db_index=True)
      address = models.TextField(verbose_name="Adresse exacte")
-     city = models.CharField(max_length=100, default="Libreville")
+     city = models.CharField(max_length=100)
+     # Zone résolue depuis la ville et délai annoncé au client (voir shop/shipping.py)
+     zone = models.ForeignKey(DeliveryZone, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+     delai_min = models.PositiveIntegerField(null=True, blank=True)
+     delai_max = models.PositiveIntegerField(null=True, blank=True)
     
      # Financier
      total_amount = models.DecimalField(max_digits=12, decimal_places=2)
@@ -274,8 +518,19 @@ class Order(models.Model):
      class Meta:
         ordering = ['-created_at']
         verbose_name = "Commande"
+        indexes = [
+            # Recherche exacte par e-mail insensible à la casse (voir order_lookup)
+            models.Index(Lower('email'), name='shop_order_email_lower_idx'),
+            # Historique client paginé par curseur (voir order_history)
+            models.Index(fields=['user', '-created_at', '-id'], name='shop_order_user_created_idx'),
+            # Liste admin (ordre par défaut, filtre par statut) et statistiques payées du tableau de bord
+            models.Index(fields=['-created_at', '-id'], name='shop_order_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='shop_order_status_created_idx'),
+            models.Index(fields=['is_paid', 'created_at'], name='shop_order_paid_created_idx'),
+        ]
 
      def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
         if not self.reference:
             # Boucle pour garantir l'unicité absolue de la référence
             while True:
@@ -296,6 +551,8 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
+    # SKU vendu (remise en stock à l'annulation) ; les libellés ci-dessous restent figés
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True)
     
     color = models.CharField(max_length=50, blank=True, null=True)
     size = models.CharField(max_length=50, blank=True, null=True)
@@ -311,4 +568,74 @@ class OrderItem(models.Model):
     def total_price(self):
         # Sécurité : utilise Decimal('0.00') si price est None
         p = self.price if self.price is not None else Decimal('0.00')
-        return p * self.quantity
\ No newline at end of file
+        return p * self.quantity
+
+# --- ARCHIVES (voir shop/order_archive.py) ---
+# Commandes livrées ou annulées anciennes, déplacées hors de shop_order avec leurs
+# lignes : les tables chaudes ne contiennent que l'activité récente. Les identifiants
+# d'origine sont conservés (liens de factures, curseurs de l'historique client).
+
+class ArchivedOrder(models.Model):
+    STATUS_CHOICES = Order.STATUS_CHOICES
+    is_archived = True
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_orders')
+
+    full_name = models.CharField(max_length=255, verbose_name="Nom complet")
+    email = models.EmailField()
+    phone = models.CharField(max_length=20, verbose_name="Téléphone")
+    phone_normalized = models.CharField(max_length=20, blank=True, db_index=True)
+    address = models.TextField(verbose_name="Adresse exacte")
+    city = models.CharField(max_length=100)
+    zone = models.ForeignKey(DeliveryZone, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_orders')
+    delai_min = models.PositiveIntegerField(null=True, blank=True)
+    delai_max = models.PositiveIntegerField(null=True, blank=True)
+
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    shipping_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    is_paid = models.BooleanField(default=False)
+    order_key = models.CharField(max_length=255, null=True, blank=True)
+    reference = models.CharField(max_length=20, unique=True)
+
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        verbose_name = "Commande archivée"
+        verbose_name_plural = "Commandes archivées"
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='shop_archorder_user_idx'),
+            models.Index(fields=['-created_at', '-id'], name='shop_archorder_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Commande {self.reference} (archivée)"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='+')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    color = models.CharField(max_length=50, blank=True, null=True)
+    size = models.CharField(max_length=50, blank=True, null=True)
+    capacity = models.CharField(max_length=50, blank=True, null=True)
+
+    price = models.DecimalField(max_digits=12, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Ligne de commande archivée"
+
+    def __str__(self):
+        return f"{self.product.nom if self.product else 'Produit supprimé'} (x{self.quantity})"
+
+    @property
+    def total_price(self):
+        return (self.price if self.price is not None else Decimal('0.00')) * self.quantity
@@ -0,0 +1,98 @@
+"""
+Archivage des commandes.
+
+Les commandes livrées ou annulées créées il y a plus de
+SHOP_ORDER_ARCHIVE_DAYS jours quittent shop_order / shop_orderitem pour
+shop_archivedorder / shop_archivedorderitem (`manage.py archive_orders`,
+tâche quotidienne). Chaque lot est copié puis supprimé dans la même
+transaction : une commande est toujours dans une seule des deux tables, avec
+son identifiant d'origine.
+
+Les tables actives ne gardent ainsi que l'activité récente (liste admin,
+tableau de bord, recherche support, workflow). Les archives restent lisibles :
+  - historique client : order_history ne les lit que si la page atteint
+    l'horizon d'archivage (horizon(), dans le cache partagé : la commande
+    archive_orders, lancée dans son propre processus, le repousse pour
+    tous les workers) ;
+  - factures (client et admin) : get_order_or_404 ;
+  - admin : « Commandes archivées », en lecture seule.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Prefetch
+from django.http import Http404
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ARCHIVABLE_STATUSES = ('DELIVERED', 'CANCELLED')
+HORIZON_CACHE_KEY = 'shop:order_archive:horizon'
+# Cache partagé entre les workers, relu au plus tard après ce délai (cache vidé, Redis redémarré...)
+HORIZON_CACHE_TIMEOUT = 60 * 10
+
+# Mêmes colonnes des deux côtés (attname : user_id, zone_id...)
+ORDER_FIELDS = [field.attname for field in Order._meta.concrete_fields]
+ITEM_FIELDS = [field.attname for field in OrderItem._meta.concrete_fields]
+
+
+def cutoff(days=None):
+    days = settings.SHOP_ORDER_ARCHIVE_DAYS if days is None else days
+    return timezone.now() - datetime.timedelta(days=days)
+
+
+def archivable(before):
+    """Commandes terminées créées avant `before`"""
+    return Order.objects.filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=before)
+
+
+def archive_batch(order_ids):
+    """Déplace ces commandes et leurs lignes vers les archives ; retourne (commandes, lignes)"""
+    with transaction.atomic():
+        # Relues sous verrou : une commande repassée entre-temps dans le workflow reste en place
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(id__in=order_ids, status__in=ARCHIVABLE_STATUSES)
+            .values(*ORDER_FIELDS)
+        )
+        if not orders:
+            return 0, 0
+        ids = [row['id'] for row in orders]
+        items = list(OrderItem.objects.filter(order_id__in=ids).values(*ITEM_FIELDS))
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**row) for row in orders])
+        ArchivedOrderItem.objects.bulk_create([ArchivedOrderItem(**row) for row in items])
+        # delete() plutôt qu'une suppression brute : post_delete invalide l'historique des clients
+        Order.objects.filter(id__in=ids).delete()
+
+        newest = max(row['created_at'] for row in orders)
+        transaction.on_commit(lambda: _extend_horizon(newest))
+    return len(ids), len(items)
+
+
+def horizon():
+    """created_at de la commande archivée la plus récente (None : aucune archive)"""
+    value = cache.get(HORIZON_CACHE_KEY)
+    if value is None:
+        value = ArchivedOrder.objects.aggregate(newest=Max('created_at'))['newest'] or False
+        cache.set(HORIZON_CACHE_KEY, value, HORIZON_CACHE_TIMEOUT)
+    return value or None
+
+
+def _extend_horizon(created_at):
+    current = horizon()
+    if current is None or created_at > current:
+        cache.set(HORIZON_CACHE_KEY, created_at, HORIZON_CACHE_TIMEOUT)
+
+
+def get_order_or_404(**lookup):
+    """Commande active, sinon archivée (mêmes identifiants), lignes et produits préchargés"""
+    for model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        order = model.objects.prefetch_related(
+            Prefetch('items', queryset=item_model.objects.select_related('product'))
+        ).filter(**lookup).first()
+        if order is not None:
+            return order
+    raise Http404("Commande introuvable.")
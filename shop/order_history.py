@@ -0,0 +1,95 @@
+"""
+Historique de commandes du client.
+
+Pagination par curseur sur (user, created_at, id) : chaque page est une
+lecture sur l'index shop_order_user_created_idx, quelle que soit la
+profondeur (pas d'OFFSET). Les lignes et leurs produits sont préchargés
+en une requête. La première page (la plus consultée) est mise en cache
+par utilisateur et invalidée dès qu'une de ses commandes change. Ce cache
+doit être partagé entre les workers (settings.CACHES : Redis ou table en
+base) : un client qui commande sur un worker et ouvre son historique sur un
+autre doit y trouver sa commande.
+
+Les commandes archivées (shop/order_archive.py) sont lues avec le même
+curseur sur shop_archorder_user_idx et fusionnées, seulement quand la page
+descend jusqu'à l'horizon d'archivage : les pages récentes n'y touchent pas.
+"""
+import base64
+import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, Q
+
+from . import order_archive
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+PAGE_SIZE = 10
+FIRST_PAGE_CACHE_KEY = 'shop:order_history:{}'
+FIRST_PAGE_CACHE_TIMEOUT = 60 * 15
+
+
+def encode_cursor(order):
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Retourne (created_at, id) ou None si le curseur est invalide"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _page(order_model, item_model, user, position):
+    queryset = (
+        order_model.objects.filter(user=user)
+        .order_by('-created_at', '-id')
+        .prefetch_related(
+            Prefetch('items', queryset=item_model.objects.select_related('product').only(
+                'id', 'order_id', 'price', 'quantity', 'color', 'size', 'capacity', 'product__id', 'product__nom',
+            ))
+        )
+    )
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    # Une commande de plus pour savoir s'il existe une page suivante
+    return list(queryset[:PAGE_SIZE + 1])
+
+
+def _fetch_page(user, position=None):
+    orders = _page(Order, OrderItem, user, position)
+    horizon = order_archive.horizon()
+    # Des archives peuvent s'intercaler dès que la page atteint l'horizon (ou n'est pas pleine)
+    if horizon and (len(orders) <= PAGE_SIZE or orders[-1].created_at <= horizon):
+        orders = sorted(
+            orders + _page(ArchivedOrder, ArchivedOrderItem, user, position),
+            key=lambda order: (order.created_at, order.id), reverse=True,
+        )[:PAGE_SIZE + 1]
+    next_cursor = encode_cursor(orders[PAGE_SIZE - 1]) if len(orders) > PAGE_SIZE else None
+    return orders[:PAGE_SIZE], next_cursor
+
+
+def get_page(user, cursor=None):
+    """Retourne (commandes, curseur de la page suivante ou None)"""
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        return _fetch_page(user, position)
+
+    key = FIRST_PAGE_CACHE_KEY.format(user.pk)
+    page = cache.get(key)
+    if page is None:
+        page = _fetch_page(user)
+        cache.set(key, page, FIRST_PAGE_CACHE_TIMEOUT)
+    return page
+
+
+def invalidate(user_ids):
+    """Périme la première page des utilisateurs concernés (après le commit)"""
+    keys = [FIRST_PAGE_CACHE_KEY.format(pk) for pk in set(user_ids) if pk]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
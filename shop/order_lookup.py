@@ -0,0 +1,113 @@
+"""
+Recherche de commandes pour le support client.
+
+Au lieu des 4 icontains de l'admin (scan complet de la table à chaque
+recherche), on aiguille la saisie vers l'index adapté :
+  - référence NEX-AAAA-XXXXXXXX -> index unique sur reference
+    (ou début de référence, NEX-2024-3F : préfixe sur le même index)
+  - e-mail                     -> index fonctionnel lower(email)
+  - téléphone                  -> index sur phone_normalized
+  - nom                        -> index trigramme (pg_trgm sur PostgreSQL,
+                                  table FTS5 « trigram » sur SQLite)
+"""
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from .models import Order, normalize_phone
+
+REFERENCE_RE = re.compile(r'^NEX-\d{4}-[0-9A-F]{8}$', re.IGNORECASE)
+REFERENCE_PREFIX_RE = re.compile(r'^NEX(-[0-9A-F-]*)?$', re.IGNORECASE)
+PHONE_RE = re.compile(r'^\+?[\d\s().-]{6,}$')
+
+SQLITE_FTS_TABLE = 'shop_order_name_fts'
+
+_SQLITE_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} "
+    f"USING fts5(full_name, content='shop_order', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ai AFTER INSERT ON shop_order BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, full_name) VALUES (new.id, new.full_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ad AFTER DELETE ON shop_order BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, full_name) VALUES ('delete', old.id, old.full_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_au AFTER UPDATE OF full_name ON shop_order BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, full_name) VALUES ('delete', old.id, old.full_name); "
+    f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, full_name) VALUES (new.id, new.full_name); END",
+]
+
+_sqlite_fts_ready = {}
+
+
+def ensure_sqlite_fts(using='default'):
+    """
+    Installe (ou réinstalle) l'index FTS5 trigramme sur SQLite.
+    Appelé après chaque migrate : SQLite reconstruit la table shop_order lors
+    de certains ALTER, ce qui supprime ses triggers.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                       [f'{SQLITE_FTS_TABLE}_%'])
+        triggers_ok = cursor.fetchone()[0] == 3
+        try:
+            for sql in _SQLITE_FTS_SQL:
+                cursor.execute(sql)
+        except Exception:
+            # SQLite < 3.34 : pas de tokenizer trigram, on restera sur icontains
+            _sqlite_fts_ready[using] = False
+            return False
+        if not triggers_ok:
+            cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
+    _sqlite_fts_ready[using] = True
+    return True
+
+
+def _sqlite_fts_available(using):
+    if using not in _sqlite_fts_ready:
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE name = %s", [SQLITE_FTS_TABLE])
+            _sqlite_fts_ready[using] = cursor.fetchone()[0] == 1
+    return _sqlite_fts_ready[using]
+
+
+def _search_by_name(queryset, term):
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and len(term) >= 3:
+        # Nécessite django.contrib.postgres (ajouté dans settings si PostgreSQL)
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        # Un seul opérateur (%>) servi par l'index GIN : un OU avec icontains (UPPER ... LIKE)
+        # forcerait un parcours complet. La similarité « mot » retrouve aussi un nom partiel.
+        return (
+            queryset.annotate(similarity=TrigramWordSimilarity(term, 'full_name'))
+            .filter(full_name__trigram_word_similar=term)
+            .order_by('-similarity', '-created_at')
+        )
+    if connection.vendor == 'sqlite' and len(term) >= 3 and _sqlite_fts_available(queryset.db):
+        match = '"{}"'.format(term.replace('"', '""'))
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s", [match])
+        )
+    return queryset.filter(full_name__icontains=term)
+
+
+def lookup_orders(term, queryset=None):
+    """Retourne les commandes correspondant à la saisie du support"""
+    queryset = Order.objects.all() if queryset is None else queryset
+    term = (term or '').strip()
+    if not term:
+        return queryset
+
+    if REFERENCE_RE.match(term):
+        return queryset.filter(reference=term.upper())
+    if REFERENCE_PREFIX_RE.match(term):
+        # Références stockées en majuscules : équivaut à istartswith, sans UPPER() qui écarterait l'index
+        return queryset.filter(reference__startswith=term.upper())
+    if '@' in term:
+        return queryset.alias(email_lower=Lower('email')).filter(email_lower=term.lower())
+    if PHONE_RE.match(term):
+        return queryset.filter(phone_normalized=normalize_phone(term))
+    return _search_by_name(queryset, term)
@@ -0,0 +1,158 @@
+"""
+Machine à états des commandes.
+
+Toutes les transitions de statut (actions admin, formulaire de commande)
+passent par transition_orders() : un lot de N commandes coûte un nombre
+FIXE de requêtes, et les effets lents (e-mails, factures) partent en
+tâche de fond après le commit.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.core.mail import send_mass_mail
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Sum
+from django.dispatch import Signal
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import inventory
+from .models import Order, OrderItem, ProductVariant
+from .tasks import enqueue
+
+# Transitions autorisées : statut actuel -> statuts cibles possibles
+TRANSITIONS = {
+    'PENDING': {'PAID', 'CANCELLED'},
+    'PAID': {'SHIPPED', 'CANCELLED'},
+    'SHIPPED': {'DELIVERED'},
+    'DELIVERED': set(),
+    'CANCELLED': set(),
+}
+
+# Envoyé une seule fois par lot, après la mise à jour (dans la transaction).
+# Arguments : target (statut cible), order_ids (liste des commandes modifiées)
+orders_transitioned = Signal()
+
+INVOICE_CACHE_KEY = 'shop:invoice:{}:{}'
+INVOICE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def can_transition(source, target):
+    return target in TRANSITIONS.get(source, set())
+
+
+def sources_for(target):
+    """Statuts depuis lesquels on peut atteindre target"""
+    return [source for source, targets in TRANSITIONS.items() if target in targets]
+
+
+@transaction.atomic
+def transition_orders(queryset, target):
+    """
+    Fait passer les commandes de queryset au statut target.
+    Les commandes dont le statut actuel n'autorise pas la transition sont ignorées.
+    Retourne (nombre de commandes modifiées, nombre de commandes ignorées).
+    """
+    if target not in TRANSITIONS:
+        raise ValueError(f"Statut inconnu : {target}")
+
+    # 1. Verrouillage des commandes éligibles (1 requête)
+    rows = list(
+        queryset.select_for_update()
+        .order_by()
+        .values_list('id', 'status')
+    )
+    order_ids = [pk for pk, status in rows if can_transition(status, target)]
+    skipped = len(rows) - len(order_ids)
+    if not order_ids:
+        return 0, skipped
+
+    # 2. Mise à jour groupée (1 requête)
+    changes = {'status': target, 'updated_at': timezone.now()}
+    if target == 'PAID':
+        changes['is_paid'] = True
+    elif target == 'CANCELLED':
+        # Une commande annulée sort du chiffre d'affaires (widgets admin filtrés sur is_paid)
+        changes['is_paid'] = False
+    Order.objects.filter(id__in=order_ids).update(**changes)
+
+    # 3. Effets synchrones (intégrité des données)
+    if target == 'CANCELLED':
+        _restock(order_ids)
+
+    # 4. Effets différés, exécutés après le commit
+    enqueue(prerender_invoices, order_ids)
+    enqueue(send_status_emails, order_ids, target)
+
+    orders_transitioned.send(sender=Order, target=target, order_ids=order_ids)
+    return len(order_ids), skipped
+
+
+def _restock(order_ids):
+    """Remet en stock les articles des commandes annulées (par SKU, 3 à 4 requêtes)"""
+    rows = list(
+        OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False)
+        .values('product_id', 'variant_id')
+        .annotate(qty=Sum('quantity'))
+    )
+    quantities = defaultdict(int)
+    for row in rows:
+        if row['variant_id']:
+            quantities[row['variant_id']] += row['qty']
+    # Lignes antérieures aux variantes (ou variante supprimée) : sur la première variante du produit,
+    # pour que quantite_stocks reste la somme des variantes
+    legacy = {row['product_id']: row['qty'] for row in rows if not row['variant_id']}
+    if legacy:
+        first_variants = (
+            ProductVariant.objects.filter(product_id__in=list(legacy))
+            .values('product_id').annotate(first=Min('id')).values_list('product_id', 'first')
+        )
+        for product_id, variant_id in first_variants:
+            quantities[variant_id] += legacy[product_id]
+    inventory.restock(quantities)
+
+
+# --- Tâches de fond ---
+
+def prerender_invoices(order_ids):
+    """Pré-calcule le HTML des factures pour l'admin et le PDF, dans le cache partagé entre les workers"""
+    orders = Order.objects.filter(id__in=order_ids).select_related('user').prefetch_related('items__product')
+    cache.set_many(
+        {_invoice_key(order): render_to_string('admin/shop/order/invoice.html', {'order': order})
+         for order in orders},
+        INVOICE_CACHE_TIMEOUT,
+    )
+
+
+def _invoice_key(order):
+    # updated_at dans la clé : toute modification de la commande périme la facture
+    return INVOICE_CACHE_KEY.format(order.id, order.updated_at.timestamp())
+
+
+def get_invoice_html(order):
+    """HTML de la facture : version pré-calculée (quel que soit le worker qui l'a rendue), sinon rendu direct"""
+    key = _invoice_key(order)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('admin/shop/order/invoice.html', {'order': order})
+        cache.set(key, html, INVOICE_CACHE_TIMEOUT)
+    return html
+
+
+def send_status_emails(order_ids, target):
+    """Informe les clients du nouveau statut (une seule connexion SMTP pour tout le lot)"""
+    label = dict(Order.STATUS_CHOICES)[target]
+    messages = [
+        (
+            f"Commande {reference} : {label}",
+            f"Bonjour {full_name},\n\nVotre commande {reference} est maintenant : {label}.\n\nL'équipe NexusShop",
+            settings.DEFAULT_FROM_EMAIL,
+            [email],
+        )
+        for reference, full_name, email in Order.objects.filter(id__in=order_ids)
+        .values_list('reference', 'full_name', 'email')
+        if email
+    ]
+    if messages:
+        send_mass_mail(messages, fail_silently=True)
@@ -0,0 +1,223 @@
+"""
+Moteur de prix : promotions par règles (PromotionRule).
+
+Une règle vise tout le catalogue, une catégorie, une sous-catégorie, une
+marque ou un produit (critères cumulables), en pourcentage ou en montant
+fixe, sur une fenêtre de temps. Le prix promotionnel propre au produit
+(prix_promotionnel + dates) reste une règle implicite de priorité 0.
+Parmi les règles applicables, la plus forte priorité l'emporte ; à
+égalité, le prix le plus bas.
+
+- Les règles actives sont compilées en un index par périmètre (produit,
+  sous-catégorie, catégorie, marque, catalogue) : évaluer une liste de
+  produits ne coûte que quelques lookups de dict par produit, sans SQL.
+- L'index est mis en cache (cache Django partagé entre les workers,
+  settings.CACHES : Redis ou table en base, + copie locale au processus)
+  jusqu'à la prochaine borne : début d'une règle à venir ou fin
+  d'une règle active. Les prix résolus sont mémorisés avec l'index, chacun
+  jusqu'à sa propre borne (la fenêtre promo du produit peut être plus courte).
+- Une règle modifiée dans l'admin invalide le cache (voir shop/signals.py) ;
+  les autres processus la voient au plus tard après SHOP_PRICING_LOCAL_TTL
+  secondes.
+
+apply(products) annote une liste de produits en une passe ; Product.get_price
+et Product.est_en_promo passent par là (cartes, fiche, panier, checkout).
+"""
+import datetime
+import hashlib
+import time
+from collections import defaultdict, namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PromotionRule
+
+RULES_CACHE_KEY = 'shop:pricing:rules'
+# Sans borne connue, l'index est tout de même recompilé une fois par jour
+MAX_CACHE_SECONDS = 24 * 3600
+# Au-delà, la mémoire des prix résolus est vidée (catalogue très large)
+MAX_RESOLVED = 50_000
+
+# Prix d'un produit : final, catalogue, règle appliquée (None : aucune, '' : promo du produit), fin de la remise
+Tarif = namedtuple('Tarif', 'price regular rule ends_at')
+
+Rule = namedtuple('Rule', 'nom type_remise valeur categorie_id subcategorie_id marque product_id date_fin priorite')
+
+
+def _scope(rule):
+    """Critère le plus sélectif de la règle : c'est sous lui qu'elle est indexée"""
+    if rule.product_id:
+        return ('product', rule.product_id)
+    if rule.subcategorie_id:
+        return ('subcategorie', rule.subcategorie_id)
+    if rule.categorie_id:
+        return ('categorie', rule.categorie_id)
+    if rule.marque:
+        return ('marque', rule.marque)
+    return ('all', None)
+
+
+def _scopes(product):
+    return [
+        ('product', product.id),
+        ('subcategorie', product.subcategorie_id),
+        ('categorie', product.categorie_id),
+        ('marque', (product.marque or '').strip().lower()),
+        ('all', None),
+    ]
+
+
+def _matches(rule, product):
+    return (
+        (not rule.product_id or rule.product_id == product.id)
+        and (not rule.subcategorie_id or rule.subcategorie_id == product.subcategorie_id)
+        and (not rule.categorie_id or rule.categorie_id == product.categorie_id)
+        and (not rule.marque or rule.marque == (product.marque or '').strip().lower())
+    )
+
+
+def discounted(prix, type_remise, valeur):
+    """Prix remisé, arrondi au franc (2 décimales comme les champs prix)"""
+    if type_remise == 'POURCENT':
+        price = (prix * (100 - valeur) / 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+    else:
+        price = prix - valeur
+    return max(price, Decimal(0)).quantize(Decimal('0.01'))
+
+
+class RuleSet:
+    """Règles actives indexées par périmètre, valables jusqu'à valid_until"""
+
+    def __init__(self, token, rules, valid_until, compiled_at):
+        self.token = token
+        self.valid_until = valid_until
+        # Les prix n'ont pas pu changer depuis (sert de Last-Modified à l'API catalogue)
+        self.compiled_at = compiled_at
+        self.by_scope = defaultdict(list)
+        for rule in rules:
+            self.by_scope[_scope(rule)].append(rule)
+        self._resolved = {}
+
+    def resolve(self, product, now):
+        key = (product.id, product.prix, product.prix_promotionnel, product.date_debut_promo,
+               product.date_fin_promo, product.categorie_id, product.subcategorie_id, product.marque)
+        hit = self._resolved.get(key)
+        if hit is not None and now < hit[1]:
+            return hit[0]
+        tarif, until = self._evaluate(product, now)
+        if product.id is not None:
+            if len(self._resolved) >= MAX_RESOLVED:
+                self._resolved.clear()
+            self._resolved[key] = (tarif, until)
+        return tarif
+
+    def _evaluate(self, product, now):
+        """(Tarif, borne de validité) pour un produit"""
+        until = self.valid_until
+        best = None  # (priorité, -prix, prix, règle, fin)
+
+        # Promotion propre au produit : règle implicite de priorité 0
+        debut, fin = product.date_debut_promo, product.date_fin_promo
+        if product.prix_promotionnel and debut and fin:
+            if debut <= now <= fin:
+                best = (0, -product.prix_promotionnel, product.prix_promotionnel, '', fin)
+                until = min(until, fin + datetime.timedelta(microseconds=1))
+            elif now < debut:
+                until = min(until, debut)
+
+        for scope in _scopes(product):
+            for rule in self.by_scope.get(scope, ()):
+                if not _matches(rule, product):
+                    continue
+                price = discounted(product.prix, rule.type_remise, rule.valeur)
+                candidate = (rule.priorite, -price, price, rule.nom, rule.date_fin)
+                if best is None or candidate[:2] > best[:2]:
+                    best = candidate
+
+        if best is None or best[2] >= product.prix:
+            return Tarif(product.prix, product.prix, None, None), until
+        return Tarif(best[2], product.prix, best[3], best[4]), until
+
+
+def _compile(now):
+    """Charge les règles actives ou à venir (1 requête) ; retourne l'état à mettre en cache"""
+    rows = PromotionRule.objects.filter(actif=True).filter(
+        Q(date_fin__isnull=True) | Q(date_fin__gt=now)
+    ).values_list('nom', 'type_remise', 'valeur', 'categorie_id', 'subcategorie_id', 'marque', 'product_id',
+                  'date_fin', 'priorite', 'date_debut')
+    rules, boundaries = [], []
+    for *fields, date_debut in rows:
+        rule = Rule(*fields)._replace(marque=fields[5].strip().lower())
+        if date_debut and date_debut > now:
+            boundaries.append(date_debut)  # entrera en vigueur
+            continue
+        rules.append(rule)
+        if rule.date_fin:
+            boundaries.append(rule.date_fin)  # expirera
+    valid_until = min(boundaries, default=now + datetime.timedelta(seconds=MAX_CACHE_SECONDS))
+    # Jeton tiré du contenu (règles, borne ou jour sans borne) : deux processus qui compilent
+    # le même état obtiennent le même jeton, donc les mêmes ETag d'API
+    epoch = min(boundaries) if boundaries else timezone.localdate(now)
+    token = hashlib.sha1(repr((sorted(map(repr, rules)), epoch)).encode()).hexdigest()
+    return {'token': token, 'rules': rules, 'valid_until': valid_until, 'compiled_at': now}
+
+
+class _Local:
+    ruleset = None
+    checked = 0.0
+
+
+_local = _Local()
+
+
+def current_rules(now=None):
+    """Index des règles en vigueur (aucune requête tant que le cache est valable)"""
+    now = now or timezone.now()
+    ruleset = _local.ruleset
+    local_ttl = getattr(settings, 'SHOP_PRICING_LOCAL_TTL', 5)
+    if ruleset is not None and now < ruleset.valid_until and time.monotonic() < _local.checked + local_ttl:
+        return ruleset
+
+    state = cache.get(RULES_CACHE_KEY)
+    if state is None or now >= state['valid_until']:
+        state = _compile(now)
+        timeout = max(1, min(MAX_CACHE_SECONDS, int((state['valid_until'] - now).total_seconds()) + 1))
+        cache.set(RULES_CACHE_KEY, state, timeout)
+    if ruleset is None or ruleset.token != state['token']:
+        ruleset = RuleSet(state['token'], state['rules'], state['valid_until'], state.get('compiled_at', now))
+    _local.ruleset, _local.checked = ruleset, time.monotonic()
+    return ruleset
+
+
+def apply(products, now=None):
+    """Résout le prix de toute une liste de produits en une passe (product.tarif) ; retourne la liste"""
+    now = now or timezone.now()
+    ruleset = current_rules(now)
+    for product in products:
+        product._tarif = ruleset.resolve(product, now)
+    return products
+
+
+# Champs lus par le moteur : à inclure dans les values() passées à apply_rows()
+PRICED_FIELDS = ('id', 'prix', 'prix_promotionnel', 'date_debut_promo', 'date_fin_promo',
+                 'categorie_id', 'subcategorie_id', 'marque')
+_PricedRow = namedtuple('_PricedRow', PRICED_FIELDS)
+
+
+def apply_rows(rows, now=None):
+    """Comme apply(), pour des dicts values() (API) : row['tarif'], sans instancier de modèle"""
+    now = now or timezone.now()
+    ruleset = current_rules(now)
+    for row in rows:
+        row['tarif'] = ruleset.resolve(_PricedRow(*(row[field] for field in PRICED_FIELDS)), now)
+    return rows
+
+
+def invalidate():
+    """Après une modification de règle : recompilation à la prochaine lecture"""
+    cache.delete(RULES_CACHE_KEY)
+    _local.ruleset = None
@@ -0,0 +1,306 @@
+"""
+Profilage à la demande d'une requête de production.
+
+Déclenchement (ProfilingMiddleware, placé après l'authentification) :
+  - par un membre du staff : en-tête « X-Profile: 1 » ou paramètre ?_profile=1 ;
+    la réponse porte alors X-Profile-Id et n'est jamais mise en cache ;
+  - par échantillonnage : une requête sur SHOP_PROFILING_SAMPLE_EVERY (0 : jamais).
+
+Une trace réunit le profil cProfile de la requête (vue, middlewares
+suivants, rendu des templates), ses requêtes SQL (texte et durée) et la
+durée de chaque template. Un seul profil cProfile à la fois par processus :
+une requête profilée pendant une autre n'a que ses SQL et ses templates.
+Sous ASGI, cProfile ne voit que le thread de la boucle (y compris les autres
+requêtes servies pendant ce temps) : le travail confié à sync_to_async (ORM
+des vues async) n'apparaît que dans les requêtes SQL et les templates.
+
+Stockage : un .json lisible et un .prof (pstats / snakeviz) par trace dans
+SHOP_PROFILING_DIR, nommés par horodatage et pid : deux workers ne se
+marchent jamais dessus et X-Profile-Id désigne toujours la bonne trace.
+Après chaque écriture, les traces les plus anciennes au-delà de
+SHOP_PROFILING_MAX_TRACES sont supprimées. Consultation : « Profils de
+requêtes » dans l'admin (/dashboard/profiles/).
+
+Désactivé (ni drapeau, ni tirage), le coût par requête se limite à deux
+tests ; le wrapper SQL et le rendu des templates ne lisent qu'une ContextVar.
+"""
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+
+TRACE_ID_RE = re.compile(r'\d{20}-\d+')
+FLAG_PARAM = '_profile'
+FLAG_HEADER = 'HTTP_X_PROFILE'
+# Bornes d'une trace : le disque reste prévisible quel que soit le nombre de requêtes SQL
+MAX_QUERIES = 500
+MAX_SQL_LENGTH = 2000
+TOP_FUNCTIONS = 60
+
+_current = ContextVar('shop_profiling_trace', default=None)
+# cProfile est global au processus (sys.monitoring) : un seul profil actif
+_profiler_lock = threading.Lock()
+
+
+def _directory():
+    return Path(getattr(settings, 'SHOP_PROFILING_DIR', None) or Path(tempfile.gettempdir()) / 'shop-profiles')
+
+
+def _max_traces():
+    return max(getattr(settings, 'SHOP_PROFILING_MAX_TRACES', 200), 1)
+
+
+class Trace:
+    """Mesures d'une requête profilée (portée par une ContextVar)"""
+
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.queries = []
+        self.query_count = 0
+        self.db_time = 0.0
+        self.templates = []
+        self.template_depth = 0
+        self.profiler = None
+        self.started = time.perf_counter()
+
+    def start(self):
+        if _profiler_lock.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            _profiler_lock.release()
+
+
+# --- Déclenchement ---
+
+def _flagged(request):
+    return FLAG_PARAM in request.GET or FLAG_HEADER in request.META
+
+
+def _sampled():
+    every = getattr(settings, 'SHOP_PROFILING_SAMPLE_EVERY', 0)
+    return bool(every) and random.randrange(every) == 0
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Utilisateur chargé seulement si le drapeau est présent (cas rare)
+        trigger = 'staff' if _flagged(request) and request.user.is_staff else 'sample' if _sampled() else None
+        if trigger is None:
+            return self.get_response(request)
+        trace, token = self._start(trigger)
+        try:
+            response = self.get_response(request)
+        finally:
+            trace.stop()
+            _current.reset(token)
+        return self._finish(request, response, trace)
+
+    async def __acall__(self, request):
+        trigger = 'staff' if _flagged(request) and (await request.auser()).is_staff else 'sample' if _sampled() else None
+        if trigger is None:
+            return await self.get_response(request)
+        trace, token = self._start(trigger)
+        try:
+            response = await self.get_response(request)
+        finally:
+            trace.stop()
+            _current.reset(token)
+        # Écriture disque et compteur du cache hors de la boucle
+        return await sync_to_async(self._finish)(request, response, trace)
+
+    def _start(self, trigger):
+        trace = Trace(trigger)
+        token = _current.set(trace)
+        trace.start()
+        return trace, token
+
+    def _finish(self, request, response, trace):
+        duration = time.perf_counter() - trace.started
+        trace_id = save(request, response, trace, duration)
+        if trace.trigger == 'staff':
+            response['X-Profile-Id'] = trace_id
+            # Page profilée : propre à ce membre du staff, jamais servie par un cache partagé
+            patch_cache_control(response, private=True, no_store=True)
+        return response
+
+
+# --- Instrumentation (installée par ShopConfig.ready) ---
+
+def _db_wrapper(execute, sql, params, many, context):
+    trace = _current.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        trace.query_count += 1
+        trace.db_time += elapsed
+        if len(trace.queries) < MAX_QUERIES:
+            trace.queries.append({'sql': sql[:MAX_SQL_LENGTH], 'ms': round(elapsed * 1000, 3), 'many': many})
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def _patch_template_render():
+    from django.template.base import Template
+
+    original = Template.render
+    if getattr(original, '_shop_profiling', False):
+        return
+
+    def render(self, context):
+        trace = _current.get()
+        if trace is None:
+            return original(self, context)
+        # Chaque template (include compris), avec sa profondeur et son temps inclusif
+        entry = {'name': self.origin.template_name or self.origin.name, 'depth': trace.template_depth, 'ms': 0.0}
+        trace.templates.append(entry)
+        trace.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            entry['ms'] = round((time.perf_counter() - start) * 1000, 3)
+            trace.template_depth -= 1
+
+    render._shop_profiling = True
+    Template.render = render
+
+
+def install():
+    connection_created.connect(_on_connection_created, dispatch_uid='shop_profiling_db')
+    _patch_template_render()
+
+
+# --- Traces sur disque ---
+
+def new_trace_id():
+    """Nom unique entre processus et machines partageant le répertoire ; l'ordre des noms est l'ordre chronologique"""
+    return f'{time.time_ns():020d}-{os.getpid()}'
+
+
+def _path(trace_id, suffix):
+    # Identifiant venu de l'URL : jamais un chemin
+    if not TRACE_ID_RE.fullmatch(str(trace_id)):
+        return None
+    return _directory() / f'{trace_id}{suffix}'
+
+
+def _write(path, data):
+    # Écriture atomique : un lecteur ne voit jamais une trace à moitié écrite
+    temporary = path.with_name(f'.{path.name}.tmp')
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+def _prune(directory):
+    """Supprime les traces les plus anciennes au-delà de SHOP_PROFILING_MAX_TRACES"""
+    names = sorted(path.stem for path in directory.glob('*.json') if TRACE_ID_RE.fullmatch(path.stem))
+    for name in names[:max(len(names) - _max_traces(), 0)]:
+        for suffix in ('.json', '.prof'):
+            # Un autre worker peut élaguer en même temps
+            (directory / f'{name}{suffix}').unlink(missing_ok=True)
+
+
+def _summary(profiler):
+    if profiler is None:
+        return "Profil cProfile indisponible : un autre profilage était en cours dans ce processus."
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    return stream.getvalue()
+
+
+def save(request, response, trace, duration):
+    """Écrit la trace sous un nouvel identifiant et élague les plus anciennes ; retourne l'identifiant"""
+    trace_id = new_trace_id()
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'user', None)
+    data = {
+        'id': trace_id,
+        'created_at': timezone.now().isoformat(),
+        'trigger': trace.trigger,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'status': response.status_code,
+        'user': user.get_username() if user is not None and user.is_authenticated else None,
+        'duration_ms': round(duration * 1000, 3),
+        'sql': {'count': trace.query_count, 'ms': round(trace.db_time * 1000, 3), 'queries': trace.queries},
+        'templates': trace.templates,
+        'profile': _summary(trace.profiler),
+        'has_profile': trace.profiler is not None,
+    }
+    directory = _directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    if trace.profiler is not None:
+        trace.profiler.create_stats()
+        _write(directory / f'{trace_id}.prof', marshal.dumps(trace.profiler.stats))
+    _write(directory / f'{trace_id}.json', json.dumps(data, ensure_ascii=False).encode())
+    _prune(directory)
+    return trace_id
+
+
+def load(trace_id):
+    """Trace complète, ou None (inconnue ou déjà élaguée)"""
+    path = _path(trace_id, '.json')
+    try:
+        return json.loads(path.read_text()) if path else None
+    except (OSError, ValueError):
+        return None
+
+
+def profile_path(trace_id):
+    path = _path(trace_id, '.prof')
+    return path if path is not None and path.is_file() else None
+
+
+def recent():
+    """Résumés des traces présentes, les plus récentes d'abord"""
+    traces = []
+    directory = _directory()
+    if not directory.is_dir():
+        return traces
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        trace = load(path.stem)
+        if trace is not None:
+            trace['sql_count'] = trace['sql']['count']
+            trace['sql_ms'] = trace['sql']['ms']
+            for heavy in ('sql', 'templates', 'profile'):
+                trace.pop(heavy)
+            traces.append(trace)
+    return traces
@@ -0,0 +1,233 @@
+"""
+Détection des N+1 et budgets de requêtes SQL par vue (développement / tests).
+
+- QueryBudgetMiddleware suit les requêtes SQL de chaque requête HTTP et
+  repère les « formes » répétées (même SQL aux paramètres près) : dès
+  qu'une forme revient SHOP_QUERY_CHECKS_THRESHOLD fois, la ligne de
+  template ou de code qui l'a déclenchée est relevée.
+- Une vue déclare son budget avec @query_budget(n) (vue fonction) ou
+  l'attribut query_budget (vue classe) ; les requêtes des middlewares
+  (session, utilisateur) sont comptées, pas celles du cache partagé
+  quand il est en base (DatabaseCache).
+- SHOP_QUERY_CHECKS : 'warn' (journal shop.queries), 'raise'
+  (QueryBudgetError en fin de requête) ou vide (désactivé, production).
+- QueryBudgetTestMixin vérifie ces budgets dans les tests, sur des
+  données générées par seed_shop.
+"""
+import io
+import logging
+import re
+import sys
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.management import call_command
+from django.db.backends.signals import connection_created
+from django.urls import resolve
+
+from . import metrics
+from .db_router import is_cache_sql
+
+logger = logging.getLogger('shop.queries')
+
+_current = ContextVar('shop_query_budget', default=None)
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+# Contrôle de transaction (BEGIN n'est envoyé comme requête que par SQLite, par exemple pour le cache en base)
+_IGNORED_PREFIXES = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+# Les wrappers SQL de ces modules ne sont jamais l'origine d'une requête
+_INSTRUMENTATION_FILES = {__file__, metrics.__file__}
+
+
+class QueryBudgetError(Exception):
+    """Budget dépassé ou N+1 détecté (mode 'raise')"""
+
+
+def query_budget(limit):
+    """Déclare le nombre maximal de requêtes SQL d'une vue fonction"""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def get_budget(view):
+    """Budget d'une vue résolue (fonction décorée ou vue classe)"""
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+def normalize_sql(sql):
+    """Forme d'une requête : listes IN et littéraux numériques écrasés"""
+    return _NUMBER_RE.sub('N', _IN_LIST_RE.sub('IN (...)', sql))
+
+
+def _template_location(frame):
+    # Le nœud de template le plus interne en cours de rendu
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f"{origin.template_name or origin.name}:{token.lineno}"
+        frame = frame.f_back
+    return None
+
+
+def _code_location(frame):
+    # La première ligne du projet (hors Django, bibliothèques et instrumentation)
+    base_dir = str(settings.BASE_DIR)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(base_dir) and 'site-packages' not in filename
+                and filename not in _INSTRUMENTATION_FILES):
+            return f"{Path(filename).relative_to(base_dir)}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return None
+
+
+class QueryTracker:
+    """Requêtes SQL d'une requête HTTP en cours (portée par une ContextVar)"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.count = 0
+        self.shapes = {}
+        self.repeated = {}
+        self.budget = None
+
+    def record(self, sql):
+        # Cache partagé en base : absent des budgets (zéro requête SQL avec Redis)
+        if sql.startswith(_IGNORED_PREFIXES) or is_cache_sql(sql):
+            return
+        self.count += 1
+        shape = normalize_sql(sql)
+        seen = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if seen == self.threshold:
+            # Relevé au moment de la répétition : c'est l'appelant fautif qui est sur la pile
+            frame = sys._getframe(2)
+            self.repeated[shape] = _template_location(frame) or _code_location(frame) or '?'
+
+    def problems(self, view_name):
+        problems = []
+        if self.budget is not None and self.count > self.budget:
+            problems.append(f"{view_name} : {self.count} requêtes SQL pour un budget de {self.budget}")
+        for shape, location in self.repeated.items():
+            problems.append(f"{view_name} : N+1 probable, {self.shapes[shape]}× depuis {location}\n    {shape[:300]}")
+        return problems
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.record(sql)
+    return execute(sql, params, many, context)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def install():
+    connection_created.connect(_on_connection_created, dispatch_uid='shop_query_budget_db')
+
+
+def _mode():
+    return getattr(settings, 'SHOP_QUERY_CHECKS', None)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        # Désactivé, ou requête déjà suivie par QueryBudgetTestMixin
+        if not _mode() or _current.get() is not None:
+            return None, None
+        tracker = QueryTracker(getattr(settings, 'SHOP_QUERY_CHECKS_THRESHOLD', 3))
+        return tracker, _current.set(tracker)
+
+    def _finish(self, request, tracker, token):
+        if tracker is None:
+            return
+        _current.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        problems = tracker.problems(match.view_name if match else request.path)
+        if not problems:
+            return
+        if _mode() == 'raise':
+            raise QueryBudgetError('\n'.join(problems))
+        for problem in problems:
+            logger.warning(problem)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tracker, token = self._start()
+        response = self.get_response(request)
+        self._finish(request, tracker, token)
+        return response
+
+    async def __acall__(self, request):
+        tracker, token = self._start()
+        response = await self.get_response(request)
+        self._finish(request, tracker, token)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tracker = _current.get()
+        if tracker is not None:
+            tracker.budget = get_budget(view_func)
+
+
+# --- Aide pour les tests ---
+
+def seed_test_data(**options):
+    """Jeu de données réaliste pour les tests de budget (seed_shop, en silence)"""
+    defaults = {'categories': 4, 'products': 40, 'users': 5, 'carts': 5, 'reviews': 80, 'orders': 60,
+                'images': 3, 'seed': 1}
+    defaults.update(options)
+    call_command('seed_shop', stdout=io.StringIO(), **defaults)
+
+
+class QueryBudgetTestMixin:
+    """
+    À mélanger dans un django.test.TestCase :
+
+        @classmethod
+        def setUpTestData(cls):
+            seed_test_data()
+
+        def test_home(self):
+            self.assertQueryBudget('/')
+    """
+
+    def assertQueryBudget(self, path, method='get', data=None, budget=None, **extra):
+        """Exécute la requête et échoue si le budget de la vue est dépassé ou si un N+1 apparaît"""
+        if budget is None:
+            budget = get_budget(resolve(path.split('?')[0]).func)
+        if budget is None:
+            self.fail(f"Aucun budget de requêtes déclaré pour {path}")
+        tracker = QueryTracker(getattr(settings, 'SHOP_QUERY_CHECKS_THRESHOLD', 3))
+        token = _current.set(tracker)
+        try:
+            response = getattr(self.client, method)(path, data or {}, **extra)
+        finally:
+            _current.reset(token)
+        tracker.budget = budget
+        problems = tracker.problems(path)
+        if problems:
+            self.fail('\n'.join(problems))
+        return response
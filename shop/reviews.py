@@ -0,0 +1,76 @@
+"""
+Avis clients : agrégats dénormalisés et pagination par curseur.
+
+Product.avis_total, avis_1..avis_5 (histogramme) et note_moyenne sont
+tenus à jour à chaque avis créé, modifié ou supprimé (une requête UPDATE,
+voir shop/signals.py) : la fiche produit, les cartes et le tri « Mieux
+notés » ne comptent jamais les avis.
+
+Les avis eux-mêmes sont chargés à la demande par pages de PAGE_SIZE,
+curseur sur (created_at, id) : lecture sur l'index
+shop_review_product_date_idx quelle que soit la profondeur (pas d'OFFSET).
+"""
+from django.db.models import Avg, Count, DecimalField, F, FloatField, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf
+from django.utils import timezone
+
+from .models import Product, Review
+from .order_history import decode_cursor, encode_cursor
+
+PAGE_SIZE = 10
+RATING_FIELDS = {stars: f'avis_{stars}' for stars in range(1, 6)}
+
+
+def _note(value):
+    """Moyenne au format de Product.note_moyenne, 0 sans avis"""
+    note = DecimalField(max_digits=3, decimal_places=2)
+    return Coalesce(Cast(value, note), Value(0, output_field=note))
+
+
+def record(product_id, rating, sign=1):
+    """Ajoute (sign=1) ou retire (sign=-1) une note des agrégats du produit (1 requête)"""
+    if rating not in RATING_FIELDS:
+        return
+    weighted = sum(F(field) * stars for stars, field in RATING_FIELDS.items()) + Value(rating * sign)
+    total = F('avis_total') + Value(sign)
+    Product.objects.filter(id=product_id).update(**{
+        'avis_total': Greatest(total, Value(0)),
+        RATING_FIELDS[rating]: Greatest(F(RATING_FIELDS[rating]) + Value(sign), Value(0)),
+        # Dans un UPDATE, toutes les colonnes de droite valent leur ancienne valeur
+        'note_moyenne': _note(Cast(weighted, FloatField()) / NullIf(total, Value(0))),
+        'date_modification': timezone.now(),
+    })
+
+
+def rebuild(product_ids=None):
+    """Recalcule les agrégats depuis les avis (après un import en masse, ou pour corriger une dérive)"""
+    def counted(**filters):
+        subquery = (
+            Review.objects.filter(product=OuterRef('pk'), **filters)
+            .order_by().values('product').annotate(n=Count('id')).values('n')
+        )
+        return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+    average = (
+        Review.objects.filter(product=OuterRef('pk'))
+        .order_by().values('product').annotate(avg=Avg('rating')).values('avg')
+    )
+    queryset = Product.objects.all() if product_ids is None else Product.objects.filter(id__in=list(product_ids))
+    return queryset.update(
+        avis_total=counted(),
+        note_moyenne=_note(Subquery(average, output_field=FloatField())),
+        **{field: counted(rating=stars) for stars, field in RATING_FIELDS.items()},
+    )
+
+
+def get_page(product_id, cursor=None):
+    """Retourne (avis, curseur de la page suivante ou None) ; curseur invalide -> première page"""
+    queryset = Review.objects.filter(product_id=product_id).select_related('user').order_by('-created_at', '-id')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    # Un avis de plus pour savoir s'il existe une page suivante
+    reviews = list(queryset[:PAGE_SIZE + 1])
+    next_cursor = encode_cursor(reviews[PAGE_SIZE - 1]) if len(reviews) > PAGE_SIZE else None
+    return reviews[:PAGE_SIZE], next_cursor
@@ -0,0 +1,155 @@
+"""
+Devis de livraison : zone, frais et délai pour un panier.
+
+La ville saisie au checkout est rattachée à une DeliveryZone (nom de la
+zone ou une de ses villes). Un produit sans zones_livraison est livrable
+partout ; sinon seulement dans ses zones.
+
+Frais : gratuits si un article est en livraison gratuite, sinon le plus
+élevé des frais fixes des produits + frais de base de la zone.
+Délai : délais les plus longs du panier + jours supplémentaires de la zone.
+
+Les règles de tous les produits et de toutes les zones tiennent dans une
+matrice en mémoire (2 requêtes pour la construire) : un devis ne fait
+aucune requête, quelle que soit la taille du panier. La matrice est
+reconstruite quand un produit ou une zone change (voir shop/signals.py) :
+chaque processus compare sa version à celle du cache partagé entre les
+workers au plus toutes les SHOP_SHIPPING_LOCAL_TTL secondes, et tout de
+suite si un devis porte sur un produit que sa matrice ne connaît pas
+(créé à l'instant dans un autre processus).
+"""
+import re
+import time
+import unicodedata
+import uuid
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DeliveryZone, Product
+
+VERSION_CACHE_KEY = 'shop:shipping:version'
+
+Zone = namedtuple('Zone', 'id name frais_base delai_supplementaire')
+ProductRule = namedtuple('ProductRule', 'frais livraison_gratuite delai_min delai_max zones')
+
+
+class Quote(namedtuple('Quote', 'zone cost delai_min delai_max undeliverable')):
+    """zone : Zone ou None (ville inconnue / non saisie) ; undeliverable : ids des produits non livrables"""
+
+    @property
+    def deliverable(self):
+        return not self.undeliverable
+
+
+def normalize_city(value):
+    """« Port-Gentil », « port gentil », « PORT GENTIL » -> « port gentil »"""
+    value = unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode()
+    return ' '.join(re.split(r'[\W_]+', value.lower())).strip()
+
+
+class ShippingMatrix:
+    def __init__(self, version):
+        self.version = version
+        self.zones = {}
+        self.cities = {}
+        for zone_id, name, villes, frais_base, delai in DeliveryZone.objects.values_list(
+            'id', 'name', 'villes', 'frais_base', 'delai_supplementaire'
+        ):
+            self.zones[zone_id] = Zone(zone_id, name, frais_base, delai)
+            for city in [name, *villes.splitlines()]:
+                if normalize_city(city):
+                    self.cities.setdefault(normalize_city(city), zone_id)
+        # Villes les plus longues d'abord : « port gentil » avant « gentil »
+        self._by_length = sorted(self.cities, key=len, reverse=True)
+
+        rows = {}
+        for product_id, frais, gratuite, delai_min, delai_max, zone_id in Product.objects.values_list(
+            'id', 'frais_livraison_fixe', 'livraison_gratuite', 'delai_min', 'delai_max', 'zones_livraison'
+        ).order_by():
+            if product_id not in rows:
+                rows[product_id] = ProductRule(frais or Decimal(0), gratuite, delai_min, delai_max, set())
+            if zone_id:
+                rows[product_id].zones.add(zone_id)
+        self.products = {pk: rule._replace(zones=frozenset(rule.zones)) for pk, rule in rows.items()}
+
+    def resolve_zone(self, city):
+        """Zone de la ville saisie (nom exact, sinon ville connue contenue dans la saisie), ou None"""
+        city = normalize_city(city)
+        if not city:
+            return None
+        zone_id = self.cities.get(city)
+        if zone_id is None:
+            padded = f" {city} "
+            zone_id = next((self.cities[known] for known in self._by_length if f" {known} " in padded), None)
+        return self.zones.get(zone_id)
+
+    def quote(self, lines, city=None):
+        """
+        Devis pour [(product_id, quantité)]. Sans ville (page panier), estimation
+        hors zone ; avec une ville non reconnue, seuls les produits livrables
+        partout sont livrables.
+        """
+        zone = self.resolve_zone(city) if city else None
+        rules = [(pk, self.products[pk]) for pk, quantity in lines if quantity and pk in self.products]
+        if not rules:
+            return Quote(zone, Decimal('0.00'), 0, 0, [])
+
+        undeliverable = []
+        if city:
+            undeliverable = [pk for pk, rule in rules if rule.zones and (zone is None or zone.id not in rule.zones)]
+
+        extra_days = zone.delai_supplementaire if zone else 0
+        if any(rule.livraison_gratuite for _, rule in rules):
+            cost = Decimal('0.00')
+        else:
+            cost = max(rule.frais for _, rule in rules) + (zone.frais_base if zone else 0)
+        return Quote(
+            zone, cost,
+            max(rule.delai_min for _, rule in rules) + extra_days,
+            max(rule.delai_max for _, rule in rules) + extra_days,
+            undeliverable,
+        )
+
+
+class _Local:
+    matrix = None
+    checked = 0.0
+
+
+_local = _Local()
+
+
+def current_matrix(product_ids=()):
+    """Matrice à jour pour ce processus et connaissant ces produits (2 requêtes seulement après une modification)"""
+    matrix = _local.matrix
+    local_ttl = getattr(settings, 'SHOP_SHIPPING_LOCAL_TTL', 5)
+    unknown = matrix is not None and any(pk not in matrix.products for pk in product_ids)
+    if matrix is not None and not unknown and time.monotonic() < _local.checked + local_ttl:
+        return matrix
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    # Produit inconnu : jamais ignoré (il serait livrable partout, sans frais), la matrice est relue
+    if matrix is None or matrix.version != version or unknown:
+        matrix = ShippingMatrix(version)
+    _local.matrix, _local.checked = matrix, time.monotonic()
+    return matrix
+
+
+def quote(lines, city=None):
+    return current_matrix([pk for pk, quantity in lines if quantity]).quote(lines, city)
+
+
+def zone_names():
+    """Noms des zones desservies (suggestions du champ ville)"""
+    return sorted(zone.name for zone in current_matrix().zones.values())
+
+
+def invalidate():
+    """Après une modification de produit ou de zone : nouvelle version, reconstruite à la prochaine lecture"""
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    _local.matrix = None
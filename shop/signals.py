@@ -1,9 +1,102 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
 from django.dispatch import receiver
-from django.contrib.auth.models import User
-from .models import Cart
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.db import transaction
+from functools import partial
+from .models import (
+    Category, DeliveryZone, Order, Product, ProductImage, ProductVariant, PromotionRule, Review, SubCategory,
+)
+from .order_workflow import orders_transitioned
+from . import api, autocomplete, bestsellers, images, live, order_history, pricing, reviews, shipping
+from .tasks import enqueue
 
-@receiver(post_save, sender=User)
-def create_user_cart(sender, instance, created, **kwargs):
-    if created:
-        Cart.objects.create(user=instance)
\ No newline at end of file
+@receiver(orders_transitioned, sender=Order)
+def update_bestsellers_on_cancel(sender, target, order_ids, **kwargs):
+    if target == 'CANCELLED':
+        bestsellers.revert_orders(order_ids)
+
+@receiver(orders_transitioned, sender=Order)
+def publish_revenue_on_paid(sender, target, order_ids, **kwargs):
+    if target == 'PAID':
+        # Même périmètre que le widget « CA du Mois » : commandes du mois en cours
+        now = timezone.now()
+        stats = Order.objects.filter(
+            id__in=order_ids, created_at__year=now.year, created_at__month=now.month
+        ).aggregate(total=Sum('total_amount'), count=Count('id'))
+        if stats['count']:
+            live.publish_revenue(stats['total'], stats['count'])
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_history(sender, instance, **kwargs):
+    order_history.invalidate([instance.user_id])
+
+@receiver(orders_transitioned, sender=Order)
+def invalidate_order_history_on_transition(sender, order_ids, **kwargs):
+    order_history.invalidate(Order.objects.filter(id__in=order_ids).values_list('user_id', flat=True).distinct())
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+def generate_image_derivatives(sender, instance, **kwargs):
+    images.schedule(instance)
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=Category)
+def delete_image_derivatives(sender, instance, **kwargs):
+    enqueue(images.release, instance)
+
+@receiver(post_save, sender=PromotionRule)
+@receiver(post_delete, sender=PromotionRule)
+def invalidate_pricing(sender, instance, **kwargs):
+    transaction.on_commit(pricing.invalidate)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=DeliveryZone)
+@receiver(post_delete, sender=DeliveryZone)
+@receiver(m2m_changed, sender=Product.zones_livraison.through)
+def invalidate_shipping_matrix(sender, **kwargs):
+    transaction.on_commit(shipping.invalidate)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def invalidate_catalog_api(sender, **kwargs):
+    # ETag / Last-Modified de l'API catalogue (shop/api.py)
+    transaction.on_commit(api.invalidate)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def refresh_product_suggestions(sender, instance, **kwargs):
+    transaction.on_commit(partial(autocomplete.record, 'p', instance.pk))
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_category_suggestions(sender, instance, **kwargs):
+    transaction.on_commit(partial(autocomplete.record, 'c', instance.pk))
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # Note chargée depuis la base : permet de déplacer l'avis dans l'histogramme s'il est modifié
+    instance._rating_initial = instance.__dict__.get('rating') if instance.pk else None
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, **kwargs):
+    previous = None if created else instance._rating_initial
+    if previous != instance.rating:
+        if previous is not None:
+            reviews.record(instance.product_id, previous, -1)
+        reviews.record(instance.product_id, instance.rating, 1)
+    instance._rating_initial = instance.rating
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    reviews.record(instance.product_id, instance._rating_initial or instance.rating, -1)
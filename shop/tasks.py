@@ -0,0 +1,49 @@
+"""
+File de tâches en arrière-plan (in-process).
+
+Pas de Celery sur Render : on exécute les traitements lourds (e-mails,
+pré-rendu des factures...) dans un petit pool de threads, APRÈS le commit
+de la transaction pour ne jamais travailler sur des données annulées.
+
+En test, SHOP_TASKS_EAGER = True exécute les tâches immédiatement.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'SHOP_TASKS_WORKERS', 2),
+            thread_name_prefix='shop-task',
+        )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Échec de la tâche %s", func.__name__)
+
+
+def _run_in_thread(func, args, kwargs):
+    _run(func, args, kwargs)
+    # Chaque thread ouvre sa propre connexion : on la libère après la tâche
+    close_old_connections()
+
+
+def enqueue(func, *args, **kwargs):
+    """Planifie func(*args, **kwargs) après le commit de la transaction courante"""
+    if getattr(settings, 'SHOP_TASKS_EAGER', False):
+        transaction.on_commit(lambda: _run(func, args, kwargs))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, func, args, kwargs))
@@ -0,0 +1,23 @@
+from django import template
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/responsive_image.html')
+def responsive_image(image, alt='', sizes='100vw', css_class='', fallback='', eager=False, element_id=''):
+    """
+    <picture> WebP + JPEG avec srcset, dimensions et placeholder flouté.
+    `image` : ProductImage, Category, ou vide (None, '' de |first) -> `fallback`.
+    """
+    if not image:
+        image = None
+    return {
+        'image': image,
+        'src': image.src if image is not None else '',
+        'alt': alt,
+        'sizes': sizes,
+        'css_class': css_class,
+        'fallback': fallback,
+        'eager': eager,
+        'element_id': element_id,
+    }
@@ -1,3 +1,1295 @@
-from django.test import TestCase
+"""
+Tests de la boutique.
 
-# Create your tests here.
+    python manage.py test
+    SQLITE_REPLICA=True python manage.py test   # + primaire / réplica en deux fichiers SQLite
+"""
+import asyncio
+import datetime
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connections, transaction
+from django.db.models import F, Sum
+from django.template import Context, Template
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    autocomplete, bestsellers, edge, inventory, live, metrics, order_archive, order_history, pricing, profiling,
+    reviews, shipping,
+)
+from .admin import OrderAdmin
+from .db_router import STICKY_COOKIE, is_cache_sql
+from .management.commands import purge_carts
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, Cart, CartItem, Category, DeliveryZone, Order, OrderItem, Product, ProductImage,
+    ProductSalesDay, ProductVariant, PromotionRule, Review,
+)
+from .order_lookup import lookup_orders
+from .order_workflow import transition_orders
+from .query_budget import QueryBudgetTestMixin, seed_test_data
+
+REPLICA = settings.SHOP_DB_REPLICAS[0] if settings.SHOP_DB_REPLICAS else None
+
+# Médias sur disque dans un répertoire jetable, statiques sans manifeste :
+# ni envoi vers Cloudinary, ni collectstatic préalable
+MEDIA_ROOT = tempfile.mkdtemp(prefix='shop-tests-')
+local_storages = override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+)
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@local_storages
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Budgets SQL des pages clés sur le jeu de données de seed_shop (N+1 compris)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_test_data()
+        cls.user = Order.objects.exclude(user=None).first().user
+        cls.product = Product.objects.filter(variants__stock__gt=5).distinct().first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_home(self):
+        self.assertEqual(self.assertQueryBudget('/').status_code, 200)
+
+    def test_listing(self):
+        self.assertEqual(self.assertQueryBudget('/products/').status_code, 200)
+        path = f'/products/?sort=popular&category={self.product.categorie.slug}'
+        self.assertEqual(self.assertQueryBudget(path).status_code, 200)
+
+    def test_detail(self):
+        self.assertEqual(self.assertQueryBudget(f'/products/{self.product.slug}/').status_code, 200)
+
+    def test_cart(self):
+        self.assertQueryBudget(f'/cart/add/{self.product.id}/', 'post', {'quantity': 1})
+        self.assertEqual(self.assertQueryBudget('/cart/').status_code, 200)
+        line = CartItem.objects.filter(cart__user=self.user).first()
+        self.assertQueryBudget(f'/cart/update/{line.id}/?action=increase')
+        self.assertQueryBudget(f'/cart/remove/{line.id}/')
+
+    def test_checkout(self):
+        self.client.post(f'/cart/add/{self.product.id}/', {'quantity': 1})
+        self.assertEqual(self.assertQueryBudget('/checkout/').status_code, 200)
+        orders = Order.objects.filter(user=self.user).count()
+        self.assertQueryBudget('/checkout/', 'post', {
+            'full_name': 'Jean Moussavou', 'email': 'jean@example.ga', 'phone': '077 12 34 56',
+            'address': 'Quartier Louis', 'city': 'Libreville',
+        })
+        self.assertEqual(Order.objects.filter(user=self.user).count(), orders + 1)
+
+    def test_order_history(self):
+        self.assertEqual(self.assertQueryBudget('/mes-commandes/').status_code, 200)
+        # Deuxième affichage : première page servie par le cache partagé
+        self.assertEqual(self.assertQueryBudget('/mes-commandes/').status_code, 200)
+
+
+def uploaded_image(name, size, mode='RGB', image_format='JPEG'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'teal').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@local_storages
+@override_settings(SHOP_TASKS_EAGER=True)
+class ImageDerivativeTests(TestCase):
+    """Dérivés WebP / JPEG générés sur FileSystemStorage et srcset rendu par {% responsive_image %}"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(nom='Ordinateur portable', prix=350000)
+
+    def add_image(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=upload)
+        image.refresh_from_db()
+        return image
+
+    def test_derivatives_generated(self):
+        image = self.add_image(uploaded_image('photo.jpg', (1200, 900)))
+        self.assertEqual((image.width, image.height), (1200, 900))
+        self.assertTrue(image.placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertEqual(image.derivatives['source'], image.image.name)
+        for key in ('webp', 'jpeg'):
+            variants = image.derivatives[key]
+            self.assertEqual([(v['width'], v['height']) for v in variants], [(320, 240), (640, 480), (1024, 768)])
+            for variant in variants:
+                self.assertTrue(os.path.isfile(os.path.join(MEDIA_ROOT, variant['name'])))
+                self.assertIn('/derivatives/', variant['name'])
+                self.assertTrue(variant['name'].endswith(f"-{variant['width']}w.{key}"))
+        self.assertEqual(image.src, image.derivatives['jpeg'][-1]['url'])
+
+    def test_no_upscaling_and_transparency(self):
+        image = self.add_image(uploaded_image('logo.png', (200, 100), mode='RGBA', image_format='PNG'))
+        self.assertEqual([v['width'] for v in image.derivatives['jpeg']], [200])
+        self.assertEqual([v['width'] for v in image.derivatives['webp']], [200])
+
+    def test_srcset_output(self):
+        image = self.add_image(uploaded_image('photo.jpg', (800, 600)))
+        jpeg = image.derivatives['jpeg']
+        self.assertEqual(image.srcset_jpeg, f"{jpeg[0]['url']} 320w, {jpeg[1]['url']} 640w, {jpeg[2]['url']} 800w")
+        html = Template(
+            '{% load shop_images %}{% responsive_image image alt="Portable" sizes="50vw" %}'
+        ).render(Context({'image': image}))
+        self.assertIn(f'type="image/webp" srcset="{image.srcset_webp}" sizes="50vw"', html)
+        self.assertIn(f'src="{image.src}" srcset="{image.srcset_jpeg}"', html)
+        self.assertIn('width="800" height="600"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_fallback_without_image(self):
+        html = Template(
+            '{% load shop_images %}{% responsive_image image fallback="/static/vide.png" %}'
+        ).render(Context({'image': None}))
+        self.assertIn('src="/static/vide.png"', html)
+        self.assertNotIn('srcset', html)
+
+
+@override_settings(SHOP_LIVE_BROKER='shop.live.LocalBroker')
+class LiveEventTests(TestCase):
+    """Événements du tableau de bord : LocalBroker, puis diffusion entre processus par le cache partagé"""
+
+    def setUp(self):
+        cache.clear()
+        live._broker = None
+        self.addCleanup(setattr, live, '_broker', None)
+
+    def test_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            live.publish_revenue(15000, 2)
+            try:
+                with transaction.atomic():
+                    live.publish('order', {'id': 1})
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertIsInstance(live.get_broker(), live.LocalBroker)
+        self.assertEqual(live.get_broker().events, [('revenue', {'amount': 15000.0, 'count': 2})])
+
+    def test_event_stream(self):
+        broker = live.LocalBroker()
+        broker.publish('low_stock', {'id': 3, 'quantite_stocks': 1})
+
+        async def read():
+            return [chunk async for chunk in live.event_stream(broker)]
+
+        self.assertEqual(async_to_sync(read)(), [
+            'retry: 5000\n\n',
+            'event: low_stock\ndata: {"id": 3, "quantite_stocks": 1}\n\n',
+        ])
+
+    async def test_shared_cache_broker_between_processes(self):
+        # Deux instances : le worker qui encaisse et celui qui sert la connexion SSE
+        publisher, listener = live.SharedCacheBroker(), live.SharedCacheBroker(poll_seconds=0.01)
+        stream = listener.subscribe(heartbeat=5)
+        received = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.1)
+        await sync_to_async(publisher.publish)('order', {'id': 7})
+        self.assertEqual(await asyncio.wait_for(received, 5), ('order', {'id': 7}))
+        await stream.aclose()
+
+    def poll_delivered(self, broker):
+        with mock.patch.object(live.InProcessBroker, 'publish', autospec=True) as publish:
+            broker.poll()
+        return [call.args[1:] for call in publish.call_args_list]
+
+    def test_shared_cache_broker_waits_for_pending_event(self):
+        listener = live.SharedCacheBroker()
+        self.poll_delivered(listener)
+        # Un worker a tiré son numéro mais n'a pas encore écrit l'événement ; un autre publie derrière lui
+        pending = live.SharedCacheBroker._next_sequence()
+        live.SharedCacheBroker().publish('revenue', {'amount': 100.0, 'count': 1})
+        self.assertEqual(self.poll_delivered(listener), [])
+        cache.add(live.EVENT_CACHE_KEY.format(pending), ('order', {'id': 7}), live.EVENT_CACHE_TIMEOUT)
+        self.assertEqual(self.poll_delivered(listener), [
+            ('order', {'id': 7}),
+            ('revenue', {'amount': 100.0, 'count': 1}),
+        ])
+        self.assertEqual(self.poll_delivered(listener), [])
+
+    def test_shared_cache_broker_skips_abandoned_event(self):
+        listener = live.SharedCacheBroker(grace_seconds=0)
+        self.poll_delivered(listener)
+        live.SharedCacheBroker._next_sequence()
+        live.SharedCacheBroker().publish('order', {'id': 8})
+        with self.assertLogs('shop.live', 'WARNING'):
+            self.assertEqual(self.poll_delivered(listener), [('order', {'id': 8})])
+
+
+class MetricsTests(TestCase):
+    """Endpoint Prometheus : compteurs de tous les workers, étiquetés par pid"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='shop-metrics-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.enterContext(override_settings(SHOP_METRICS_DIR=directory))
+        metrics.registry.reset()
+        self.directory = directory
+        self.staff = User.objects.create_user('support', password='secret', is_staff=True)
+
+    def test_all_workers_exported(self):
+        # Fichier déposé par un autre worker
+        other = metrics.ViewStats()
+        other.count = 4
+        other.statuses = {'2xx': 4}
+        other.buckets[0] = 4
+        with open(os.path.join(self.directory, '999999.json'), 'w') as f:
+            json.dump({'home': other.to_dict()}, f)
+
+        self.client.force_login(self.staff)
+        self.client.get('/session/')
+        body = self.client.get('/dashboard/metrics/').content.decode()
+        self.assertIn('shop_http_requests_total{view="home",worker="999999",status="2xx"} 4', body)
+        self.assertIn(f'shop_http_requests_total{{view="session_fragments",worker="{os.getpid()}",status="2xx"}} 1', body)
+
+    def test_flush(self):
+        self.client.get('/session/')
+        metrics.registry.flush()
+        with open(os.path.join(self.directory, f'{os.getpid()}.json')) as f:
+            self.assertEqual(json.load(f)['session_fragments']['count'], 1)
+
+
+@unittest.skipUnless(REPLICA, "SQLITE_REPLICA=True (ou REPLICA_DATABASE_URLS) requis")
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Deux bases de test distinctes : le réplica ne voit que ce qu'on y « réplique ».
+    TransactionTestCase : dans une transaction, le routeur lit tout sur la primaire.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('client', password='secret')
+        self.category = Category.objects.create(name='Téléphones')
+        self.product = Product.objects.create(nom='Smartphone X', categorie=self.category, prix=100000)
+        self.variant = ProductVariant.objects.create(product=self.product, stock=5)
+
+    def replicate(self, *objects):
+        for obj in objects:
+            obj.save(using=REPLICA)
+
+    def test_replica_is_migrated(self):
+        # Migrations de données comprises (RunPython sur l'alias migré, pas sur le routeur)
+        tables = connections[REPLICA].introspection.table_names()
+        self.assertIn('shop_productvariant', tables)
+        self.assertIn(settings.SHOP_CACHE_TABLE, tables)
+        columns = {c.name for c in connections[REPLICA].introspection.get_table_description(
+            connections[REPLICA].cursor(), 'shop_cartitem')}
+        self.assertIn('variant_id', columns)
+
+    def test_catalog_read_on_replica(self):
+        path = f'/products/{self.product.slug}/'
+        self.assertEqual(self.client.get(path).status_code, 404)
+        self.replicate(self.category, self.product)
+        self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_write_pins_client_to_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.post(f'/cart/add/{self.product.id}/', {'quantity': 1})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        # Absent du réplica : servi par la primaire tant que le cookie est valide
+        self.assertEqual(self.client.get(f'/products/{self.product.slug}/').status_code, 200)
+
+
+class InventoryTests(TestCase):
+    """Stock par SKU : Product.quantite_stocks recalculé depuis les variantes, jamais par delta"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('acheteur', password='secret')
+        cls.product = Product.objects.create(nom='Casque audio', prix=25000)
+        cls.variant = ProductVariant.objects.create(product=cls.product, stock=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def checkout(self, quantity):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, variant=self.variant, quantity=quantity)
+        self.client.force_login(self.user)
+        return self.client.post('/checkout/', {
+            'full_name': 'Awa Nzé', 'email': 'awa@example.ga', 'phone': '077 00 00 00',
+            'address': 'Glass', 'city': 'Libreville',
+        })
+
+    def test_checkout_with_drifted_total(self):
+        # Total produit inférieur à la somme des variantes : une décrémentation par delta passerait sous 0
+        Product.objects.filter(id=self.product.id).update(quantite_stocks=1)
+        response = self.checkout(3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+        self.variant.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.variant.stock, 2)
+        self.assertEqual(self.product.quantite_stocks, 2)
+
+    def test_insufficient_stock(self):
+        response = self.checkout(6)
+        self.assertRedirects(response, '/checkout/', fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 5)
+
+    def test_unexpected_error_logged(self):
+        with mock.patch.object(inventory, 'reserve', side_effect=RuntimeError("verrou perdu")), \
+                self.assertLogs('shop.views', 'ERROR') as logs:
+            response = self.checkout(1)
+        self.assertRedirects(response, '/checkout/', fetch_redirect_response=False)
+        self.assertIn('verrou perdu', logs.output[0])
+        self.assertFalse(Order.objects.exists())
+
+    def test_restock_resyncs_total(self):
+        Product.objects.filter(id=self.product.id).update(quantite_stocks=40)
+        inventory.restock({self.variant.id: 2})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantite_stocks, 7)
+
+
+class OrderWorkflowTests(TestCase):
+    """Machine à états : coût fixe par lot, remise en stock et classement à l'annulation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', password='secret')
+        cls.product = Product.objects.create(nom='Enceinte', prix=30000)
+        cls.variant = ProductVariant.objects.create(product=cls.product, stock=10)
+        cls.other = Product.objects.create(nom='Câble', prix=2000)
+        cls.other_variant = ProductVariant.objects.create(product=cls.other, stock=8)
+
+    def setUp(self):
+        cache.clear()
+
+    def place_orders(self, count, status='PAID'):
+        """Commandes payées de 2 enceintes + 1 câble (ligne sans variante, antérieure aux SKU)"""
+        orders = []
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, full_name='Awa Nzé', email='awa@example.ga', phone='077 00 00 00',
+                address='Glass', city='Libreville', total_amount=62000, status=status, is_paid=status != 'PENDING',
+            )
+            OrderItem.objects.create(order=order, product=self.product, variant=self.variant, price=30000, quantity=2)
+            OrderItem.objects.create(order=order, product=self.other, price=2000, quantity=1)
+            orders.append(order)
+        inventory.reserve([(self.variant.id, 2 * count), (self.other_variant.id, count)])
+        bestsellers.record_checkout([(self.product.id, 2 * count), (self.other.id, count)])
+        return Order.objects.filter(id__in=[order.id for order in orders])
+
+    def test_fixed_queries_per_batch(self):
+        for size in (1, 5):
+            with self.subTest(size=size):
+                orders = self.place_orders(size)
+                with self.assertNumQueries(13):
+                    self.assertEqual(transition_orders(orders, 'CANCELLED'), (size, 0))
+
+    def test_cancel_restocks_and_reverts_bestsellers(self):
+        orders = self.place_orders(2)
+        self.assertEqual(transition_orders(orders, 'CANCELLED'), (2, 0))
+        self.assertFalse(orders.filter(is_paid=True).exists())
+        for product, variant, stock in ((self.product, self.variant, 10), (self.other, self.other_variant, 8)):
+            variant.refresh_from_db()
+            product.refresh_from_db()
+            self.assertEqual(variant.stock, stock)
+            self.assertEqual(product.quantite_stocks, stock)
+            self.assertEqual((product.ventes_total, product.ventes_7j, product.ventes_30j), (0, 0, 0))
+
+    def test_forbidden_transition_skipped(self):
+        orders = self.place_orders(1, status='PENDING')
+        self.assertEqual(transition_orders(orders, 'SHIPPED'), (0, 1))
+        self.assertEqual(orders.get().status, 'PENDING')
+
+    def test_admin_actions(self):
+        actions = [action.__name__ for action in OrderAdmin.actions]
+        self.assertEqual(actions, ['mark_paid', 'mark_shipped', 'mark_delivered', 'mark_cancelled'])
+
+
+class SyncStockTests(TestCase):
+    """Commande sync_stock : bilan en --dry-run, écriture des seules lignes modifiées"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(nom='Clavier', prix=15000)
+        cls.variant = ProductVariant.objects.create(product=cls.product, sku='CLA-1', stock=5)
+        cls.unchanged = Product.objects.create(nom='Souris', prix=8000)
+        ProductVariant.objects.create(product=cls.unchanged, sku='SOU-1', stock=3)
+
+    def sync(self, *rows, dry_run=False):
+        directory = tempfile.mkdtemp(prefix='shop-sync-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'fournisseur.csv')
+        with open(path, 'w', encoding='utf-8') as csv_file:
+            csv_file.write('\n'.join(['sku;stock;prix', *rows]) + '\n')
+        stdout, stderr = io.StringIO(), io.StringIO()
+        args = [path, '--delimiter', ';'] + (['--dry-run'] if dry_run else [])
+        call_command('sync_stock', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_dry_run(self):
+        stdout, stderr = self.sync('CLA-1;7;12 500,00', 'SOU-1;3;8000', 'INCONNU;1;', 'SOU-1;2;8000;en trop',
+                                   dry_run=True)
+        self.assertIn("4 lignes lues : 1 inchangées, 1 SKU inconnus, 1 invalides.", stdout)
+        self.assertIn("1 stocks et 1 prix à modifier.", stdout)
+        self.assertIn("Ligne 5 ignorée : 1 colonne(s) de trop", stderr)
+        self.variant.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.variant.stock, self.product.prix), (5, 15000))
+
+    def test_apply(self):
+        untouched = Product.objects.get(id=self.unchanged.id).date_modification
+        stdout, _ = self.sync('CLA-1;7;12 500,00', 'SOU-1;3;8000')
+        self.assertIn("1 stocks et 1 prix modifiés.", stdout)
+        self.variant.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.variant.stock, 7)
+        self.assertEqual(self.product.quantite_stocks, 7)
+        self.assertEqual(self.product.prix, Decimal('12500.00'))
+        self.assertEqual(Product.objects.get(id=self.unchanged.id).date_modification, untouched)
+
+
+class OrderLookupTests(TestCase):
+    """Recherche support : chaque saisie est aiguillée vers son index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('support', password='secret')
+        details = {'user': user, 'address': 'Glass', 'city': 'Libreville', 'total_amount': 10000}
+        cls.awa = Order.objects.create(full_name='Awa Nzé', email='Awa@Example.ga', phone='+241 077 12 34 56',
+                                       reference='NEX-2024-3F00A1B2', **details)
+        cls.paul = Order.objects.create(full_name='Paul Mba', email='paul@example.ga', phone='066 98 76 54',
+                                        reference='NEX-2025-7C00D3E4', **details)
+
+    def assertFound(self, term, *orders):
+        self.assertQuerySetEqual(lookup_orders(term).order_by('id'), [order.id for order in orders],
+                                 transform=lambda order: order.id)
+
+    def test_reference(self):
+        self.assertFound('nex-2024-3f00a1b2', self.awa)
+        self.assertFound('NEX-2025', self.paul)
+        self.assertFound('nex-', self.awa, self.paul)
+
+    def test_email(self):
+        self.assertFound(' awa@example.GA ', self.awa)
+
+    def test_phone(self):
+        self.assertFound('077123456', self.awa)
+        self.assertFound('+241 66-98-76-54', self.paul)
+
+    def test_name(self):
+        self.assertFound('nzé', self.awa)
+        self.assertFound('Mba', self.paul)
+
+    def test_backfill_phone_normalized(self):
+        migration = importlib.import_module('shop.migrations.0005_order_lookup_indexes')
+        Order.objects.update(phone_normalized='')
+        with mock.patch.object(migration, 'BACKFILL_BATCH_SIZE', 1):
+            migration.backfill_phone_normalized(django_apps, mock.Mock(connection=connections['default']))
+        self.assertEqual(sorted(Order.objects.values_list('phone_normalized', flat=True)), ['66987654', '77123456'])
+
+
+class CartLinesTests(TestCase):
+    """Panier : CartItem.add (upsert plafonné au stock) et modifications groupées de cart/lines/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('panier', password='secret')
+        cls.product = Product.objects.create(nom='Chargeur', prix=5000)
+        cls.variant = ProductVariant.objects.create(product=cls.product, sku='CHA-1', stock=4)
+        cls.sold_out = ProductVariant.objects.create(
+            product=Product.objects.create(nom='Batterie', prix=12000), sku='BAT-1', stock=0
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.cart = Cart.objects.create(user=self.user)
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list('variant_id', 'quantity'))
+
+    def post_lines(self, *lines):
+        self.client.force_login(self.user)
+        response = self.client.post('/cart/lines/', json.dumps({'lines': lines}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_add_merges_duplicate_lines(self):
+        CartItem.add(self.cart.id, [(self.variant, 1), (self.variant, 2)])
+        self.assertEqual(self.quantities(), {self.variant.id: 3})
+
+    def test_add_capped_at_stock(self):
+        CartItem.add(self.cart.id, [(self.variant, 9)])
+        self.assertEqual(self.quantities(), {self.variant.id: 4})
+
+    def test_add_upserts_existing_line(self):
+        CartItem.add(self.cart.id, [(self.variant, 2)])
+        CartItem.add(self.cart.id, [(self.variant, 1)])
+        self.assertEqual(self.quantities(), {self.variant.id: 3})
+        # Stock relu dans l'instruction : plafond même si l'instance passée est périmée
+        ProductVariant.objects.filter(id=self.variant.id).update(stock=3)
+        CartItem.add(self.cart.id, [(self.variant, 2)])
+        self.assertEqual(self.quantities(), {self.variant.id: 3})
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 1)
+
+    def test_add_skips_zero_stock(self):
+        CartItem.add(self.cart.id, [(self.sold_out, 1), (self.variant, 0)])
+        self.assertEqual(self.quantities(), {})
+
+    def test_cart_lines(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.product, variant=self.variant, quantity=1)
+        data = self.post_lines(
+            {'item': item.id, 'quantity': 6},
+            {'variant': self.sold_out.id, 'add': 1},
+            {'variant': 'x'},
+        )
+        self.assertEqual(data['errors'], [
+            {'index': 0, 'message': "Stock insuffisant (4 disponible(s))."},
+            {'index': 1, 'message': "Ce produit est en rupture de stock ou introuvable."},
+            {'index': 2, 'message': "Opération invalide."},
+        ])
+        self.assertEqual((data['items_count'], data['cart_total']), (4, '20000.00'))
+        data = self.post_lines({'item': item.id, 'quantity': 0})
+        self.assertEqual((data['errors'], data['lines']), ([], []))
+
+
+class PricingTests(TestCase):
+    """Moteur de promotions : précédence des règles et invalidation de l'index compilé"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Audio')
+        cls.product = Product.objects.create(nom='Casque', prix=10000, categorie=cls.category, marque='Sony')
+
+    def setUp(self):
+        cache.clear()
+        pricing.invalidate()
+        self.addCleanup(pricing.invalidate)
+
+    def tarif(self, now=None):
+        return pricing.apply([Product.objects.get(id=self.product.id)], now)[0].tarif
+
+    def add_rule(self, nom, valeur, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PromotionRule.objects.create(nom=nom, valeur=valeur, **fields)
+
+    def test_precedence(self):
+        self.add_rule('Catalogue', 10)
+        self.add_rule('Marque', 2000, type_remise='MONTANT', marque=' sony ')
+        # À priorité égale, le prix le plus bas
+        self.assertEqual(self.tarif()[:3], (Decimal('8000.00'), 10000, 'Marque'))
+        # Promotion propre au produit : règle implicite de priorité 0
+        now = timezone.now()
+        Product.objects.filter(id=self.product.id).update(
+            prix_promotionnel=7000, date_debut_promo=now - datetime.timedelta(days=1),
+            date_fin_promo=now + datetime.timedelta(days=1),
+        )
+        self.assertEqual(self.tarif()[:3], (7000, 10000, ''))
+        # Une priorité plus forte l'emporte, même moins avantageuse
+        self.add_rule('Rentrée', 5, categorie=self.category, priorite=1)
+        self.assertEqual(self.tarif()[:3], (Decimal('9500.00'), 10000, 'Rentrée'))
+
+    def test_cached_until_invalidated(self):
+        self.assertIsNone(self.tarif().rule)
+        # bulk_create n'envoie pas post_save : l'index compilé reste servi
+        rule, = PromotionRule.objects.bulk_create([PromotionRule(nom='Flash', valeur=20, product=self.product)])
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.tarif().rule)
+        pricing.invalidate()
+        self.assertEqual(self.tarif().price, Decimal('8000.00'))
+        # Modification depuis l'admin : le signal invalide l'index après le commit
+        rule.valeur = 30
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.save()
+        self.assertEqual(self.tarif().price, Decimal('7000.00'))
+
+    def test_recompiled_at_next_boundary(self):
+        now = timezone.now()
+        self.add_rule('Soldes', 50, date_debut=now + datetime.timedelta(hours=1))
+        self.assertIsNone(self.tarif(now).rule)
+        self.assertEqual(self.tarif(now + datetime.timedelta(hours=2)).price, Decimal('5000.00'))
+
+
+class ShippingQuoteTests(TestCase):
+    """Devis de livraison : zone de la ville saisie, frais et délais tirés de la matrice en mémoire"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zone = DeliveryZone.objects.create(name='Ogooué-Maritime', villes='Port-Gentil\nOmboué',
+                                               frais_base=1500, delai_supplementaire=2)
+        cls.tv = Product.objects.create(nom='Téléviseur', prix=200000, frais_livraison_fixe=5000, delai_max=5)
+        cls.tv.zones_livraison.add(cls.zone)
+        cls.cable = Product.objects.create(nom='Câble HDMI', prix=3000, frais_livraison_fixe=1000, delai_min=2)
+        cls.gift = Product.objects.create(nom='Goodies', prix=500, livraison_gratuite=True)
+
+    def setUp(self):
+        cache.clear()
+        shipping.invalidate()
+        self.addCleanup(shipping.invalidate)
+
+    def test_quote(self):
+        quote = shipping.quote([(self.tv.id, 1), (self.cable.id, 3)], 'PORT GENTIL, quartier Balise')
+        self.assertEqual(quote.zone.name, 'Ogooué-Maritime')
+        self.assertEqual((quote.cost, quote.delai_min, quote.delai_max), (6500, 4, 7))
+        self.assertTrue(quote.deliverable)
+        # Un article en livraison gratuite rend tout le panier gratuit
+        self.assertEqual(shipping.quote([(self.cable.id, 1), (self.gift.id, 1)], 'Omboué').cost, 0)
+
+    def test_undeliverable_outside_zones(self):
+        quote = shipping.quote([(self.tv.id, 1), (self.cable.id, 1)], 'Franceville')
+        self.assertIsNone(quote.zone)
+        self.assertEqual(quote.undeliverable, [self.tv.id])
+        # Sans ville (page panier) : estimation, rien n'est exclu
+        self.assertTrue(shipping.quote([(self.tv.id, 1)]).deliverable)
+
+    def test_matrix_rebuilt_after_change(self):
+        lines = [(self.cable.id, 1)]
+        shipping.quote(lines, 'Libreville')
+        with self.assertNumQueries(0):
+            self.assertIsNone(shipping.quote(lines, 'Libreville').zone)
+        with self.captureOnCommitCallbacks(execute=True):
+            DeliveryZone.objects.create(name='Estuaire', villes='Libreville\nOwendo', frais_base=500)
+        quote = shipping.quote(lines, 'Libreville')
+        self.assertEqual((quote.zone.name, quote.cost), ('Estuaire', 1500))
+
+    def test_quote_view(self):
+        user = User.objects.create_user('livraison', password='secret')
+        cart = Cart.objects.create(user=user)
+        variant = ProductVariant.objects.create(product=self.tv, stock=2)
+        CartItem.objects.create(cart=cart, product=self.tv, variant=variant, quantity=1)
+        self.client.force_login(user)
+        data = self.client.get('/checkout/livraison/', {'city': 'Franceville'}).json()
+        self.assertEqual((data['deliverable'], data['undeliverable']), (False, ['Téléviseur']))
+        data = self.client.get('/checkout/livraison/', {'city': 'Port-Gentil'}).json()
+        self.assertEqual((data['zone'], data['shipping_cost'], data['total']),
+                         ('Ogooué-Maritime', '6500.00', '206500.00'))
+
+
+class ReviewAggregateTests(TestCase):
+    """Avis : histogramme et moyenne dénormalisés sur Product, pagination par curseur"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(nom='Montre', prix=45000)
+        cls.users = [User.objects.create_user(f'avis{n}', password='secret') for n in range(3)]
+
+    def aggregates(self):
+        product = Product.objects.get(id=self.product.id)
+        return (product.avis_total, [getattr(product, f'avis_{stars}') for stars in range(1, 6)],
+                product.note_moyenne)
+
+    def test_create_update_delete(self):
+        created = [Review.objects.create(product=self.product, user=user, rating=rating, comment='RAS')
+                   for user, rating in zip(self.users, (5, 4, 4))]
+        self.assertEqual(self.aggregates(), (3, [0, 0, 0, 2, 1], Decimal('4.33')))
+        review = Review.objects.get(id=created[1].id)
+        review.rating = 1
+        review.save()
+        self.assertEqual(self.aggregates(), (3, [1, 0, 0, 1, 1], Decimal('3.33')))
+        review.delete()
+        self.assertEqual(self.aggregates(), (2, [0, 0, 0, 1, 1], Decimal('4.50')))
+        Review.objects.all().delete()
+        self.assertEqual(self.aggregates(), (0, [0, 0, 0, 0, 0], Decimal('0.00')))
+
+    def test_rebuild(self):
+        Review.objects.bulk_create([Review(product=self.product, user=user, rating=3, comment='RAS')
+                                    for user in self.users])
+        self.assertEqual(self.aggregates()[0], 0)
+        reviews.rebuild([self.product.id])
+        self.assertEqual(self.aggregates(), (3, [0, 0, 3, 0, 0], Decimal('3.00')))
+
+    def test_pages(self):
+        Review.objects.bulk_create([Review(product=self.product, user=self.users[0], rating=4, comment=str(n))
+                                    for n in range(reviews.PAGE_SIZE + 2)])
+        first, cursor = reviews.get_page(self.product.id)
+        second, last = reviews.get_page(self.product.id, cursor)
+        self.assertEqual((len(first), len(second), last), (reviews.PAGE_SIZE, 2, None))
+        self.assertFalse({review.id for review in first} & {review.id for review in second})
+
+
+class CatalogApiTests(TestCase):
+    """API catalogue : sélection de champs, ETag / 304 commun aux workers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(nom='Tablette', prix=150000)
+        ProductVariant.objects.create(product=cls.product, stock=6)
+        inventory.sync_product_stock([cls.product.id])
+
+    def setUp(self):
+        cache.clear()
+        pricing.invalidate()
+
+    def test_fields(self):
+        response = self.client.get('/api/products/', {'fields': 'nom,prix_final,stock'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [{'nom': 'Tablette', 'prix_final': '150000.00', 'stock': 6}])
+        response = self.client.get(f'/api/products/{self.product.slug}/', {'fields': 'nom,poids,x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': "Champs inconnus : poids, x"})
+        self.assertEqual(self.client.get('/api/products/inconnu/').json(), {'error': "Produit introuvable."})
+
+    def test_not_modified(self):
+        url = f'/api/products/{self.product.slug}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        # Une seule requête hors cache partagé : date_modification du produit
+        self.assertEqual(len([query for query in queries if not is_cache_sql(query['sql'])]), 1)
+        # Stock modifié : date_modification change, l'ETag aussi
+        inventory.reserve([(self.product.variants.get().id, 1)])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['stock'], 5)
+        # ETag propre à l'URL : une autre sélection de champs n'est pas servie en 304
+        self.assertEqual(self.client.get(url, {'fields': 'nom'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+@local_storages
+@override_settings(SHOP_EDGE_CACHE_SECONDS=60)
+class EdgeCacheTests(TestCase):
+    """Pages vitrine : même HTML pour tous, public en cache partagé tant que rien de personnel n'a été lu"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('vitrine', password='secret')
+        cls.product = Product.objects.create(nom='Radio', prix=18000)
+        ProductVariant.objects.create(product=cls.product, stock=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertShared(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, s-maxage=60')
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertFalse(response.cookies)
+        # Champ CSRF vide, rempli côté client
+        self.assertNotRegex(response.content.decode(), r'csrfmiddlewaretoken" value="[^"]')
+
+    def test_catalog_pages_shared(self):
+        for url in ('/', '/products/', f'/products/{self.product.slug}/'):
+            with self.subTest(url=url):
+                self.assertShared(self.client.get(url))
+        # Connecté : le même HTML, les fragments personnels arrivent par /session/
+        self.client.force_login(self.user)
+        self.assertShared(self.client.get('/'))
+        response = self.client.get('/session/')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertTrue(response.json()['authenticated'])
+
+    def test_personalized_response_stays_private(self):
+        @edge.cacheable
+        def view(request):
+            if request.GET.get('cookie'):
+                response = HttpResponse()
+                response.set_cookie('shop_primary_until', '1')
+                return response
+            request.session.get('cart')
+            return HttpResponse()
+
+        middleware = edge.EdgeCacheMiddleware(view)
+        for params in ({'cookie': '1'}, {}):
+            with self.subTest(params=params):
+                request = RequestFactory().get('/', params)
+                request.session = self.client.session
+                self.assertEqual(middleware(request)['Cache-Control'], 'private')
+
+    @override_settings(SHOP_EDGE_CACHE_SECONDS=0)
+    def test_disabled(self):
+        self.assertFalse(self.client.get('/').has_header('Cache-Control'))
+
+
+class OrderArchiveTests(TestCase):
+    """Archivage : commandes terminées anciennes déplacées avec leurs lignes, toujours lisibles"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('archive', password='secret')
+        cls.product = Product.objects.create(nom='Imprimante', prix=60000)
+        old = timezone.now() - datetime.timedelta(days=400)
+        cls.orders = {}
+        for status, created_at in (('DELIVERED', old), ('CANCELLED', old), ('SHIPPED', old), ('DELIVERED', None)):
+            order = Order.objects.create(user=cls.user, full_name='Awa Nzé', email='awa@example.ga',
+                                         phone='077 00 00 00', address='Glass', city='Libreville',
+                                         total_amount=60000, status=status)
+            OrderItem.objects.create(order=order, product=cls.product, price=60000, quantity=1)
+            if created_at:
+                Order.objects.filter(id=order.id).update(created_at=created_at)
+            cls.orders[status, bool(created_at)] = order.id
+
+    def setUp(self):
+        cache.clear()
+
+    def archive(self, *args):
+        stdout = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_orders', '--days', '365', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_dry_run(self):
+        self.assertIn("2 commandes (2 lignes)", self.archive('--dry-run'))
+        self.assertEqual(Order.objects.count(), 4)
+
+    def test_archive(self):
+        self.assertIsNone(order_archive.horizon())
+        self.assertIn("2 commandes et 2 lignes archivées.", self.archive('--batch-size', '1'))
+        archived = {self.orders['DELIVERED', True], self.orders['CANCELLED', True]}
+        self.assertEqual(set(ArchivedOrder.objects.values_list('id', flat=True)), archived)
+        self.assertEqual(set(ArchivedOrderItem.objects.values_list('order_id', flat=True)), archived)
+        # Les tables actives ne gardent que l'activité en cours ou récente
+        self.assertFalse(Order.objects.filter(id__in=archived).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id__in=archived).exists())
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(order_archive.horizon(), ArchivedOrder.objects.latest('created_at').created_at)
+
+        order = order_archive.get_order_or_404(id=self.orders['DELIVERED', True], user=self.user)
+        self.assertTrue(order.is_archived)
+        self.assertEqual([item.product for item in order.items.all()], [self.product])
+        # Relancée : plus rien à déplacer
+        self.assertIn("0 commandes et 0 lignes archivées.", self.archive())
+
+
+class PurgeCartsTests(TestCase):
+    """purge_carts : statistiques d'abandon, suppression par lots revérifiée"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(nom='Lampe', prix=7000)
+        cls.variant = ProductVariant.objects.create(product=cls.product, stock=9, price_delta=500)
+        users = [User.objects.create_user(f'panier{n}', password='secret') for n in range(4)]
+        cls.abandoned, cls.empty, cls.revived, cls.recent = [Cart.objects.create(user=user) for user in users]
+        for cart in (cls.abandoned, cls.revived):
+            CartItem.objects.create(cart=cart, product=cls.product, variant=cls.variant, quantity=2)
+        Cart.objects.exclude(id=cls.recent.id).update(updated_at=timezone.now() - datetime.timedelta(days=90))
+
+    def purge(self, *args):
+        stdout = io.StringIO()
+        call_command('purge_carts', '--days', '30', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_stats(self):
+        directory = tempfile.mkdtemp(prefix='shop-carts-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'paniers.json')
+        stdout = self.purge('--dry-run', '--stats', path)
+        self.assertIn("3 paniers inactifs depuis 30 jours, dont 2 abandonnés (2 clients, 4 articles, 30000", stdout)
+        self.assertIn("Lampe : 4 dans 2 paniers", stdout)
+        with open(path, encoding='utf-8') as stats_file:
+            stats = json.load(stats_file)
+        self.assertEqual((stats['paniers_abandonnes'], stats['articles'], Decimal(stats['valeur'])), (2, 4, 30000))
+        self.assertEqual(Cart.objects.count(), 4)
+
+    def test_purge_rechecks_activity(self):
+        def reactivated(*args, **kwargs):
+            # Le client revient entre la sélection du lot et sa suppression
+            Cart.touch(self.revived.id)
+            return transaction.atomic(*args, **kwargs)
+
+        with mock.patch.object(purge_carts, 'transaction', mock.Mock(atomic=reactivated)):
+            stdout = self.purge('--batch-size', '2')
+        self.assertIn("2 paniers supprimés (inactifs depuis 30 jours).", stdout)
+        self.assertEqual(set(Cart.objects.values_list('id', flat=True)), {self.revived.id, self.recent.id})
+        self.assertEqual(CartItem.objects.get().cart_id, self.revived.id)
+
+
+class AutocompleteTests(TestCase):
+    """Suggestions : index de préfixes en mémoire, mis à jour par le journal du cache partagé"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Télévisions')
+        cls.s24 = Product.objects.create(nom='Samsung Galaxy S24', prix=500000, marque='Samsung', ventes_total=3)
+        cls.a15 = Product.objects.create(nom='Samsung Galaxy A15', prix=120000, marque='Samsung', ventes_total=9)
+        cls.tv = Product.objects.create(nom='Téléviseur Samsung 55"', prix=400000, marque='Samsung')
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.invalidate()
+        self.addCleanup(autocomplete.invalidate)
+
+    def labels(self, query):
+        return [(result['type'], result['label']) for result in autocomplete.suggest(query)]
+
+    def test_prefix(self):
+        # Début de n'importe quel mot ; produits les plus vendus d'abord
+        self.assertEqual(self.labels('gal'), [('produit', 'Samsung Galaxy A15'), ('produit', 'Samsung Galaxy S24')])
+        # Sans accents ; catégories, puis marques, puis produits
+        self.assertEqual(self.labels('TELE'), [('categorie', 'Télévisions'), ('produit', 'Téléviseur Samsung 55"')])
+        self.assertEqual(self.labels('sams')[0], ('marque', 'Samsung'))
+        self.assertEqual(self.labels('s'), [])
+
+    def test_multiple_words(self):
+        self.assertEqual(self.labels('sam s2'), [('produit', 'Samsung Galaxy S24')])
+        self.assertEqual(self.labels('galaxy tele'), [])
+
+    def test_refresh(self):
+        index = autocomplete.current_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.s24.nom = 'Samsung Galaxy S25'
+            self.s24.save()
+            Product.objects.filter(id=self.tv.id).delete()
+            Category.objects.create(name='Tablettes')
+        self.assertEqual(self.labels('s2'), [('produit', 'Samsung Galaxy S25')])
+        self.assertEqual(self.labels('tele'), [('categorie', 'Télévisions')])
+        self.assertEqual(self.labels('tabl'), [('categorie', 'Tablettes')])
+        # Mise à jour sur place, sans reconstruction
+        self.assertIs(autocomplete.current_index(), index)
+        self.assertEqual(index.brand_counts['Samsung'], 2)
+
+    def test_endpoint(self):
+        response = self.client.get('/recherche/suggestions/', {'q': 'galaxy s2'})
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(response.json()['results'][0], {
+            'type': 'produit', 'label': 'Samsung Galaxy S24', 'url': f'/products/{self.s24.slug}/',
+        })
+
+
+@local_storages
+class ProfilingTests(TestCase):
+    """Profilage : à la demande du staff ou échantillonné, traces sur disque élaguées"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('equipe', password='secret', is_staff=True)
+        cls.customer = User.objects.create_user('client-profil', password='secret')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='shop-profiles-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.enterContext(override_settings(SHOP_PROFILING_DIR=directory, SHOP_PROFILING_SAMPLE_EVERY=0))
+        self.directory = directory
+
+    def test_staff_trace(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/session/', {'_profile': '1'})
+        trace_id = response['X-Profile-Id']
+        self.assertIn('no-store', response['Cache-Control'])
+        trace = profiling.load(trace_id)
+        self.assertEqual((trace['trigger'], trace['view'], trace['user']), ('staff', 'session_fragments', 'equipe'))
+        self.assertGreater(trace['sql']['count'], 0)
+        self.assertIn('includes/user_nav.html', [template['name'] for template in trace['templates']])
+        self.assertTrue(trace['has_profile'])
+        self.assertEqual(self.client.get(f'/dashboard/profiles/{trace_id}/').status_code, 200)
+        download = self.client.get(f'/dashboard/profiles/{trace_id}/download/')
+        self.assertEqual(download.status_code, 200)
+        download.close()
+        self.assertIsNone(profiling.load('../../etc/passwd'))
+
+    def test_flag_ignored_for_customers(self):
+        self.client.force_login(self.customer)
+        response = self.client.get('/session/', HTTP_X_PROFILE='1')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @override_settings(SHOP_PROFILING_SAMPLE_EVERY=1, SHOP_PROFILING_MAX_TRACES=2)
+    def test_sampled_and_pruned(self):
+        for _ in range(3):
+            response = self.client.get('/session/')
+            self.assertFalse(response.has_header('X-Profile-Id'))
+        traces = profiling.recent()
+        self.assertEqual([trace['trigger'] for trace in traces], ['sample', 'sample'])
+        self.assertEqual(len(os.listdir(self.directory)), 4)  # .json + .prof par trace
+
+
+class BestsellerTests(TestCase):
+    """Classement : compteurs incrémentaux, fenêtres glissantes 7j / 30j, annulations"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ventes', password='secret')
+        cls.phone = Product.objects.create(nom='Téléphone', prix=90000)
+        cls.case = Product.objects.create(nom='Coque', prix=3000)
+
+    def counters(self, product):
+        product = Product.objects.get(id=product.id)
+        return product.ventes_total, product.ventes_7j, product.ventes_30j
+
+    def order(self, days_ago, quantity, status='PAID'):
+        order = Order.objects.create(user=self.user, full_name='Awa Nzé', email='awa@example.ga', phone='077',
+                                     address='Glass', city='Libreville', total_amount=0, status=status)
+        OrderItem.objects.create(order=order, product=self.phone, price=90000, quantity=quantity)
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - datetime.timedelta(days=days_ago))
+        return order
+
+    def test_sliding_windows(self):
+        today = timezone.localdate()
+        bestsellers.record_sales([(self.phone.id, today, 1), (self.phone.id, today - datetime.timedelta(days=10), 2),
+                                  (self.phone.id, today - datetime.timedelta(days=40), 4), (self.case.id, today, 5)])
+        self.assertEqual(self.counters(self.phone), (7, 1, 3))
+        self.assertEqual(list(bestsellers.top_products(2, '7j')), [self.case, self.phone])
+        self.assertEqual(list(bestsellers.top_products(2, 'total')), [self.phone, self.case])
+        for days_later, windows in ((8, (0, 3)), (25, (0, 1)), (31, (0, 0))):
+            with self.subTest(days_later=days_later), \
+                    mock.patch.object(bestsellers.timezone, 'localdate',
+                                      return_value=today + datetime.timedelta(days=days_later)):
+                bestsellers.refresh_windows()
+                self.assertEqual(self.counters(self.phone), (7, *windows))
+        self.assertFalse(ProductSalesDay.objects.exists())
+
+    def test_revert(self):
+        self.order(0, 1)
+        older = self.order(10, 2)
+        bestsellers.rebuild()
+        self.assertEqual(self.counters(self.phone), (3, 1, 3))
+        transition_orders(Order.objects.filter(id=older.id), 'CANCELLED')
+        self.assertEqual(self.counters(self.phone), (1, 1, 1))
+        # Les fenêtres recalculées depuis les ventes journalières restent cohérentes
+        bestsellers.refresh_windows()
+        self.assertEqual(self.counters(self.phone), (1, 1, 1))
+        # Une commande annulée n'est jamais recomptée
+        call_command('refresh_bestsellers', '--rebuild', stdout=io.StringIO())
+        self.assertEqual(self.counters(self.phone), (1, 1, 1))
+        self.assertEqual(list(ProductSalesDay.objects.values_list('quantite', flat=True)), [1])
+
+
+class OrderHistoryTests(TestCase):
+    """Historique client : curseur, première page en cache partagé invalidée à chaque changement"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('historique', password='secret')
+        cls.other = User.objects.create_user('voisin', password='secret')
+        cls.product = Product.objects.create(nom='Souris', prix=8000)
+        for n in range(order_history.PAGE_SIZE + 2):
+            cls.place(cls.user, timezone.now() - datetime.timedelta(days=n + 1))
+        cls.place(cls.other)
+
+    @classmethod
+    def place(cls, user, created_at=None):
+        order = Order.objects.create(user=user, full_name='Awa Nzé', email='awa@example.ga', phone='077',
+                                     address='Glass', city='Libreville', total_amount=8000)
+        OrderItem.objects.create(order=order, product=cls.product, price=8000, quantity=1)
+        if created_at:
+            Order.objects.filter(id=order.id).update(created_at=created_at)
+        return order
+
+    def setUp(self):
+        cache.clear()
+
+    def first_page(self, user=None):
+        orders, _ = order_history.get_page(user or self.user)
+        return orders
+
+    def test_pages(self):
+        first, cursor = order_history.get_page(self.user)
+        second, last = order_history.get_page(self.user, cursor)
+        self.assertEqual((len(first), len(second), last), (order_history.PAGE_SIZE, 2, None))
+        expected = list(Order.objects.filter(user=self.user).order_by('-created_at', '-id'))
+        self.assertEqual(first + second, expected)
+        self.assertEqual(order_history.get_page(self.user, 'pas-un-curseur')[0], first)
+
+    def test_first_page_cached(self):
+        self.first_page()
+        with CaptureQueriesContext(connections['default']) as queries:
+            orders = self.first_page()
+            self.assertEqual(orders[0].items.all()[0].product, self.product)
+        self.assertEqual([query for query in queries if not is_cache_sql(query['sql'])], [])
+
+    def test_invalidated_on_change(self):
+        neighbour = self.first_page(self.other)[0]
+        self.first_page()
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.place(self.user)
+        self.assertEqual(self.first_page()[0], order)
+        # Transition groupée (update, sans post_save) : invalidée par orders_transitioned
+        with self.settings(SHOP_TASKS_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            transition_orders(Order.objects.filter(id=order.id), 'PAID')
+        self.assertEqual(self.first_page()[0].status, 'PAID')
+        # Les autres clients gardent leur page en cache
+        self.assertIsNotNone(cache.get(order_history.FIRST_PAGE_CACHE_KEY.format(self.other.pk)))
+        self.assertEqual(self.first_page(self.other), [neighbour])
+
+
+@local_storages
+class SeedShopTests(TestCase):
+    """seed_shop : données cohérentes avec les agrégats dénormalisés"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_test_data(products=20, orders=30, reviews=40)
+
+    def test_counts(self):
+        self.assertEqual((Product.objects.count(), Order.objects.count(), Review.objects.count()), (20, 30, 40))
+        self.assertFalse(Order.objects.filter(phone_normalized='').exists())
+        self.assertFalse(Order.objects.filter(status='CANCELLED', is_paid=True).exists())
+
+    def test_denormalized_totals(self):
+        drift = Product.objects.annotate(total=Sum('variants__stock')).exclude(quantite_stocks=F('total'))
+        self.assertFalse(drift.exists())
+        self.assertEqual(sum(Product.objects.values_list('avis_total', flat=True)), 40)
+        before = list(Product.objects.order_by('id').values_list('ventes_total', 'ventes_7j', 'ventes_30j', 'note_moyenne'))
+        bestsellers.rebuild()
+        reviews.rebuild()
+        after = list(Product.objects.order_by('id').values_list('ventes_total', 'ventes_7j', 'ventes_30j', 'note_moyenne'))
+        self.assertEqual(before, after)
+
+
+@local_storages
+class BenchShopTests(TransactionTestCase):
+    """bench_shop : scénarios joués dans le processus, résultats JSON (workers dans leurs propres threads)"""
+
+    def setUp(self):
+        cache.clear()
+        # Réplica de test vide (rien n'y est répliqué) : lectures sur la primaire
+        self.enterContext(override_settings(SHOP_DB_REPLICAS=[]))
+        seed_test_data(products=12, orders=5, reviews=10, carts=0)
+        directory = tempfile.mkdtemp(prefix='shop-bench-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.output = os.path.join(directory, 'bench.json')
+        self.enterContext(override_settings(ALLOWED_HOSTS=['testserver']))
+
+    def test_bench(self):
+        stdout = io.StringIO()
+        # Concurrence 1 : SQLite en mémoire verrouille ses tables dès que deux workers écrivent
+        call_command('bench_shop', scenarios='home,detail,checkout', concurrency='1', requests=2, warmup=0,
+                     output=self.output, stdout=stdout)
+        with open(self.output, encoding='utf-8') as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report['meta']['products'], 12)
+        self.assertEqual([r['scenario'] for r in report['results']], ['home', 'detail', 'checkout'])
+        for result in report['results']:
+            with self.subTest(scenario=result['scenario']):
+                self.assertEqual((result['errors'], result['error_samples']), (0, []))
+                self.assertEqual(result['requests'], 2)
+                self.assertGreater(result['queries_per_request'], 0)
+        self.assertEqual(Order.objects.filter(full_name__startswith='Bench').count(), 2)
+
+        call_command('bench_shop', scenarios='home', concurrency='1', requests=1, warmup=0,
+                     output=self.output + '.2', compare=self.output, stdout=stdout)
+        self.assertIn("home         c=1   p50_ms=", stdout.getvalue())
+
+    def test_unknown_scenario(self):
+        with self.assertRaisesMessage(CommandError, "Scénarios inconnus : paiement"):
+            call_command('bench_shop', scenarios='home,paiement', output=self.output)
+
+    def test_empty_catalog(self):
+        ProductVariant.objects.update(stock=0)
+        Product.objects.update(quantite_stocks=0)
+        with self.assertRaisesMessage(CommandError, "Catalogue vide"):
+            call_command('bench_shop', scenarios='home', output=self.output)
+
+
+@local_storages
+class IndexAdvisorTests(TestCase):
+    """index_advisor : colonnes suggérées et rejeu des vues sans effet de bord"""
+
+    def setUp(self):
+        # Règles de prix et zones gardées en mémoire : rejouées ici, oubliées après le rollback
+        pricing.invalidate()
+        shipping.invalidate()
+        self.addCleanup(pricing.invalidate)
+        self.addCleanup(shipping.invalidate)
+
+    def test_suggest_columns(self):
+        from .management.commands.index_advisor import suggest_columns
+
+        cases = [
+            # Égalités d'abord, puis la plage (le tri ne sert plus après une plage)
+            ('SELECT * FROM "shop_order" WHERE ("shop_order"."user_id" = %s AND "shop_order"."created_at" >= %s) '
+             'ORDER BY "shop_order"."created_at" DESC', 'shop_order', ['user_id', 'created_at']),
+            ('SELECT * FROM "shop_order" WHERE "shop_order"."is_paid" = %s '
+             'ORDER BY "shop_order"."created_at" DESC, "shop_order"."id" DESC LIMIT 20',
+             'shop_order', ['is_paid', '-created_at', '-id']),
+            # Filtre sur la table jointe : la clé étrangère compte comme une égalité
+            ('SELECT * FROM "shop_product" INNER JOIN "shop_category" '
+             'ON ("shop_product"."categorie_id" = "shop_category"."id") WHERE "shop_category"."slug" = %s '
+             'ORDER BY "shop_product"."date_ajout" DESC', 'shop_product', ['categorie_id', '-date_ajout']),
+            # LIKE et colonnes passées à une fonction : rien d'indexable
+            ('SELECT * FROM "shop_product" WHERE ("shop_product"."nom" LIKE %s OR LOWER("shop_product"."marque") = %s)',
+             'shop_product', []),
+        ]
+        for sql, table, expected in cases:
+            with self.subTest(sql=sql):
+                self.assertEqual(suggest_columns(sql, table), expected)
+
+    def test_command_rolls_back(self):
+        seed_test_data(products=10, orders=10, reviews=10)
+        cart_items = CartItem.objects.count()
+        stdout = io.StringIO()
+        call_command('index_advisor', stdout=stdout)
+        output = stdout.getvalue()
+        self.assertRegex(output, r'\d+ exécutions, \d+ formes de requêtes distinctes \(sqlite\)')
+        self.assertIn('shop.Product (shop_product)', output)
+        # Tables sous --min-rows : signalées mais sans suggestion
+        self.assertIn('Aucun index manquant détecté.', output)
+        self.assertFalse(User.objects.filter(username='index-advisor').exists())
+        self.assertEqual(CartItem.objects.count(), cart_items)
+
+    def test_emit_migration(self):
+        seed_test_data(products=10, orders=10, reviews=10)
+        directory = tempfile.mkdtemp(prefix='shop-advisor-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'advisor.py')
+        stdout = io.StringIO()
+        with mock.patch('shop.management.commands.index_advisor.MigrationWriter.path',
+                        new_callable=mock.PropertyMock, return_value=path):
+            call_command('index_advisor', min_rows=0, emit_migration=True, stdout=stdout)
+        self.assertIn("PromotionRule: models.Index(fields=['actif', 'date_fin', 'id']", stdout.getvalue())
+        with open(path, encoding='utf-8') as migration_file:
+            migration = migration_file.read()
+        self.assertIn("('shop', '0", migration)
+        self.assertIn("model_name='promotionrule'", migration)
+        # Seuls les modèles de shop vont dans la migration
+        self.assertNotIn('logentry', migration)
+
+
+class ImportProfileTests(TestCase):
+    """importprofile : démarrage d'un worker neuf, modules lourds chargés au premier usage seulement"""
+
+    def test_parse_importtime(self):
+        from .management.commands.importprofile import parse_importtime
+
+        stderr = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        120 |     _io\n"
+                  "import time:      1500 |       1620 |   shop.pricing\n"
+                  "import time:       900 |       2520 | shop\n"
+                  "Traceback sans rapport\n")
+        self.assertEqual(parse_importtime(stderr), [('_io', 120, 120, 2), ('shop.pricing', 1500, 1620, 1),
+                                                    ('shop', 900, 2520, 0)])
+
+    @override_settings(SHOP_COLD_START_TARGET_MS=10 ** 6)
+    def test_lazy_modules_not_imported_at_startup(self):
+        stdout = io.StringIO()
+        call_command('importprofile', check=True, limit=3, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("Démarrage dans l'objectif.", output)
+        self.assertNotIn('!', output)
+
+    @override_settings(SHOP_COLD_START_TARGET_MS=0, SHOP_LAZY_MODULES=['django', 'weasyprint'])
+    def test_check(self):
+        stdout = io.StringIO()
+        call_command('importprofile', limit=3, stdout=stdout)
+        self.assertIn("! django est importé au démarrage", stdout.getvalue())
+        self.assertNotIn("weasyprint est importé", stdout.getvalue())
+        with self.assertRaisesMessage(CommandError, "2 problème(s) au démarrage"):
+            call_command('importprofile', check=True, limit=3, stdout=io.StringIO())
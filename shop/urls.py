@@ -1,25 +1,49 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, edge, views
+
+# Vues catalogue async sous ASGI (voir shop/async_views.py)
+catalog = async_views if getattr(settings, 'SHOP_ASYNC_CATALOG', True) else views
 
 urlpatterns = [
-    # Pages principales
-    path('', views.home, name='home'),
-    path('products/', views.ProductListView.as_view(), name='product_list'),
-    path('products/<slug:slug>/', views.ProductDetailView.as_view(), name='product_detail'),
+    # Pages principales (HTML identique pour tous, en cache partagé : voir shop/edge.py)
+    path('', edge.cacheable(catalog.home), name='home'),
+    path('products/', edge.cacheable(catalog.ProductListView.as_view()), name='product_list'),
+    path('products/<slug:slug>/', edge.cacheable(catalog.ProductDetailView.as_view()), name='product_detail'),
+    path('products/<int:product_id>/avis/', views.product_reviews_view, name='product_reviews'),
+
+    # Suggestions de recherche (saisie au clavier)
+    path('recherche/suggestions/', views.search_suggestions, name='search_suggestions'),
+
+    # Menu du compte, panier, messages et CSRF des pages en cache partagé
+    path('session/', views.session_fragments, name='session_fragments'),
 
     # Panier
     path('cart/', views.cart_detail, name='cart_detail'),
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:item_id>/', views.cart_remove, name='cart_remove'),
     path('cart/update/<int:item_id>/', views.update_cart_item, name='cart_update_quantity'),
+    path('cart/lines/', views.cart_lines, name='cart_lines'),
 
     # Commande et Checkout
     path('checkout/', views.checkout_view, name='checkout_view'),
+    path('checkout/livraison/', views.shipping_quote_view, name='shipping_quote'),
     path('mes-commandes/', views.OrderListView.as_view(), name='order_history'),
     path('commande/supprimer/<int:order_id>/', views.delete_order, name='delete_order'),
     path('commande/<int:order_id>/pdf/', views.order_pdf_download, name='order_pdf_download'),
 
     path('dashboard/order/<int:order_id>/invoice/', views.order_invoice_admin, name='order_invoice_admin'),
+    path('dashboard/orders/lookup/', views.order_lookup, name='order_lookup'),
+    path('dashboard/live/', views.live_dashboard_events, name='admin_live_events'),
+    path('dashboard/metrics/', views.metrics_view, name='metrics'),
+    path('dashboard/profiles/', views.profile_list, name='profile_list'),
+    path('dashboard/profiles/<slug:trace_id>/', views.profile_detail, name='profile_detail'),
+    path('dashboard/profiles/<slug:trace_id>/download/', views.profile_download, name='profile_download'),
+
+    # API JSON du catalogue (lecture seule, voir shop/api.py)
+    path('api/categories/', api.categories, name='api_categories'),
+    path('api/products/', api.products, name='api_products'),
+    path('api/products/<slug:slug>/', api.product_detail, name='api_product_detail'),
 ]
 
 
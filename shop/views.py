@@ -1,28 +1,113 @@
+import json
+import logging
 import uuid
+from decimal import Decimal
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView, DetailView
-from .models import Product, Category, Cart, CartItem, Order, OrderItem, Size, Capacity, Color
+from .models import Product, Category, Cart, CartItem, Order, OrderItem, ProductVariant
 from django.db import transaction
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
+from django.db.models import Count, F, Prefetch, Q, prefetch_related_objects
 from django.core.mail import send_mail
 from django.conf import settings
 from .forms import ReviewForm
 from django.contrib import messages
 from django.template.loader import render_to_string
-from django.http import HttpResponse, JsonResponse
-from weasyprint import HTML
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.contrib import admin
 from django.contrib.admin.views.decorators import staff_member_required
+from .order_workflow import get_invoice_html
+from .order_lookup import lookup_orders
+from . import autocomplete, bestsellers, inventory, live, metrics, order_archive, order_history, pricing, profiling, reviews, shipping
+from .query_budget import query_budget
+from django.urls import reverse
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_POST
+from django.utils.cache import patch_cache_control
+
+logger = logging.getLogger(__name__)
+
+def catalog_products():
+    """Produits prêts pour includes/product_card.html (catégorie jointe, images préchargées)"""
+    return Product.objects.select_related('categorie').prefetch_related('images')
+
+
+def priced(products):
+    """Liste de produits avec leur prix promotionnel résolu en une passe (shop/pricing.py)"""
+    return pricing.apply(list(products))
+
+
+# Articles du panier avec tout ce qu'affichent le panier et le checkout
+CART_ITEMS = Prefetch('items', queryset=CartItem.objects.select_related(
+    'product__categorie', 'variant__color', 'variant__size', 'variant__capacity',
+).prefetch_related('product__images'))
+
+# Lignes de facture avec leur produit
+INVOICE_ITEMS = Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+
+# Tri du catalogue (?sort=...)
+SORT_OPTIONS = {
+    'price_asc': ('prix',),
+    'price_desc': ('-prix',),
+    'oldest': ('date_ajout',),
+    'popular': ('-ventes_30j',),
+    # Agrégats dénormalisés (shop/reviews.py), index shop_product_note_idx
+    'rating': ('-note_moyenne', '-avis_total'),
+}
+
+
+def filter_products(params):
+    """Catalogue filtré et trié selon les paramètres GET (aucune requête SQL exécutée)"""
+    queryset = catalog_products()
+    query = params.get('search')
+    category_slug = params.get('category')
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
+
+    if category_slug:
+        queryset = queryset.filter(categorie__slug=category_slug)
+    if query:
+        queryset = queryset.filter(
+            Q(nom__icontains=query) | Q(marque__icontains=query) | Q(description_courte__icontains=query)
+        )
+    if min_price:
+        queryset = queryset.filter(prix__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(prix__lte=max_price)
+    return queryset.order_by(*SORT_OPTIONS.get(params.get('sort'), ('-date_ajout',)))
+
+
+# Produit de la fiche détail avec ses variantes (options et stock par SKU en une requête)
+PRODUCT_DETAIL = Product.objects.select_related('categorie').prefetch_related(
+    'images', 'zones_livraison',
+    Prefetch('variants', queryset=ProductVariant.objects.select_related('color', 'size', 'capacity').order_by('id')),
+)
+
+
+def variant_context(product):
+    """Options proposées et disponibilité par SKU pour la fiche produit (variantes préchargées)"""
+    return {
+        'options': inventory.options(product),
+        'variant_availability': inventory.availability(product),
+    }
+
+
+def similar_products(product):
+    return catalog_products().filter(categorie=product.categorie_id).exclude(id=product.id)[:4]
 
 # --- Accueil ---
+@query_budget(11)
 def home(request):
     # .select_related ou .prefetch_related pour optimiser les perfs
-    products = Product.objects.all().order_by('-date_ajout')[:8]
+    products = priced(catalog_products().order_by('-date_ajout')[:8])
     categories = Category.objects.all()
     return render(request, 'core/Home.html', {
         'products': products,
-        'categories': categories
+        'categories': categories,
+        'best_sellers': priced(bestsellers.top_products(4, '30j', queryset=catalog_products())),
     })
 
 # --- Liste des Produits avec Filtres ---
@@ -31,38 +116,16 @@ class ProductListView(ListView):
     template_name = 'core/Product_Listing.html'
     context_object_name = 'products'
     paginate_by = 12
+    query_budget = 12
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        query = self.request.GET.get('search')
-        category_slug = self.request.GET.get('category')
-        min_price = self.request.GET.get('min_price')
-        max_price = self.request.GET.get('max_price')
-        sort_by = self.request.GET.get('sort')
-
-        if category_slug:
-            queryset = queryset.filter(categorie__slug=category_slug)
-        if query:
-            queryset = queryset.filter(
-                Q(nom__icontains=query) | Q(marque__icontains=query) | Q(description_courte__icontains=query)
-            )
-        if min_price:
-            queryset = queryset.filter(prix__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(prix__lte=max_price)
-
-        # Tri
-        sort_options = {
-            'price_asc': 'prix',
-            'price_desc': '-prix',
-            'oldest': 'date_ajout'
-        }
-        queryset = queryset.order_by(sort_options.get(sort_by, '-date_ajout'))
-        return queryset
+        return filter_products(self.request.GET)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
+        # La page courante (queryset évalué une fois, réutilisé par le template)
+        pricing.apply(context['object_list'])
+        context['categories'] = Category.objects.annotate(nb_products=Count('products'))
         return context
 
 # --- Détails Produit & Avis ---
@@ -70,13 +133,16 @@ class ProductDetailView(DetailView):
     model = Product
     template_name = 'core/Single_Product.html'
     context_object_name = 'product'
+    queryset = PRODUCT_DETAIL
+    query_budget = 13
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['images'] = self.object.images.all()
-        context['reviews'] = self.object.reviews.select_related('user').order_by('-created_at')
-        context['similar_products'] = Product.objects.filter(categorie=self.object.categorie).exclude(id=self.object.id)[:4]
+        context['similar_products'] = similar = list(similar_products(self.object))
+        pricing.apply([self.object, *similar])
         context['review_form'] = ReviewForm()
+        context.update(variant_context(self.object))
         return context
 
     def post(self, request, *args, **kwargs):
@@ -95,37 +161,65 @@ class ProductDetailView(DetailView):
             return redirect('product_detail', slug=self.object.slug)
         return self.render_to_response(self.get_context_data(review_form=form))
 
+@query_budget(4)
+def product_reviews_view(request, product_id):
+    """Page d'avis d'une fiche produit (onglet Avis, bouton « Voir plus »), curseur ?after="""
+    page, next_cursor = reviews.get_page(product_id, request.GET.get('after'))
+    return JsonResponse({
+        'html': render_to_string('includes/review_list.html', {'reviews': page}, request=request),
+        'next': next_cursor,
+    })
+
+# --- Suggestions de la barre de recherche (index en mémoire : voir shop/autocomplete.py) ---
+@query_budget(2)
+def search_suggestions(request):
+    response = JsonResponse({'results': autocomplete.suggest(request.GET.get('q', ''))})
+    # Identique pour tous : réutilisable par le navigateur et les caches partagés
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+# --- Fragments par visiteur des pages en cache partagé (voir shop/edge.py) ---
+@never_cache
+@query_budget(4)
+def session_fragments(request):
+    """Menu du compte, badge panier, messages et jeton CSRF, demandés par base.html après chargement"""
+    cart_count = 0
+    if request.user.is_authenticated:
+        cart_count = CartItem.objects.filter(cart__user=request.user).count()
+    context = {'user': request.user, 'cart_count': cart_count}
+    return JsonResponse({
+        'authenticated': request.user.is_authenticated,
+        'cart_count': cart_count,
+        'nav': render_to_string('includes/user_nav.html', context),
+        'messages': render_to_string('includes/messages.html', {'messages': messages.get_messages(request)}),
+        'csrf_token': get_token(request),
+    })
+
 # --- Gestion du Panier ---
 @login_required
+@query_budget(8)
 def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    
-    # Sécurité Stock
-    if product.quantite_stocks < 1:
+    # Combinaison choisie (couleur, taille, capacité) -> SKU
+    variant = inventory.resolve_variant(product_id, request.POST)
+    if variant is None:
+        product = get_object_or_404(Product, id=product_id)
+        messages.error(request, "Cette combinaison n'est pas disponible.")
+        return redirect('product_detail', slug=product.slug)
+    product = variant.product
+
+    # Sécurité Stock (au niveau de la variante)
+    if variant.stock < 1:
         messages.error(request, "Désolé, ce produit est en rupture de stock.")
         return redirect('product_detail', slug=product.slug)
 
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    
-    # Récupération des variantes
-    color_id = request.POST.get('color') or None
-    size_id = request.POST.get('size') or None
-    capacity_id = request.POST.get('capacity') or None
-    quantity = int(request.POST.get('quantity', 1))
-
-    # On cherche si l'article avec EXACTEMENT ces variantes existe déjà
-    item, created = CartItem.objects.get_or_create(
-        cart=cart, 
-        product=product,
-        color_id=color_id,
-        size_id=size_id,
-        capacity_id=capacity_id,
-        defaults={'quantity': quantity}
-    )
-    
-    if not created:
-        item.quantity += quantity
-        item.save()
+    # Le panier naît au premier ajout (aucune page en lecture ne le crée)
+    cart, new_cart = Cart.objects.get_or_create(user=request.user)
+    quantity = max(int(request.POST.get('quantity', 1)), 1)
+
+    # Une ligne de panier par SKU, incrémentée en une instruction (clics rapides sans doublon)
+    CartItem.add(cart.id, [(variant, quantity)])
+    if not new_cart:
+        Cart.touch(cart.id)
 
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({'status': 'success', 'cart_count': cart.items.count()})
@@ -133,47 +227,140 @@ def add_to_cart(request, product_id):
     return redirect('cart_detail')
 
 @login_required
+@query_budget(12)
 def cart_detail(request):
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    items = cart.items.select_related('product', 'color', 'size', 'capacity').all()
+    cart = Cart.objects.prefetch_related(CART_ITEMS).filter(user=request.user).first()
+    items = cart.items.all() if cart else []
+    pricing.apply([item.product for item in items])
     return render(request, 'core/Shopping_Cart.html', {'cart': cart, 'cart_items': items})
 
+def cart_summary(cart_id):
+    """Récapitulatif JSON du panier (lignes, nombre d'articles, total) en une requête"""
+    items = list(CartItem.objects.filter(cart_id=cart_id).select_related('product', 'variant').order_by('id'))
+    pricing.apply([item.product for item in items])
+    return {
+        'lines': [
+            {
+                'id': item.id,
+                'variant': item.variant_id,
+                'product': item.product.nom,
+                'quantity': item.quantity,
+                'unit_price': str(item.unit_price),
+                'total': str(item.total_item_price),
+            }
+            for item in items
+        ],
+        'cart_count': len(items),
+        'items_count': sum(item.quantity for item in items),
+        'cart_total': str(sum((item.total_item_price for item in items), Decimal('0.00'))),
+    }
+
 @login_required
+@query_budget(8)
 def update_cart_item(request, item_id):
     """Met à jour la quantité d'un article dans le panier"""
-    item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+    item = get_object_or_404(CartItem.objects.select_related('variant'), id=item_id, cart__user=request.user)
     # On accepte GET (comme dans votre code) ou POST (plus sécurisé pour modifier des données)
     action = request.GET.get('action') or request.POST.get('action')
+    Cart.touch(item.cart_id)
     
+    # Incréments en SQL (quantity = quantity ± 1) : deux clics simultanés comptent tous les deux
+    lines = CartItem.objects.filter(pk=item.pk)
     if action == 'increase':
-        if item.quantity < item.product.quantite_stocks:
-            item.quantity += 1
-            item.save()
-        else:
+        if not lines.filter(quantity__lt=item.variant.stock).update(quantity=F('quantity') + 1):
             messages.warning(request, "Stock insuffisant.")
     elif action == 'decrease':
-        if item.quantity > 1:
-            item.quantity -= 1
-            item.save()
-        else:
-            item.delete()
-            return redirect('cart_detail') # On redirige si l'article est supprimé
+        if not lines.filter(quantity__gt=1).update(quantity=F('quantity') - 1):
+            lines.delete()
 
     # Gestion AJAX pour une expérience fluide
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        summary = cart_summary(item.cart_id)
+        line = next((line for line in summary['lines'] if line['id'] == item.id), None)
         return JsonResponse({
             'status': 'success',
-            'quantity': item.quantity,
-            'item_total': item.total_price(), # Assurez-vous d'avoir cette méthode dans votre modèle
-            'cart_total': item.cart.get_total_price() # Et celle-ci aussi
+            'quantity': line['quantity'] if line else 0,
+            'item_total': line['total'] if line else '0.00',
+            **summary,
         })
 
     return redirect('cart_detail')
 
+# Opérations acceptées par requête sur cart/lines/
+MAX_CART_OPERATIONS = 50
+
 @login_required
+@require_POST
+@query_budget(10)
+def cart_lines(request):
+    """
+    Modifie plusieurs lignes du panier en une requête JSON et renvoie le récapitulatif recalculé.
+
+        {"lines": [{"item": 12, "quantity": 3},     # quantité d'une ligne (0 : retirée)
+                   {"variant": 45, "add": 2}]}      # ajout d'un SKU (comme add_to_cart)
+
+    Quantités plafonnées au stock ; une opération invalide est signalée dans
+    "errors" (avec sa position) sans empêcher les autres.
+    """
+    try:
+        operations = json.loads(request.body)['lines']
+        if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'error', 'message': "Corps JSON attendu : {\"lines\": [...]}"}, status=400)
+    if len(operations) > MAX_CART_OPERATIONS:
+        return JsonResponse({'status': 'error', 'message': f"{MAX_CART_OPERATIONS} opérations au plus."}, status=400)
+
+    errors, updates, additions = [], {}, []
+    for position, op in enumerate(operations):
+        try:
+            if 'item' in op:
+                updates[int(op['item'])] = (position, max(int(op['quantity']), 0))
+            else:
+                additions.append((position, int(op['variant']), max(int(op.get('add', 1)), 1)))
+        except (KeyError, TypeError, ValueError):
+            errors.append({'index': position, 'message': "Opération invalide."})
+
+    cart, new_cart = Cart.objects.get_or_create(user=request.user)
+    if updates:
+        items = {item.id: item for item in CartItem.objects.filter(cart=cart, id__in=updates).select_related('variant')}
+        changed, removed = [], []
+        for item_id, (position, quantity) in updates.items():
+            item = items.get(item_id)
+            if item is None:
+                errors.append({'index': position, 'message': "Article introuvable dans le panier."})
+            else:
+                if quantity > item.variant.stock:
+                    errors.append({'index': position, 'message': f"Stock insuffisant ({item.variant.stock} disponible(s))."})
+                item.quantity = min(quantity, item.variant.stock)
+                if item.quantity:
+                    changed.append(item)
+                else:
+                    removed.append(item_id)
+        CartItem.objects.bulk_update(changed, ['quantity'])
+        if removed:
+            CartItem.objects.filter(cart=cart, id__in=removed).delete()
+    if additions:
+        variants = ProductVariant.objects.in_bulk({variant_id for _, variant_id, _ in additions})
+        lines = []
+        for position, variant_id, quantity in additions:
+            variant = variants.get(variant_id)
+            if variant is None or variant.stock < 1:
+                errors.append({'index': position, 'message': "Ce produit est en rupture de stock ou introuvable."})
+            else:
+                lines.append((variant, quantity))
+        CartItem.add(cart.id, lines)
+    if not new_cart:
+        Cart.touch(cart.id)
+
+    return JsonResponse({'status': 'success', 'errors': sorted(errors, key=lambda error: error['index']), **cart_summary(cart.id)})
+
+@login_required
+@query_budget(6)
 def cart_remove(request, item_id):
     item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     item.delete()
+    Cart.touch(item.cart_id)
     messages.success(request, "Article retiré du panier.")
     return redirect('cart_detail')
 
@@ -182,14 +369,17 @@ from django.db import transaction
 from django.contrib import messages
 
 @login_required
+@query_budget(22)
 @transaction.atomic
 def checkout_view(request):
     # Utilisation de select_related pour optimiser les requêtes SQL
-    cart = get_object_or_404(Cart.objects.select_related('user'), user=request.user)
+    cart = Cart.objects.select_related('user').prefetch_related(CART_ITEMS).filter(user=request.user).first()
     
-    if not cart.items.exists():
+    if cart is None or not cart.items.exists():
         messages.warning(request, "Votre panier est vide.")
         return redirect('product_list')
+    # Prix (règles de promotion comprises) résolus une fois pour le récapitulatif et la commande
+    pricing.apply([item.product for item in cart.items.all()])
 
     if request.method == 'POST':
         try:
@@ -198,64 +388,111 @@ def checkout_view(request):
             email = request.POST.get('email')
             phone = request.POST.get('phone')
             address = request.POST.get('address')
+            city = (request.POST.get('city') or '').strip()
             
-            if not all([full_name, email, phone, address]):
+            if not all([full_name, email, phone, address, city]):
                 raise ValueError("Veuillez remplir tous les champs obligatoires.")
 
-            # 2. Création de la commande
+            # 2. Livraison : zone de la ville, produits livrables, frais et délai
+            quote = cart.shipping_quote(city)
+            if not quote.deliverable:
+                names = ', '.join(item.product.nom for item in cart.items.all() if item.product_id in quote.undeliverable)
+                raise ValueError(f"Livraison impossible à {city} pour : {names}.")
+
+            # 3. Création de la commande
             order = Order.objects.create(
                 user=request.user,
                 full_name=full_name,
                 email=email,
                 phone=phone,
                 address=address,
-                city=request.POST.get('city', 'Libreville'),
+                city=city,
+                zone_id=quote.zone.id if quote.zone else None,
+                delai_min=quote.delai_min,
+                delai_max=quote.delai_max,
                 order_key=uuid.uuid4().hex,
-                total_amount=cart.total_final, # On fige le montant calculé du panier
-                shipping_cost=cart.shipping_cost
+                total_amount=cart.total_price + quote.cost, # On fige le montant calculé du panier
+                shipping_cost=quote.cost
             )
 
-            # 3. Transfert des articles du panier vers la commande
-            for item in cart.items.all():
-                # Vérification du stock
-                if item.product.quantite_stocks < item.quantity:
-                    # Ici, la transaction.atomic annulera la création de 'order' si on lève l'erreur
-                    raise ValueError(f"Désolé, le stock pour '{item.product.nom}' est épuisé.")
-                
-                # Détermination du prix au moment de l'achat
-                current_unit_price = item.product.prix_promotionnel if item.product.est_en_promo else item.product.prix
-
-                OrderItem.objects.create(
+            # 4. Stock : SKU du panier verrouillés, vérifiés et décrémentés
+            # (InsufficientStock : la transaction.atomic annule la création de 'order')
+            items = list(cart.items.all())
+            inventory.reserve([(item.variant_id, item.quantity) for item in items])
+
+            # 5. Transfert des articles du panier vers la commande
+            sold, order_items, remaining = [], [], {}
+            for item in items:
+                variant = item.variant
+                order_items.append(OrderItem(
                     order=order,
                     product=item.product,
-                    price=current_unit_price,
+                    variant=variant,
+                    # Prix figé au moment de l'achat (promo éventuelle + écart de la variante)
+                    price=item.unit_price,
                     quantity=item.quantity,
-                    color=str(item.color.name) if item.color else None,
-                    size=str(item.size.name) if item.size else None,
-                    capacity=str(item.capacity.name) if item.capacity else None
-                )
-                
-                # Mise à jour du stock
-                item.product.quantite_stocks -= item.quantity
-                item.product.save()
-
-            # 4. Nettoyage final
+                    color=variant.color.name if variant.color else None,
+                    size=variant.size.name if variant.size else None,
+                    capacity=variant.capacity.name if variant.capacity else None
+                ))
+                sold.append((item.product_id, item.quantity))
+                remaining[item.product] = remaining.get(item.product, item.product.quantite_stocks) - item.quantity
+
+            OrderItem.objects.bulk_create(order_items)
+            for product, quantite in remaining.items():
+                if quantite <= product.seuil_stocks_bas:
+                    product.quantite_stocks = quantite
+                    live.publish_low_stock(product)
+
+            # Classement des meilleures ventes
+            bestsellers.record_checkout(sold)
+            # Tableau de bord admin en direct
+            live.publish_new_order(order)
+
+            # 6. Nettoyage final
             cart.items.all().delete()
             
             # Message de succès et redirection
             messages.success(request, "Votre commande a été validée avec succès !")
+            prefetch_related_objects([order], INVOICE_ITEMS)
             return render(request, 'core/Thank_You.html', {'order': order})
 
-        except ValueError as e:
+        except (ValueError, inventory.InsufficientStock) as e:
+            # Exception interceptée : sans set_rollback, l'atomic de la vue validerait une commande à moitié créée
+            transaction.set_rollback(True)
             messages.error(request, str(e))
             return redirect('checkout_view')
-        except Exception as e:
-            # Log l'erreur réelle en console pour le debug
-            print(f"Erreur Checkout: {e}") 
+        except Exception:
+            transaction.set_rollback(True)
+            # Trace complète dans les journaux ; le client ne voit qu'un message générique
+            logger.exception("Erreur au checkout (panier %s)", cart.id)
             messages.error(request, "Une erreur technique est survenue. Veuillez réessayer.")
             return redirect('checkout_view')
 
-    return render(request, 'core/Checkout.html', {'cart': cart})
+    return render(request, 'core/Checkout.html', {'cart': cart, 'zones': shipping.zone_names()})
+
+
+@login_required
+@query_budget(6)
+def shipping_quote_view(request):
+    """Devis de livraison du panier pour la ville saisie (mise à jour du récapitulatif au checkout)"""
+    cart = Cart.objects.prefetch_related(
+        Prefetch('items', queryset=CartItem.objects.select_related('product', 'variant'))
+    ).filter(user=request.user).first()
+    if cart is None:
+        return JsonResponse({'error': "Votre panier est vide."}, status=404)
+    pricing.apply([item.product for item in cart.items.all()])
+    city = request.GET.get('city', '')
+    quote = cart.shipping_quote(city)
+    return JsonResponse({
+        'zone': quote.zone.name if quote.zone else None,
+        'deliverable': quote.deliverable,
+        'undeliverable': [item.product.nom for item in cart.items.all() if item.product_id in quote.undeliverable],
+        'shipping_cost': str(quote.cost),
+        'delai_min': quote.delai_min,
+        'delai_max': quote.delai_max,
+        'total': str(cart.total_price + quote.cost),
+    })
 
 # --- Historique des Commandes ---
 
@@ -263,11 +500,20 @@ class OrderListView(LoginRequiredMixin, ListView):
     model = Order
     template_name = 'order/order_list.html' # Vérifiez que ce chemin existe
     context_object_name = 'orders'
+    query_budget = 10
 
     def get_queryset(self):
-        # On filtre pour que l'utilisateur ne voie que SES commandes
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        # On filtre pour que l'utilisateur ne voie que SES commandes (pagination par curseur)
+        orders, self.next_cursor = order_history.get_page(self.request.user, self.request.GET.get('before'))
+        return orders
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        context['is_first_page'] = not self.request.GET.get('before')
+        return context
     
+@query_budget(12)
 def delete_order(request, order_id):
     # On récupère la commande appartenant à l'utilisateur
     order = get_object_or_404(Order, id=order_id, user=request.user)
@@ -276,6 +522,9 @@ def delete_order(request, order_id):
     if order.is_paid:
         messages.error(request, "Impossible de supprimer une commande déjà payée.")
     else:
+        # Une commande annulée a déjà été retirée du classement (signals.update_bestsellers_on_cancel)
+        if order.status != 'CANCELLED':
+            bestsellers.revert_orders([order.id])
         order.delete()
         messages.success(request, "La commande a été supprimée avec succès.")
             
@@ -283,9 +532,13 @@ def delete_order(request, order_id):
     
 # --- PDF & Historique ---
 @login_required
+@query_budget(6)
 def order_pdf_download(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    html_string = render_to_string('admin/shop/order/invoice.html', {'order': order})
+    # WeasyPrint (+ tinycss2, fonttools, pydyf) n'est chargé qu'au premier PDF, pas au démarrage des workers
+    from weasyprint import HTML
+
+    order = order_archive.get_order_or_404(id=order_id, user=request.user)
+    html_string = get_invoice_html(order)
     html = HTML(string=html_string, base_url=request.build_absolute_uri())
     
     response = HttpResponse(html.write_pdf(), content_type='application/pdf')
@@ -293,6 +546,83 @@ def order_pdf_download(request, order_id):
     return response
 
 @staff_member_required
+@query_budget(6)
 def order_invoice_admin(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    return render(request, 'admin/shop/order/invoice.html', {'order': order})
\ No newline at end of file
+    order = order_archive.get_order_or_404(id=order_id)
+    return HttpResponse(get_invoice_html(order))
+
+@staff_member_required
+@query_budget(5)
+def order_lookup(request):
+    """Recherche de commandes pour le support (JSON)"""
+    orders = lookup_orders(request.GET.get('q'))[:20]
+    return JsonResponse({'results': [
+        {
+            'reference': order.reference,
+            'full_name': order.full_name,
+            'email': order.email,
+            'phone': order.phone,
+            'status': order.status,
+            'total_amount': str(order.total_amount),
+            'created_at': order.created_at.isoformat(),
+            'admin_url': reverse('admin:shop_order_change', args=[order.id]),
+        }
+        for order in orders.only('id', 'reference', 'full_name', 'email', 'phone', 'status', 'total_amount', 'created_at')
+    ]})
+
+
+@staff_member_required
+async def live_dashboard_events(request):
+    """Flux SSE du tableau de bord admin (servi par config/asgi.py)"""
+    response = StreamingHttpResponse(live.event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required
+@never_cache
+def profile_list(request):
+    """Traces de profilage enregistrées (shop/profiling.py), les plus récentes d'abord"""
+    return render(request, 'admin/shop/profiles/list.html', {
+        **admin.site.each_context(request),
+        'title': "Profils de requêtes",
+        'traces': profiling.recent(),
+        'sample_every': getattr(settings, 'SHOP_PROFILING_SAMPLE_EVERY', 0),
+        'max_traces': getattr(settings, 'SHOP_PROFILING_MAX_TRACES', 200),
+    })
+
+
+@staff_member_required
+@never_cache
+def profile_detail(request, trace_id):
+    trace = profiling.load(trace_id)
+    if trace is None:
+        raise Http404("Trace introuvable (écrasée ou jamais enregistrée).")
+    return render(request, 'admin/shop/profiles/detail.html', {
+        **admin.site.each_context(request),
+        'title': f"Profil : {trace['method']} {trace['path']}",
+        'trace': trace,
+        'slowest_queries': sorted(trace['sql']['queries'], key=lambda query: query['ms'], reverse=True)[:10],
+    })
+
+
+@staff_member_required
+def profile_download(request, trace_id):
+    """Profil cProfile brut (pstats, snakeviz...)"""
+    path = profiling.profile_path(trace_id)
+    if path is None:
+        raise Http404("Trace introuvable.")
+    return FileResponse(path.open('rb'), as_attachment=True, filename=f'profil-{trace_id}.prof')
+
+
+@query_budget(3)
+def metrics_view(request):
+    """Métriques au format Prometheus : réservé au staff ou au scraper muni du jeton"""
+    token = getattr(settings, 'SHOP_METRICS_TOKEN', None)
+    authorized = request.user.is_staff or (
+        token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    )
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
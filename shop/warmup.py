@@ -0,0 +1,75 @@
+"""
+Préchauffage d'un processus serveur avant qu'il ne reçoive du trafic.
+
+Avec gunicorn en mode preload (voir gunicorn.conf.py), warm() tourne une
+seule fois dans le maître : URLconf résolue, vues importées, templates
+compilés dans le cache du loader, modules SHOP_PRELOAD_MODULES chargés.
+Les workers forkés partagent ensuite ces pages mémoire copy-on-write ;
+gc.freeze() évite que le ramasse-miettes ne les réécrive (et ne les
+duplique) à sa première passe dans chaque worker.
+
+Aucune requête SQL dans warm() : une connexion ouverte dans le maître serait
+partagée par tous les workers après le fork. Les données en mémoire propres
+à chaque processus (index des suggestions) sont chargées par warm_data(),
+appelée dans le worker.
+"""
+import gc
+import importlib
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+logger = logging.getLogger('shop.warmup')
+
+
+def _template_names():
+    for directory in settings.TEMPLATES[0]['DIRS']:
+        root = Path(directory)
+        for path in sorted(root.rglob('*.html')):
+            yield path.relative_to(root).as_posix()
+
+
+def warm_templates():
+    count = 0
+    for name in _template_names():
+        try:
+            get_template(name)
+        except (TemplateDoesNotExist, TemplateSyntaxError) as exc:
+            logger.warning("Template non préchargé %s : %s", name, exc)
+        else:
+            count += 1
+    return count
+
+
+def warm(freeze=False):
+    """Charge tout ce qu'une première requête chargerait ; retourne la durée en ms"""
+    start = time.perf_counter()
+    # Importe toutes les vues (et leurs dépendances) via l'URLconf
+    get_resolver().url_patterns
+    templates = warm_templates()
+    for module in getattr(settings, 'SHOP_PRELOAD_MODULES', []):
+        importlib.import_module(module)
+    connections.close_all()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    elapsed = (time.perf_counter() - start) * 1000
+    logger.info("Préchauffage : %d templates en %.0f ms", templates, elapsed)
+    return elapsed
+
+
+def warm_data():
+    """Construit dans le worker les index en mémoire lus par les requêtes ; retourne la durée en ms"""
+    from . import autocomplete
+
+    start = time.perf_counter()
+    autocomplete.current_index()
+    elapsed = (time.perf_counter() - start) * 1000
+    logger.info("Index des suggestions construit en %.0f ms", elapsed)
+    return elapsed
@@ -3,7 +3,9 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
 from .forms import RegisterForm
 from django.contrib.auth.forms import AuthenticationForm
+from shop.query_budget import query_budget
 
+@query_budget(12)
 def register_view(request):
     # Sécurité : Si l'utilisateur est déjà connecté, on le redirige vers l'accueil
     if request.user.is_authenticated:
@@ -25,6 +27,7 @@ def register_view(request):
         
     return render(request, "user/register.html", {"form": form})
 
+@query_budget(5)
 def logout_view(request):
     # Il est recommandé de vérifier si la méthode est POST pour la déconnexion (sécurité)
     # Mais pour une implémentation simple via un lien <a>, on garde ceci :
@@ -33,6 +36,7 @@ def logout_view(request):
     return redirect("product_list")
 
 
+@query_budget(10)
 def login_view(request):
     if request.user.is_authenticated:
         return redirect("product_list")